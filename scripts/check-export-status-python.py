@@ -1,11 +1,20 @@
 #!/usr/bin/env python3
-"""Check status of all DynamoDB exports"""
+"""Check status of all DynamoDB exports
 
-import boto3
+--watch keeps polling until every export has finished, with an ETA per table.
+"""
+
+import argparse
 import sys
 from datetime import datetime
 
-dynamodb = boto3.client('dynamodb', region_name='us-east-1')
+from dynamodb_job_watch import ExportStatusSource, add_watch_arguments, poll_client, watch
+
+parser = argparse.ArgumentParser(description='Status of the DynamoDB exports in export-arns-python.txt')
+add_watch_arguments(parser)
+args = parser.parse_args()
+
+dynamodb = poll_client('us-east-1', args.workers)
 
 # Read export ARNs
 try:
@@ -15,6 +24,9 @@ except FileNotFoundError:
     print("Error: No export-arns-python.txt found")
     sys.exit(1)
 
+if args.watch:
+    sys.exit(watch(ExportStatusSource(dynamodb), exports, args))
+
 print("=" * 50)
 print("DynamoDB Export Status Check")
 print("=" * 50)
@@ -66,7 +78,7 @@ if completed == total:
     print("Next step: Review tables without PITR and handle separately")
 elif in_progress > 0:
     print("⏳ Still processing... Check back in a few minutes.")
-    print(f"   Run: python3 {sys.argv[0]}")
+    print(f"   Run: python3 {sys.argv[0]} --watch")
 elif failed > 0:
     print("⚠️  Some exports failed. Review errors above.")
 
@@ -1,11 +1,29 @@
 #!/usr/bin/env python3
-"""Check status of import-table operations in us-east-2"""
+"""Check status of import-table operations in us-east-2
 
+--watch keeps polling until every import has finished, with an ETA per table.
+"""
+
+import argparse
 import boto3
 import sys
 
+from dynamodb_job_watch import (
+    ImportStatusSource,
+    JobWatcher,
+    add_watch_arguments,
+    format_duration,
+    poll_client,
+    watch,
+)
+
+parser = argparse.ArgumentParser(description='Status of the DynamoDB imports in import-arns-correct.txt')
+add_watch_arguments(parser)
+args = parser.parse_args()
+
 # ONLY us-east-2
-dynamodb = boto3.client('dynamodb', region_name='us-east-2')
+dynamodb = poll_client('us-east-2', args.workers)
+source = ImportStatusSource(dynamodb, boto3.client('s3', region_name='us-east-2'))
 
 # Read import ARNs
 try:
@@ -15,6 +33,9 @@ except FileNotFoundError:
     print("Error: import-arns-correct.txt not found")
     sys.exit(1)
 
+if args.watch:
+    sys.exit(watch(source, imports, args))
+
 print("=" * 75)
 print("DynamoDB Import Status - us-east-2")
 print("(us-east-1 is READ ONLY and untouched)")
@@ -25,41 +46,36 @@ completed = 0
 in_progress = 0
 failed = 0
 
+# Every ARN is described at once; ETAs come from each import's rate since it started
+watcher = JobWatcher(source, imports, args.workers)
+watcher.poll()
+
 for import_arn, table_name in imports:
-    try:
-        response = dynamodb.describe_import(ImportArn=import_arn)
-        import_desc = response['ImportTableDescription']
-        
-        status = import_desc['ImportStatus']
-        
-        if status == 'COMPLETED':
-            imported_items = import_desc.get('ImportedItemCount', 0)
-            processed_bytes = import_desc.get('ProcessedSizeBytes', 0)
-            processed_mb = processed_bytes / (1024 * 1024)
-            
-            print(f"✅ {table_name}")
-            print(f"   {imported_items:,} items | {processed_mb:.2f} MB")
-            completed += 1
-        elif status == 'IN_PROGRESS':
-            processed_items = import_desc.get('ProcessedItemCount', 0)
-            print(f"⏳ {table_name}: IN_PROGRESS", end="")
-            if processed_items > 0:
-                print(f" ({processed_items:,} items so far)")
-            else:
-                print()
-            in_progress += 1
-        elif status == 'FAILED':
-            failure_code = import_desc.get('FailureCode', 'UNKNOWN')
-            failure_msg = import_desc.get('FailureMessage', '')
-            print(f"❌ {table_name}: FAILED")
-            print(f"   {failure_code}: {failure_msg[:60]}")
-            failed += 1
+    state = watcher.states[import_arn]
+    status = state['status']
+
+    if status == 'COMPLETED':
+        processed_mb = state['bytes'] / (1024 * 1024)
+
+        print(f"✅ {table_name}")
+        print(f"   {state['items']:,} items | {processed_mb:.2f} MB")
+        completed += 1
+    elif status == 'IN_PROGRESS':
+        print(f"⏳ {table_name}: IN_PROGRESS", end="")
+        if state['items'] > 0:
+            print(f" ({state['items']:,} items so far, ETA {format_duration(watcher.eta_of(import_arn))})")
         else:
-            print(f"⚠️  {table_name}: {status}")
-        
-    except Exception as e:
-        print(f"❌ {table_name}: Error - {str(e)[:60]}")
+            print()
+        in_progress += 1
+    elif status == 'FAILED':
+        print(f"❌ {table_name}: FAILED")
+        print(f"   {state['failure'][:60]}")
+        failed += 1
+    elif status in ('ERROR', 'POLL_ERROR'):
+        print(f"❌ {table_name}: Error - {state['failure'][:60]}")
         failed += 1
+    else:
+        print(f"⚠️  {table_name}: {status}")
 
 total = len(imports)
 print()
@@ -79,9 +95,8 @@ if completed == total:
     print("\nNext: Validate data integrity")
 elif in_progress > 0:
     print("⏳ Still importing...")
-    est_remaining = in_progress * 2  # ~2 min per table average
-    print(f"   Estimated time remaining: {est_remaining} minutes")
-    print(f"\n   Run again: python3 check-import-status-correct.py")
+    print(f"   Estimated time remaining: {format_duration(watcher.overall_eta())}")
+    print(f"\n   Follow it: python3 check-import-status-correct.py --watch")
 elif failed > 0:
     print("⚠️  Some imports failed - review errors above")
 
@@ -1,12 +1,23 @@
 #!/usr/bin/env python3
-"""Check status of all DynamoDB imports"""
+"""Check status of all DynamoDB imports
 
+--watch keeps polling until every import has finished, with an ETA per table.
+"""
+
+import argparse
 import boto3
 import sys
 import os
 
+from dynamodb_job_watch import ImportStatusSource, add_watch_arguments, poll_client, watch
+
 TARGET_REGION = 'us-east-2'
-dynamodb = boto3.client('dynamodb', region_name=TARGET_REGION)
+
+parser = argparse.ArgumentParser(description='Status of the DynamoDB imports in import-arns.txt')
+add_watch_arguments(parser)
+args = parser.parse_args()
+
+dynamodb = poll_client(TARGET_REGION, args.workers)
 
 # Read import ARNs
 if not os.path.exists('import-arns.txt'):
@@ -16,6 +27,9 @@ if not os.path.exists('import-arns.txt'):
 with open('import-arns.txt', 'r') as f:
     imports = [line.strip().split('|') for line in f if line.strip()]
 
+if args.watch:
+    sys.exit(watch(ImportStatusSource(dynamodb, boto3.client('s3', region_name=TARGET_REGION)), imports, args))
+
 print("=" * 60)
 print("DynamoDB Import Status Check (us-east-2)")
 print("=" * 60)
@@ -76,7 +90,7 @@ if completed == total:
     print("Next: Validate data and test endpoints")
 elif in_progress > 0:
     print("⏳ Still processing... Check back in a few minutes.")
-    print(f"   Run: python3 {os.path.basename(__file__)}")
+    print(f"   Run: python3 {os.path.basename(__file__)} --watch")
 elif failed > 0:
     print("⚠️  Some imports failed. Review errors above.")
 
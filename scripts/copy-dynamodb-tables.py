@@ -3,12 +3,15 @@
 DynamoDB Table Data Copy Script
 
 Copies data from -dev tables to -jpl and -din tables in us-east-2 region.
-Supports resumption from checkpoint if interrupted.
+Supports resumption from checkpoint if interrupted, down to the last
+written scan page of every segment.
 """
 
 import boto3
 import json
+import os
 import sys
+import threading
 import time
 from datetime import datetime
 from decimal import Decimal
@@ -16,6 +19,27 @@ from typing import Dict, List, Set
 import argparse
 from pathlib import Path
 
+from dynamodb_copy_engine import (
+    DEFAULT_MAX_SEGMENTS,
+    DEFAULT_QUEUE_DEPTH,
+    ParallelTableCopy,
+    TableCopyScheduler,
+    ThrottledBatchWriter,
+    decode_key,
+    describe_stages,
+    encode_key,
+    get_table_size_bytes,
+    resolve_segment_count,
+)
+from dynamodb_copy_metrics import DEFAULT_METRICS_INTERVAL_SECONDS, CopyMetrics, MetricsReporter
+from dynamodb_count_history import DEFAULT_MAX_SIZE_AGE_SECONDS, TableCountHistory
+from dynamodb_delta_sync import DeltaSync
+from dynamodb_retry import DEFAULT_MAX_ATTEMPTS, DeadLetterFile, RetryPolicy
+from dynamodb_throttle import DEFAULT_INITIAL_WRITE_RATE, AdaptiveRateController
+
+# Minimum seconds between checkpoint writes while a table is copying
+CHECKPOINT_INTERVAL_SECONDS = 5
+
 # Color codes for terminal output
 class Colors:
     HEADER = '\033[95m'
@@ -36,11 +60,36 @@ class DecimalEncoder(json.JSONEncoder):
         return super(DecimalEncoder, self).default(obj)
 
 class DynamoDBTableCopier:
-    def __init__(self, region='us-east-2', log_dir='./dynamodb-copy-logs'):
+    def __init__(self, region='us-east-2', log_dir='./dynamodb-copy-logs',
+                 segments=1, auto_segments=False, max_segments=DEFAULT_MAX_SEGMENTS,
+                 fan_out=False, queue_depth=DEFAULT_QUEUE_DEPTH,
+                 table_concurrency=1, max_total_segments=DEFAULT_MAX_SEGMENTS,
+                 max_rcu=None, max_wcu=None, raw=False,
+                 writers_per_target=1, max_buffer_mb=None,
+                 delta_sync=False, delete_missing=False, digest_dir=None,
+                 metrics_interval=DEFAULT_METRICS_INTERVAL_SECONDS, prometheus_file=None,
+                 max_attempts=DEFAULT_MAX_ATTEMPTS, size_history=None):
         self.region = region
+        self.segments = segments
+        self.auto_segments = auto_segments
+        self.max_segments = max_segments
+        self.fan_out = fan_out
+        self.queue_depth = queue_depth
+        self.table_concurrency = table_concurrency
+        self.max_total_segments = max_total_segments
+        self.max_rcu = max_rcu
+        self.max_wcu = max_wcu
+        self.raw = raw
+        self.writers_per_target = writers_per_target
+        self.max_buffer_mb = max_buffer_mb
+        self.delta_sync = delta_sync
+        self.delete_missing = delete_missing
         self.dynamodb = boto3.resource('dynamodb', region_name=region)
         self.dynamodb_client = boto3.client('dynamodb', region_name=region)
         
+        # Recorded table sizes from get-all-table-counts.py, read instead of describe_table
+        self.size_history = size_history
+        
         # Create log directory
         self.log_dir = Path(log_dir)
         self.log_dir.mkdir(exist_ok=True)
@@ -50,6 +99,27 @@ class DynamoDBTableCopier:
         self.log_file = self.log_dir / f'copy_log_{timestamp}.jsonl'
         self.checkpoint_file = self.log_dir / 'checkpoint.json'
         self.summary_file = self.log_dir / f'summary_{timestamp}.json'
+        self.digest_dir = Path(digest_dir) if digest_dir else self.log_dir / 'digests'
+        self.prometheus_file = Path(prometheus_file) if prometheus_file else self.log_dir / 'copy_metrics.prom'
+        
+        # Items that still fail after retries, for replay-dead-letters.py
+        self.retry_policy = RetryPolicy(max_attempts=max_attempts)
+        self.dead_letter = DeadLetterFile(self.log_dir / f'dead_letter_{timestamp}.jsonl')
+        
+        # Throughput, capacity and latency of every scan and batch write in the run
+        self.metrics = CopyMetrics()
+        self.metrics_interval = metrics_interval
+        self.metrics_reporter = None
+        
+        # Scan segments and concurrent tables log and update stats from worker threads
+        self.log_lock = threading.Lock()
+        self.state_lock = threading.RLock()
+        self.active_copies = set()
+        
+        # Per-segment scan positions of unfinished copies: {source: {target: {...}}}
+        self.in_progress = {}
+        self.checkpoint_tables = []
+        self.last_checkpoint_time = 0.0
         
         # Statistics
         self.stats = {
@@ -75,28 +145,56 @@ class DynamoDBTableCopier:
             'data': data or {}
         }
         
-        with open(self.log_file, 'a') as f:
-            f.write(json.dumps(log_entry, cls=DecimalEncoder) + '\n')
+        with self.log_lock:
+            with open(self.log_file, 'a') as f:
+                f.write(json.dumps(log_entry, cls=DecimalEncoder) + '\n')
 
-    def save_checkpoint(self, completed_tables: List[str]):
-        """Save checkpoint of completed tables"""
-        checkpoint = {
-            'timestamp': datetime.now().isoformat(),
-            'completed_tables': completed_tables
-        }
-        
-        with open(self.checkpoint_file, 'w') as f:
-            json.dump(checkpoint, f, indent=2)
-        
-        self.log_event('checkpoint', 'Checkpoint saved', checkpoint)
+    def save_checkpoint(self, completed_tables: List[str], finished: bool = False):
+        """Save checkpoint of completed tables and in-flight segment positions
+
+        finished marks a run that went through every table; a delta sync
+        starts over from such a checkpoint instead of skipping its tables.
+        """
+        with self.state_lock:
+            self.checkpoint_tables = list(completed_tables)
+            checkpoint = {
+                'timestamp': datetime.now().isoformat(),
+                'completed_tables': self.checkpoint_tables,
+                'in_progress': self.in_progress,
+                'finished': finished
+            }
+            self.write_json_atomic(self.checkpoint_file, checkpoint)
+            self.last_checkpoint_time = time.monotonic()
+        
+        self.log_event('checkpoint', 'Checkpoint saved', {
+            'completed_tables': checkpoint['completed_tables'],
+            'in_progress_tables': sorted(checkpoint['in_progress'])
+        })
+
+    def write_json_atomic(self, path: Path, data: Dict):
+        """Write JSON via a temp file so readers never see a partial file"""
+        tmp_path = path.with_name(path.name + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, indent=2, cls=DecimalEncoder)
+        os.replace(tmp_path, path)
 
     def load_checkpoint(self) -> Set[str]:
         """Load checkpoint of completed tables"""
         if self.checkpoint_file.exists():
             with open(self.checkpoint_file, 'r') as f:
                 checkpoint = json.load(f)
+                if self.delta_sync and checkpoint.get('finished'):
+                    # A refresh brings every table up to date again
+                    print(f"{Colors.OKCYAN}Previous run finished; delta sync refreshes every table{Colors.ENDC}\n")
+                    return set()
                 completed = set(checkpoint.get('completed_tables', []))
-                print(f"{Colors.WARNING}Resuming from checkpoint: {len(completed)} tables already completed{Colors.ENDC}\n")
+                self.in_progress = checkpoint.get('in_progress', {})
+                self.checkpoint_tables = sorted(completed)
+                print(f"{Colors.WARNING}Resuming from checkpoint: {len(completed)} tables already completed{Colors.ENDC}")
+                if self.in_progress:
+                    print(f"{Colors.WARNING}Partially copied tables will resume mid-scan: "
+                          f"{', '.join(sorted(self.in_progress))}{Colors.ENDC}")
+                print()
                 return completed
         return set()
 
@@ -124,6 +222,19 @@ class DynamoDBTableCopier:
             self.log_event('error', f'Failed to get item count for {table_name}', {'error': str(e)})
             return 0
 
+    def get_table_size_bytes(self, table_name: str) -> int:
+        """Get approximate table size in bytes"""
+        try:
+            return get_table_size_bytes(self.dynamodb_client, table_name, self.size_history)
+        except Exception as e:
+            self.log_event('error', f'Failed to get table size for {table_name}', {'error': str(e)})
+            return 0
+
+    def get_key_names(self, table_name: str) -> List[str]:
+        """Get primary key attribute names of a table"""
+        response = self.dynamodb_client.describe_table(TableName=table_name)
+        return [k['AttributeName'] for k in response['Table']['KeySchema']]
+
     def get_target_tables(self, source_table: str) -> List[str]:
         """Get target table names (-jpl and -din) for a given source table"""
         base_name = source_table[:-4]  # Remove '-dev'
@@ -140,85 +251,253 @@ class DynamoDBTableCopier:
             self.log_event('error', f'Error checking table existence: {table_name}', {'error': str(e)})
             return False
 
-    def copy_table_data(self, source_table: str, target_table: str) -> Dict:
+    def copy_table_data(self, source_table: str, target_table: str, total_segments: int = None) -> Dict:
         """Copy data from source table to target table"""
-        print(f"{Colors.OKBLUE}  → Copying {source_table} to {target_table}...{Colors.ENDC}")
-        
-        result = {
-            'source': source_table,
-            'target': target_table,
-            'items_copied': 0,
-            'items_failed': 0,
-            'success': True,
-            'error': None
+        return self.copy_table_fanout(source_table, [target_table], total_segments)[0]
+
+    def copy_table_fanout(self, source_table: str, target_tables: List[str],
+                          total_segments: int = None) -> List[Dict]:
+        """Scan source table once and copy every page to all target tables"""
+        for target_table in target_tables:
+            print(f"{Colors.OKBLUE}  → Copying {source_table} to {target_table}...{Colors.ENDC}")
+        
+        results = {
+            target_table: {
+                'source': source_table,
+                'target': target_table,
+                'items_copied': 0,
+                'items_failed': 0,
+                'success': True,
+                'error': None
+            }
+            for target_table in target_tables
         }
         
         try:
-            source = self.dynamodb.Table(source_table)
-            target = self.dynamodb.Table(target_table)
+            if total_segments is None:
+                total_segments = self.resolve_segments(source_table)
+            # Segments scanned at once; the scheduler's grant when running tables concurrently
+            workers = total_segments
             
-            # Scan source table
-            scan_kwargs = {}
-            items_in_batch = 0
-            batch_number = 0
+            # Resume segment positions saved by an interrupted run
+            with self.state_lock:
+                saved = self.in_progress.get(source_table, {})
+                resumable = {t: saved[t] for t in target_tables if t in saved}
+            if resumable:
+                # Segment keys are only valid for the segment count they were taken with
+                total_segments = next(iter(resumable.values()))['total_segments']
+                resume_state = {
+                    t: entry['segments'] for t, entry in resumable.items()
+                    if entry['total_segments'] == total_segments
+                }
+                print(f"{Colors.WARNING}    Resuming {', '.join(sorted(resume_state))} from checkpoint "
+                      f"({total_segments} segments){Colors.ENDC}")
+            else:
+                resume_state = {}
             
-            while True:
-                response = source.scan(**scan_kwargs)
-                items = response.get('Items', [])
-                
-                if not items:
-                    break
-                
-                batch_number += 1
-                items_in_batch = len(items)
-                
-                # Batch write to target table
-                with target.batch_writer() as batch:
-                    for item in items:
-                        try:
-                            batch.put_item(Item=item)
-                            result['items_copied'] += 1
-                        except Exception as e:
-                            result['items_failed'] += 1
-                            self.log_event('item_error', f'Failed to copy item', {
-                                'source': source_table,
-                                'target': target_table,
-                                'error': str(e),
-                                'item': json.dumps(item, cls=DecimalEncoder)[:200]  # First 200 chars
-                            })
-                
+            if total_segments > workers:
+                print(f"{Colors.OKCYAN}    Parallel scan: {total_segments} segments, {workers} at a time{Colors.ENDC}")
+            elif total_segments > 1:
+                print(f"{Colors.OKCYAN}    Parallel scan: {total_segments} segments{Colors.ENDC}")
+            
+            delta = None
+            if self.delta_sync:
+                delta = DeltaSync(self.digest_dir, target_tables, self.get_key_names(source_table), raw=self.raw)
+                print(f"{Colors.OKCYAN}    Delta sync: writing only new or changed items{Colors.ENDC}")
+            
+            def on_page(progress):
                 # Progress update
-                print(f"{Colors.OKCYAN}    Batch {batch_number}: Copied {items_in_batch} items "
-                      f"(Total: {result['items_copied']}, Failed: {result['items_failed']}){Colors.ENDC}")
-                
-                # Check if there are more items to scan
-                if 'LastEvaluatedKey' not in response:
-                    break
-                
-                scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
-                
-                # Small delay to avoid throttling
-                time.sleep(0.1)
+                labels = []
+                if len(target_tables) > 1 or self.table_concurrency > 1:
+                    labels.append(progress['target'])
+                if progress['total_segments'] > 1:
+                    labels.append(f"segment {progress['segment']}/{progress['total_segments']}")
+                label = f" [{', '.join(labels)}]" if labels else ''
+                print(f"{Colors.OKCYAN}    Batch {progress['pages']}{label}: Copied {progress['page_items']} items "
+                      f"(Total: {progress['items_copied']}, Failed: {progress['items_failed']}){Colors.ENDC}")
             
-            if result['items_failed'] > 0:
-                result['success'] = False
-                print(f"{Colors.WARNING}    ⚠ Completed with {result['items_failed']} failed items{Colors.ENDC}")
-            else:
-                print(f"{Colors.OKGREEN}    ✓ Successfully copied {result['items_copied']} items{Colors.ENDC}")
+            def on_item_error(target_table, item, error):
+                # The full item is in the dead-letter file
+                self.log_event('item_error', f'Failed to copy item', {
+                    'source': source_table,
+                    'target': target_table,
+                    'error': str(error),
+                    'item': json.dumps(item, cls=DecimalEncoder)[:200],  # First 200 chars
+                    'dead_letter_file': str(self.dead_letter.path)
+                })
             
+            copy = ParallelTableCopy(
+                self.region, source_table, target_tables,
+                total_segments=total_segments,
+                on_page=on_page,
+                on_item_error=on_item_error,
+                queue_depth=self.queue_depth,
+                max_read_units=self.max_rcu,
+                max_write_units=self.max_wcu,
+                resume_state=resume_state,
+                on_progress=lambda progress: self.record_segment_progress(
+                    source_table, total_segments, progress),
+                raw=self.raw,
+                writers_per_target=self.writers_per_target,
+                max_buffer_mb=self.max_buffer_mb,
+                write_filter=delta,
+                metrics=self.metrics,
+                retry_policy=self.retry_policy,
+                dead_letter=self.dead_letter,
+                max_workers=workers
+            )
+            with self.state_lock:
+                self.active_copies.add(copy)
+            try:
+                copy_result = copy.run()
+                if delta:
+                    self.finish_delta_sync(delta, copy_result, results)
+            finally:
+                with self.state_lock:
+                    self.active_copies.discard(copy)
+                if delta:
+                    delta.close()
         except Exception as e:
-            result['success'] = False
-            result['error'] = str(e)
+            # Nothing was copied to any target
             print(f"{Colors.FAIL}    ✗ Error: {str(e)}{Colors.ENDC}")
-            self.log_event('table_error', f'Failed to copy table', {
-                'source': source_table,
-                'target': target_table,
-                'error': str(e)
-            })
+            for result in results.values():
+                result['success'] = False
+                result['error'] = str(e)
+                self.log_event('table_error', f'Failed to copy table', {
+                    'source': source_table,
+                    'target': result['target'],
+                    'error': str(e)
+                })
+            return list(results.values())
+        
+        # Finished targets no longer need their segment positions
+        with self.state_lock:
+            saved = self.in_progress.get(source_table, {})
+            for target_table, target_result in copy_result['targets'].items():
+                if target_result['complete'] and not target_result['error']:
+                    saved.pop(target_table, None)
+            if not saved:
+                self.in_progress.pop(source_table, None)
+        
+        # Where the pipeline spent its time
+        print(f"{Colors.OKCYAN}    Pipeline bottleneck: {copy_result['bottleneck']}{Colors.ENDC}")
+        for line in describe_stages(copy_result['stages']):
+            print(f"{Colors.OKCYAN}      {line}{Colors.ENDC}")
+        
+        # Per-target accounting
+        for target_table, result in results.items():
+            target_result = copy_result['targets'][target_table]
+            result['items_copied'] = target_result['items_copied']
+            result['items_failed'] = target_result['items_failed']
+            result['total_segments'] = total_segments
+            result['read_capacity'] = copy_result['read_capacity']
+            result['write_capacity'] = copy_result['write_capacity'][target_table]
+            result['stages'] = copy_result['stages']
+            result['bottleneck'] = copy_result['bottleneck']
+            
+            if self.delta_sync:
+                result['items_unchanged'] = target_result['items_unchanged']
+            
+            if target_result['error']:
+                result['success'] = False
+                result['error'] = target_result['error']
+                print(f"{Colors.FAIL}    ✗ {target_table} error: {target_result['error']}{Colors.ENDC}")
+                self.log_event('table_error', f'Failed to copy table', {
+                    'source': source_table,
+                    'target': target_table,
+                    'error': target_result['error']
+                })
+            elif result['items_failed'] > 0:
+                result['success'] = False
+                print(f"{Colors.WARNING}    ⚠ {target_table}: Completed with {result['items_failed']} failed items{Colors.ENDC}")
+            elif result.get('deletes_failed'):
+                result['success'] = False
+                print(f"{Colors.WARNING}    ⚠ {target_table}: {result['items_copied']} new or changed, "
+                      f"{result['items_deleted']} deleted, {result['deletes_failed']} deletes failed{Colors.ENDC}")
+            elif self.delta_sync:
+                print(f"{Colors.OKGREEN}    ✓ {target_table}: {result['items_copied']} new or changed, "
+                      f"{result['items_unchanged']} unchanged, {result.get('items_deleted', 0)} deleted{Colors.ENDC}")
+            else:
+                print(f"{Colors.OKGREEN}    ✓ {target_table}: Successfully copied {result['items_copied']} items{Colors.ENDC}")
         
-        return result
+        return list(results.values())
 
-    def process_table(self, source_table: str) -> bool:
+    def finish_delta_sync(self, delta: DeltaSync, copy_result: Dict, results: Dict[str, Dict]):
+        """Close out the sync generation of every fully copied target"""
+        for target_table, target_result in copy_result['targets'].items():
+            if not target_result['complete'] or target_result['error']:
+                # Unseen keys are only meaningful after a complete scan
+                continue
+            
+            if self.delete_missing and target_result['items_failed']:
+                # Dead-lettered items kept the previous generation but still exist in the source
+                print(f"{Colors.WARNING}    ⚠ {target_table}: {target_result['items_failed']} items failed; "
+                      f"not deleting items missing from source this run{Colors.ENDC}")
+                self.log_event('delta_delete_skipped', 'Skipped deleting items missing from source', {
+                    'target': target_table,
+                    'items_failed': target_result['items_failed']
+                })
+            elif self.delete_missing:
+                stale_keys = delta.stale_keys(target_table)
+                failed = set()
+                if stale_keys:
+                    def on_failed(requests, error, target_table=target_table):
+                        # Failed keys stay in the index and are stale again next sync
+                        for request in requests:
+                            key = request['DeleteRequest']['Key']
+                            failed.add(json.dumps(encode_key(key, raw=True), sort_keys=True))
+                            self.dead_letter.add(target_table, key, error, raw=True, delete=True)
+                    
+                    controller = AdaptiveRateController(
+                        target_table, DEFAULT_INITIAL_WRITE_RATE, max_rate=self.max_wcu)
+                    with ThrottledBatchWriter(self.dynamodb_client, target_table, controller,
+                                              retry_policy=self.retry_policy, on_failed=on_failed) as batch:
+                        for key in stale_keys:
+                            batch.delete_item(Key=decode_key(key, raw=True))
+                    deleted = [key for key in stale_keys if json.dumps(key, sort_keys=True) not in failed]
+                    delta.forget(target_table, deleted)
+                    self.log_event('delta_delete', 'Deleted items missing from source', {
+                        'target': target_table,
+                        'items_deleted': len(deleted),
+                        'deletes_failed': len(failed)
+                    })
+                results[target_table]['items_deleted'] = len(stale_keys) - len(failed)
+                results[target_table]['deletes_failed'] = len(failed)
+            
+            delta.complete(target_table)
+
+    def record_segment_progress(self, source_table: str, total_segments: int, progress: Dict):
+        """Track flushed segment positions and checkpoint them periodically"""
+        with self.state_lock:
+            saved = self.in_progress.setdefault(source_table, {})
+            for target_table, segments in progress.items():
+                saved[target_table] = {
+                    'total_segments': total_segments,
+                    'segments': segments
+                }
+            
+            if time.monotonic() - self.last_checkpoint_time >= CHECKPOINT_INTERVAL_SECONDS:
+                self.save_checkpoint(self.checkpoint_tables)
+
+    def resolve_segments(self, source_table: str) -> int:
+        """Number of scan segments to use for a source table
+
+        A table saved mid-scan keeps the segment count of its checkpoint,
+        so the scheduler grants workers for exactly that.
+        """
+        with self.state_lock:
+            saved = self.in_progress.get(source_table, {})
+        if saved:
+            return next(iter(saved.values()))['total_segments']
+        return resolve_segment_count(
+            self.dynamodb_client, source_table,
+            segments=self.segments,
+            auto_segments=self.auto_segments,
+            max_segments=self.max_segments,
+            size_history=self.size_history
+        )
+
+    def process_table(self, source_table: str, total_segments: int = None) -> bool:
         """Process a single source table, copying to all target tables"""
         print(f"\n{Colors.HEADER}{Colors.BOLD}Processing: {source_table}{Colors.ENDC}")
         
@@ -248,19 +527,25 @@ class DynamoDBTableCopier:
             return False
         
         # Copy to each target table
+        if self.fan_out:
+            results = self.copy_table_fanout(source_table, existing_targets, total_segments)
+        else:
+            results = [self.copy_table_data(source_table, target, total_segments) for target in existing_targets]
+        
         all_success = True
-        for target in existing_targets:
-            result = self.copy_table_data(source_table, target)
+        for result in results:
+            target = result['target']
             
-            if result['success']:
-                self.stats['total_items_copied'] += result['items_copied']
-            else:
-                all_success = False
-                self.stats['failed_tables'].append({
-                    'source': source_table,
-                    'target': target,
-                    'error': result.get('error')
-                })
+            with self.state_lock:
+                if result['success']:
+                    self.stats['total_items_copied'] += result['items_copied']
+                else:
+                    all_success = False
+                    self.stats['failed_tables'].append({
+                        'source': source_table,
+                        'target': target,
+                        'error': result.get('error')
+                    })
             
             self.log_event('copy_complete', 'Table copy completed', result)
         
@@ -282,6 +567,12 @@ class DynamoDBTableCopier:
         completed_tables = self.load_checkpoint()
         remaining_tables = [t for t in dev_tables if t not in completed_tables]
         
+        # Concurrent runs start the largest tables first
+        table_sizes = {}
+        if self.table_concurrency > 1:
+            table_sizes = {t: self.get_table_size_bytes(t) for t in remaining_tables}
+            remaining_tables.sort(key=lambda t: table_sizes[t], reverse=True)
+        
         if dry_run:
             print(f"{Colors.WARNING}{Colors.BOLD}DRY RUN MODE - No data will be copied{Colors.ENDC}\n")
             print(f"Tables to process: {len(remaining_tables)}")
@@ -294,6 +585,15 @@ class DynamoDBTableCopier:
         print(f"{Colors.BOLD}Tables to process: {len(remaining_tables)}/{len(dev_tables)}{Colors.ENDC}")
         print(f"{Colors.BOLD}{'='*80}{Colors.ENDC}\n")
         
+        self.start_metrics()
+        
+        if self.table_concurrency > 1:
+            self.run_scheduled(remaining_tables, table_sizes, completed_tables)
+            self.save_checkpoint(sorted(completed_tables), finished=True)
+            self.print_summary()
+            self.save_summary()
+            return
+        
         # Process each table
         for idx, source_table in enumerate(remaining_tables, 1):
             print(f"{Colors.BOLD}[{idx}/{len(remaining_tables)}]{Colors.ENDC}", end=" ")
@@ -324,10 +624,66 @@ class DynamoDBTableCopier:
                 })
                 self.stats['tables_failed'] += 1
         
+        self.save_checkpoint(sorted(completed_tables), finished=True)
+        
         # Final summary
         self.print_summary()
         self.save_summary()
 
+    def run_scheduled(self, tables: List[str], table_sizes: Dict[str, int], completed_tables: Set[str]):
+        """Copy several tables at once, largest first, within the segment budget"""
+        print(f"{Colors.BOLD}Copying up to {self.table_concurrency} tables at once "
+              f"({self.max_total_segments} scan segments total){Colors.ENDC}\n")
+        
+        jobs = [(t, table_sizes.get(t, 0), self.resolve_segments(t)) for t in tables]
+        scheduler = TableCopyScheduler(self.table_concurrency, self.max_total_segments)
+        
+        def on_complete(source_table, success, error):
+            with self.state_lock:
+                if error is not None:
+                    print(f"{Colors.FAIL}Unexpected error: {str(error)}{Colors.ENDC}")
+                    self.log_event('fatal_error', 'Unexpected error', {
+                        'table': source_table,
+                        'error': str(error)
+                    })
+                    self.stats['tables_failed'] += 1
+                elif success:
+                    self.stats['tables_processed'] += 1
+                    self.stats['completed_tables'].append(source_table)
+                    completed_tables.add(source_table)
+                else:
+                    self.stats['tables_failed'] += 1
+                
+                # Save checkpoint after each table
+                self.save_checkpoint(sorted(completed_tables))
+        
+        try:
+            scheduler.run(jobs, self.process_table, on_complete)
+        except KeyboardInterrupt:
+            print(f"\n{Colors.WARNING}{Colors.BOLD}Interrupted by user{Colors.ENDC}")
+            with self.state_lock:
+                for copy in self.active_copies:
+                    copy.stop_event.set()
+                self.save_checkpoint(sorted(completed_tables))
+                self.save_summary()
+            sys.exit(1)
+
+    def start_metrics(self):
+        """Log metrics and refresh the Prometheus textfile every metrics_interval seconds"""
+        self.metrics_reporter = MetricsReporter(
+            self.metrics,
+            lambda snapshot: self.log_event('metrics', 'Copy throughput', snapshot),
+            prometheus_file=self.prometheus_file,
+            interval=self.metrics_interval
+        )
+        self.metrics_reporter.start()
+
+    def stop_metrics(self):
+        """Emit the final metrics and stop the reporter"""
+        if self.metrics_reporter:
+            self.metrics_reporter.stop()
+            self.metrics_reporter = None
+
     def print_summary(self):
         """Print final summary"""
         print(f"\n{Colors.HEADER}{Colors.BOLD}{'='*80}{Colors.ENDC}")
@@ -341,8 +697,14 @@ class DynamoDBTableCopier:
             print(f"{Colors.FAIL}✗ Tables with failures: {self.stats['tables_failed']}{Colors.ENDC}")
             print(f"{Colors.WARNING}Check log file for details: {self.log_file}{Colors.ENDC}")
         
+        if self.dead_letter.count:
+            print(f"{Colors.FAIL}✗ Items that failed after {self.retry_policy.max_attempts} attempts: "
+                  f"{self.dead_letter.count}{Colors.ENDC}")
+            print(f"{Colors.WARNING}Re-drive them with: ./replay-dead-letters.py {self.dead_letter.path}{Colors.ENDC}")
+        
         print(f"\n{Colors.OKCYAN}Summary saved to: {self.summary_file}{Colors.ENDC}")
         print(f"{Colors.OKCYAN}Detailed log: {self.log_file}{Colors.ENDC}")
+        print(f"{Colors.OKCYAN}Prometheus metrics: {self.prometheus_file}{Colors.ENDC}")
         
         if self.checkpoint_file.exists():
             print(f"{Colors.OKCYAN}Checkpoint file: {self.checkpoint_file}{Colors.ENDC}")
@@ -358,8 +720,16 @@ class DynamoDBTableCopier:
         self.stats['duration_seconds'] = duration
         self.stats['duration_human'] = f"{int(duration // 60)}m {int(duration % 60)}s"
         
-        with open(self.summary_file, 'w') as f:
-            json.dump(self.stats, f, indent=2, cls=DecimalEncoder)
+        self.stop_metrics()
+        self.stats['metrics'] = self.metrics.snapshot()
+        
+        self.dead_letter.close()
+        self.stats['dead_letter_items'] = self.dead_letter.count
+        if self.dead_letter.count:
+            self.stats['dead_letter_file'] = str(self.dead_letter.path)
+        
+        with self.state_lock:
+            self.write_json_atomic(self.summary_file, self.stats)
 
 def main():
     parser = argparse.ArgumentParser(
@@ -378,6 +748,39 @@ Examples:
   
   # Use custom log directory
   ./copy-dynamodb-tables.py --log-dir /path/to/logs
+  
+  # Parallel scan with 8 segments per table
+  ./copy-dynamodb-tables.py --segments 8
+  
+  # Size segments from TableSizeBytes (capped by --max-segments)
+  ./copy-dynamodb-tables.py --auto-segments
+  
+  # Scan each source once and write -jpl and -din concurrently
+  ./copy-dynamodb-tables.py --fan-out --auto-segments
+  
+  # Copy 4 tables at once, largest first, with at most 32 scan segments in flight
+  ./copy-dynamodb-tables.py --fan-out --auto-segments --table-concurrency 4 --max-total-segments 32
+  
+  # Never read more than 500 RCU/s or write more than 200 WCU/s per table
+  ./copy-dynamodb-tables.py --max-rcu 500 --max-wcu 200
+  
+  # Copy wire-format items with the low-level client (no Decimal round trip)
+  ./copy-dynamodb-tables.py --raw --fan-out --auto-segments
+  
+  # Two writers per target and segment, at most 256 MB of scanned pages in memory
+  ./copy-dynamodb-tables.py --fan-out --writers-per-target 2 --max-buffer-mb 256
+  
+  # Refresh -jpl/-din: write only changed items and delete ones gone from -dev
+  ./copy-dynamodb-tables.py --fan-out --delta-sync --delete-missing
+  
+  # Give up on an item after 12 attempts instead of 8 (failures go to dead_letter_*.jsonl)
+  ./copy-dynamodb-tables.py --max-attempts 12
+  
+  # Log throughput every 10s and write metrics for node_exporter's textfile collector
+  ./copy-dynamodb-tables.py --metrics-interval 10 --prometheus-file /var/lib/node_exporter/dynamodb_copy.prom
+
+  # Plan segments from the sizes the last ./get-all-table-counts.py run recorded
+  ./copy-dynamodb-tables.py --auto-segments --table-concurrency 4 --size-history table-counts-history.sqlite
         """
     )
     
@@ -399,10 +802,161 @@ Examples:
         help='AWS region (default: us-east-2)'
     )
     
+    parser.add_argument(
+        '--segments',
+        type=int,
+        default=1,
+        help='Number of parallel scan segments per table (default: 1)'
+    )
+    
+    parser.add_argument(
+        '--auto-segments',
+        action='store_true',
+        help='Pick the segment count from each table\'s TableSizeBytes'
+    )
+    
+    parser.add_argument(
+        '--max-segments',
+        type=int,
+        default=DEFAULT_MAX_SEGMENTS,
+        help=f'Upper bound on scan segments per table (default: {DEFAULT_MAX_SEGMENTS})'
+    )
+    
+    parser.add_argument(
+        '--fan-out',
+        action='store_true',
+        help='Scan each source table once and write all targets concurrently'
+    )
+    
+    parser.add_argument(
+        '--queue-depth',
+        type=int,
+        default=DEFAULT_QUEUE_DEPTH,
+        help=f'Pages a target writer may lag the scan before it waits (default: {DEFAULT_QUEUE_DEPTH})'
+    )
+    
+    parser.add_argument(
+        '--table-concurrency',
+        type=int,
+        default=1,
+        help='Number of tables to copy at once, largest first (default: 1)'
+    )
+    
+    parser.add_argument(
+        '--max-total-segments',
+        type=int,
+        default=DEFAULT_MAX_SEGMENTS,
+        help=f'Upper bound on scan segments across all concurrent tables (default: {DEFAULT_MAX_SEGMENTS})'
+    )
+    
+    parser.add_argument(
+        '--max-rcu',
+        type=float,
+        help='Ceiling on read capacity units per second per source table (default: adaptive, no ceiling)'
+    )
+    
+    parser.add_argument(
+        '--max-wcu',
+        type=float,
+        help='Ceiling on write capacity units per second per target table (default: adaptive, no ceiling)'
+    )
+    
+    parser.add_argument(
+        '--raw',
+        action='store_true',
+        help='Copy raw AttributeValue maps with client.scan/batch_write_item instead of the Table API'
+    )
+    
+    parser.add_argument(
+        '--writers-per-target',
+        type=int,
+        default=1,
+        help='Batch writer threads per target table and segment (default: 1)'
+    )
+    
+    parser.add_argument(
+        '--max-buffer-mb',
+        type=int,
+        help='Cap on MB of scanned pages held in memory per table copy, by Scan response size (default: bounded by --queue-depth only)'
+    )
+    
+    parser.add_argument(
+        '--delta-sync',
+        action='store_true',
+        help='Only write items that are new or changed since the last sync (uses a local digest index)'
+    )
+    
+    parser.add_argument(
+        '--delete-missing',
+        action='store_true',
+        help='With --delta-sync, delete target items that no longer exist in the source'
+    )
+    
+    parser.add_argument(
+        '--digest-dir',
+        help='Directory for delta-sync digest indexes (default: <log-dir>/digests)'
+    )
+    
+    parser.add_argument(
+        '--metrics-interval',
+        type=float,
+        default=DEFAULT_METRICS_INTERVAL_SECONDS,
+        help=f'Seconds between throughput entries in the JSONL log (default: {DEFAULT_METRICS_INTERVAL_SECONDS})'
+    )
+    
+    parser.add_argument(
+        '--prometheus-file',
+        help='Prometheus textfile to keep updated with copy metrics (default: <log-dir>/copy_metrics.prom)'
+    )
+    
+    parser.add_argument(
+        '--max-attempts',
+        type=int,
+        default=DEFAULT_MAX_ATTEMPTS,
+        help=f'Write attempts per batch before its items go to the dead-letter file (default: {DEFAULT_MAX_ATTEMPTS})'
+    )
+    
+    parser.add_argument(
+        '--size-history',
+        help='Table size history written by get-all-table-counts.py, used instead of describe_table for sizes'
+    )
+    
+    parser.add_argument(
+        '--max-size-age',
+        type=float,
+        default=DEFAULT_MAX_SIZE_AGE_SECONDS / 3600,
+        help=f'Hours a recorded size stays usable before describe_table is called again (default: {DEFAULT_MAX_SIZE_AGE_SECONDS // 3600})'
+    )
+    
     args = parser.parse_args()
     
+    if args.delete_missing and not args.delta_sync:
+        parser.error('--delete-missing requires --delta-sync')
+    
     try:
-        copier = DynamoDBTableCopier(region=args.region, log_dir=args.log_dir)
+        copier = DynamoDBTableCopier(
+            region=args.region,
+            log_dir=args.log_dir,
+            segments=args.segments,
+            auto_segments=args.auto_segments,
+            max_segments=args.max_segments,
+            fan_out=args.fan_out,
+            queue_depth=args.queue_depth,
+            table_concurrency=args.table_concurrency,
+            max_total_segments=args.max_total_segments,
+            max_rcu=args.max_rcu,
+            max_wcu=args.max_wcu,
+            raw=args.raw,
+            writers_per_target=args.writers_per_target,
+            max_buffer_mb=args.max_buffer_mb,
+            delta_sync=args.delta_sync,
+            delete_missing=args.delete_missing,
+            digest_dir=args.digest_dir,
+            metrics_interval=args.metrics_interval,
+            prometheus_file=args.prometheus_file,
+            max_attempts=args.max_attempts,
+            size_history=TableCountHistory(args.size_history, args.max_size_age * 3600) if args.size_history else None
+        )
         copier.run(dry_run=args.dry_run)
     except KeyboardInterrupt:
         print(f"\n{Colors.WARNING}Operation cancelled by user{Colors.ENDC}")
@@ -5,13 +5,27 @@ Single table copy script with status updates
 
 import boto3
 import json
+import os
 import sys
+import threading
 import time
 import argparse
 from datetime import datetime
 from decimal import Decimal
 from pathlib import Path
 
+from dynamodb_copy_engine import (
+    DEFAULT_MAX_SEGMENTS,
+    DEFAULT_QUEUE_DEPTH,
+    ParallelTableCopy,
+    describe_stages,
+    resolve_segment_count,
+)
+from dynamodb_retry import DEFAULT_MAX_ATTEMPTS, DeadLetterFile, RetryPolicy
+
+# Minimum seconds between checkpoint writes
+CHECKPOINT_INTERVAL_SECONDS = 5
+
 class DecimalEncoder(json.JSONEncoder):
     def default(self, obj):
         if isinstance(obj, Decimal):
@@ -35,7 +49,41 @@ def update_status(status_file, updates):
     except Exception as e:
         print(f"Warning: Could not update status file: {e}")
 
-def copy_table(source_table, target_table, region, status_file=None):
+def load_checkpoint(checkpoint_file, source_table, target_table):
+    """Load per-segment scan positions saved by an interrupted copy"""
+    if not checkpoint_file or not os.path.exists(checkpoint_file):
+        return None
+    
+    with open(checkpoint_file, 'r') as f:
+        checkpoint = json.load(f)
+    
+    if checkpoint.get('source') != source_table or checkpoint.get('target') != target_table:
+        print(f"Warning: Ignoring checkpoint for {checkpoint.get('source')} → {checkpoint.get('target')}")
+        return None
+    return checkpoint
+
+def save_checkpoint(checkpoint_file, source_table, target_table, total_segments, segments):
+    """Atomically save per-segment scan positions"""
+    if not checkpoint_file:
+        return
+    
+    checkpoint = {
+        'source': source_table,
+        'target': target_table,
+        'timestamp': datetime.now().isoformat(),
+        'total_segments': total_segments,
+        'segments': segments
+    }
+    tmp_file = f"{checkpoint_file}.tmp"
+    with open(tmp_file, 'w') as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp_file, checkpoint_file)
+
+def copy_table(source_table, target_table, region, status_file=None,
+               segments=1, auto_segments=False, max_segments=DEFAULT_MAX_SEGMENTS,
+               max_rcu=None, max_wcu=None, checkpoint_file=None, raw=False,
+               queue_depth=DEFAULT_QUEUE_DEPTH, writers=1, max_buffer_mb=None,
+               dead_letter_file=None, max_attempts=DEFAULT_MAX_ATTEMPTS):
     """Copy all data from source to target table"""
     
     print(f"Starting copy: {source_table} → {target_table}")
@@ -45,7 +93,6 @@ def copy_table(source_table, target_table, region, status_file=None):
     
     dynamodb = boto3.resource('dynamodb', region_name=region)
     source = dynamodb.Table(source_table)
-    target = dynamodb.Table(target_table)
     
     # Get source item count
     item_count = source.item_count
@@ -57,56 +104,104 @@ def copy_table(source_table, target_table, region, status_file=None):
         'total_items_estimate': item_count
     })
     
+    total_segments = resolve_segment_count(
+        dynamodb.meta.client, source_table,
+        segments=segments,
+        auto_segments=auto_segments,
+        max_segments=max_segments
+    )
+    
+    # Resume from the last written page of every segment
+    resume_state = {}
+    checkpoint = load_checkpoint(checkpoint_file, source_table, target_table)
+    if checkpoint:
+        total_segments = checkpoint['total_segments']
+        resume_state = {target_table: checkpoint['segments']}
+        done = sum(1 for p in checkpoint['segments'].values() if p['done'])
+        print(f"Resuming from checkpoint {checkpoint_file} ({done}/{total_segments} segments done)")
+        print("")
+    
+    if total_segments > 1:
+        print(f"Parallel scan: {total_segments} segments")
+        print("")
+    
+    last_checkpoint = [0.0]
+    # on_progress runs on every writer thread; one checkpoint write at a time
+    checkpoint_lock = threading.Lock()
+    
+    def on_progress(progress):
+        with checkpoint_lock:
+            if time.monotonic() - last_checkpoint[0] >= CHECKPOINT_INTERVAL_SECONDS:
+                save_checkpoint(checkpoint_file, source_table, target_table,
+                                total_segments, progress[target_table])
+                last_checkpoint[0] = time.monotonic()
+    
+    def on_page(page):
+        # Calculate progress
+        progress = 0
+        if item_count > 0:
+            progress = round((page['items_copied'] / item_count) * 100, 1)
+        
+        # Progress update
+        segment_label = ''
+        if page['total_segments'] > 1:
+            segment_label = f" [segment {page['segment']}/{page['total_segments']}]"
+        print(f"Batch {page['pages']}{segment_label}: Copied {page['page_items']} items "
+              f"(Total: {page['items_copied']}, Failed: {page['items_failed']}, Progress: {progress}%)")
+        
+        # Update status file
+        update_status(status_file, {
+            'items_copied': page['items_copied'],
+            'items_failed': page['items_failed'],
+            'progress': f"{progress}%",
+            'batch_number': page['pages']
+        })
+    
+    def on_item_error(target, item, error):
+        print(f"Error copying item: {error}")
+    
+    # Items that still fail after retries, for replay-dead-letters.py
+    dead_letter = DeadLetterFile(dead_letter_file or f"dead-letter-{target_table}.jsonl")
+    
     # Scan and copy
     items_copied = 0
     items_failed = 0
-    batch_number = 0
-    scan_kwargs = {}
+    
+    copy = ParallelTableCopy(
+        region, source_table, [target_table],
+        total_segments=total_segments,
+        on_page=on_page,
+        on_item_error=on_item_error,
+        max_read_units=max_rcu,
+        max_write_units=max_wcu,
+        resume_state=resume_state,
+        on_progress=on_progress if checkpoint_file else None,
+        raw=raw,
+        queue_depth=queue_depth,
+        writers_per_target=writers,
+        max_buffer_mb=max_buffer_mb,
+        retry_policy=RetryPolicy(max_attempts=max_attempts),
+        dead_letter=dead_letter
+    )
     
     try:
-        while True:
-            response = source.scan(**scan_kwargs)
-            items = response.get('Items', [])
-            
-            if not items:
-                break
-            
-            batch_number += 1
-            
-            # Batch write to target
-            with target.batch_writer() as batch:
-                for item in items:
-                    try:
-                        batch.put_item(Item=item)
-                        items_copied += 1
-                    except Exception as e:
-                        items_failed += 1
-                        print(f"Error copying item: {e}")
-            
-            # Calculate progress
-            progress = 0
-            if item_count > 0:
-                progress = round((items_copied / item_count) * 100, 1)
-            
-            # Progress update
-            print(f"Batch {batch_number}: Copied {len(items)} items (Total: {items_copied}, Failed: {items_failed}, Progress: {progress}%)")
-            
-            # Update status file
-            update_status(status_file, {
-                'items_copied': items_copied,
-                'items_failed': items_failed,
-                'progress': f"{progress}%",
-                'batch_number': batch_number
-            })
-            
-            # Check if there are more items
-            if 'LastEvaluatedKey' not in response:
-                break
-            
-            scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
-            
-            # Small delay to avoid throttling
-            time.sleep(0.1)
+        try:
+            copy_result = copy.run()
+            result = copy_result['targets'][target_table]
+        finally:
+            # Always leave the latest positions behind for the next run
+            with checkpoint_lock:
+                save_checkpoint(checkpoint_file, source_table, target_table,
+                                total_segments, copy.progress_snapshot()[target_table])
+            dead_letter.close()
+        items_copied = result['items_copied']
+        items_failed = result['items_failed']
+        
+        if result['error']:
+            raise RuntimeError(result['error'])
+        
+        if checkpoint_file and result['complete']:
+            os.remove(checkpoint_file)
         
         # Final status
         print("")
@@ -115,7 +210,12 @@ def copy_table(source_table, target_table, region, status_file=None):
         print("=" * 60)
         print(f"Items copied: {items_copied}")
         print(f"Items failed: {items_failed}")
+        if dead_letter.count:
+            print(f"Dead-letter file: {dead_letter.path} (re-drive with replay-dead-letters.py)")
         print(f"End time: {datetime.now().isoformat()}")
+        print(f"Pipeline bottleneck: {copy_result['bottleneck']}")
+        for line in describe_stages(copy_result['stages']):
+            print(f"  {line}")
         
         update_status(status_file, {
             'status': 'COMPLETED',
@@ -123,7 +223,9 @@ def copy_table(source_table, target_table, region, status_file=None):
             'items_failed': items_failed,
             'progress': '100%',
             'end_time': datetime.now().isoformat(),
-            'success': items_failed == 0
+            'success': items_failed == 0,
+            'stages': copy_result['stages'],
+            'dead_letter_file': str(dead_letter.path) if dead_letter.count else None
         })
         
         return 0 if items_failed == 0 else 1
@@ -145,10 +247,48 @@ def main():
     parser.add_argument('--target', required=True, help='Target table name')
     parser.add_argument('--region', default='us-east-2', help='AWS region')
     parser.add_argument('--status-file', help='JSON file to write status updates')
+    parser.add_argument('--segments', type=int, default=1,
+                        help='Number of parallel scan segments (default: 1)')
+    parser.add_argument('--auto-segments', action='store_true',
+                        help='Pick the segment count from the source TableSizeBytes')
+    parser.add_argument('--max-segments', type=int, default=DEFAULT_MAX_SEGMENTS,
+                        help=f'Upper bound on scan segments (default: {DEFAULT_MAX_SEGMENTS})')
+    parser.add_argument('--max-rcu', type=float,
+                        help='Ceiling on source read capacity units per second (default: adaptive)')
+    parser.add_argument('--max-wcu', type=float,
+                        help='Ceiling on target write capacity units per second (default: adaptive)')
+    parser.add_argument('--checkpoint-file',
+                        help='JSON file for per-segment scan positions; resumes from it if present')
+    parser.add_argument('--raw', action='store_true',
+                        help='Copy raw AttributeValue maps with the low-level client instead of the Table API')
+    parser.add_argument('--queue-depth', type=int, default=DEFAULT_QUEUE_DEPTH,
+                        help=f'Pages the writers may lag the scan before it waits (default: {DEFAULT_QUEUE_DEPTH})')
+    parser.add_argument('--writers', type=int, default=1,
+                        help='Batch writer threads per segment (default: 1)')
+    parser.add_argument('--max-buffer-mb', type=int,
+                        help='Cap on MB of scanned pages held in memory, by Scan response size (default: bounded by --queue-depth only)')
+    parser.add_argument('--dead-letter-file',
+                        help='JSONL file for items that still fail after retries (default: dead-letter-<target>.jsonl)')
+    parser.add_argument('--max-attempts', type=int, default=DEFAULT_MAX_ATTEMPTS,
+                        help=f'Write attempts per batch before its items are dead-lettered (default: {DEFAULT_MAX_ATTEMPTS})')
     
     args = parser.parse_args()
     
-    exit_code = copy_table(args.source, args.target, args.region, args.status_file)
+    exit_code = copy_table(
+        args.source, args.target, args.region, args.status_file,
+        segments=args.segments,
+        auto_segments=args.auto_segments,
+        max_segments=args.max_segments,
+        max_rcu=args.max_rcu,
+        max_wcu=args.max_wcu,
+        checkpoint_file=args.checkpoint_file,
+        raw=args.raw,
+        queue_depth=args.queue_depth,
+        writers=args.writers,
+        max_buffer_mb=args.max_buffer_mb,
+        dead_letter_file=args.dead_letter_file,
+        max_attempts=args.max_attempts
+    )
     sys.exit(exit_code)
 
 if __name__ == '__main__':
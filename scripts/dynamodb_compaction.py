@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Last-writer-wins compaction of export items by primary key
+
+Incremental exports layered on a full one (see
+dynamodb_import_engine.find_export_layers) hold the same primary key
+several times. Before a table is imported, a first pass over its export
+files records the newest version of every key: files are ordered by
+export time and lines by position, packed into one integer. The import
+pass then writes an item, or deletes a key, only if it is that version,
+so no write capacity is spent on rows that would be overwritten.
+
+Layering several full exports is not supported: a key missing from the
+newer one was deleted, which no record says.
+
+Keys are 16-byte digests of the primary key. The index lives in memory
+until it holds max_memory_keys keys and then spills to a SQLite file,
+which worker processes can also read.
+"""
+
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from dynamodb_delta_sync import LOOKUP_CHUNK, key_text
+
+# Keys held in memory before the index spills to SQLite (about 150 bytes each)
+DEFAULT_MAX_MEMORY_KEYS = 1000000
+
+_LINE_BITS = 32
+
+
+def key_digest(wire_item: Dict, key_names: List[str]) -> bytes:
+    """16-byte digest of an item's primary key"""
+    return hashlib.blake2b(key_text(wire_item, key_names).encode('utf-8'), digest_size=16).digest()
+
+
+def item_version(file_seq: int, line_no: int) -> int:
+    """Version of the item on a line; later files and later lines are newer"""
+    return (file_seq << _LINE_BITS) | line_no
+
+
+def file_key_versions(items: Iterable[Dict], key_names: List[str], file_seq: int) -> Tuple[Dict[bytes, int], int]:
+    """(newest version of each key, item count) of one export file"""
+    versions: Dict[bytes, int] = {}
+    seen = 0
+    for seen, item in enumerate(items, 1):
+        versions[key_digest(item, key_names)] = item_version(file_seq, seen)
+    return versions, seen
+
+
+class KeyVersionIndex:
+    """Newest version of every primary key seen in a set of export files"""
+
+    def __init__(self, path: Path, max_memory_keys: int = DEFAULT_MAX_MEMORY_KEYS):
+        self.path = Path(path)
+        self.max_memory_keys = max_memory_keys
+        self.versions_seen = 0
+        self._memory: Dict[bytes, int] = {}
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open_spilled(cls, path: Path) -> 'KeyVersionIndex':
+        """Read-only view of an index another process spilled to path"""
+        index = cls(path)
+        index._conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True, check_same_thread=False)
+        return index
+
+    @property
+    def spilled(self) -> bool:
+        return self._conn is not None
+
+    def add(self, versions: Dict[bytes, int], seen: int):
+        """Merge the newest versions found in one file; seen counts its items"""
+        with self._lock:
+            self.versions_seen += seen
+            if self._conn is None:
+                memory = self._memory
+                for digest, version in versions.items():
+                    if version > memory.get(digest, -1):
+                        memory[digest] = version
+                if len(memory) <= self.max_memory_keys:
+                    return
+            else:
+                self._memory.update(versions)
+            self._spill()
+
+    def _spill(self):
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=OFF')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS versions (digest BLOB PRIMARY KEY, version INTEGER NOT NULL)')
+        self._conn.executemany(
+            'INSERT INTO versions (digest, version) VALUES (?, ?) '
+            'ON CONFLICT (digest) DO UPDATE SET version = MAX(version, excluded.version)',
+            self._memory.items()
+        )
+        self._conn.commit()
+        self._memory = {}
+
+    def finish(self, spill: bool = False):
+        """Done adding; spill=True forces the index to disk for other processes"""
+        with self._lock:
+            if self._conn is not None or spill:
+                self._spill()
+
+    @property
+    def unique_keys(self) -> int:
+        with self._lock:
+            if self._conn is None:
+                return len(self._memory)
+            return self._conn.execute('SELECT COUNT(*) FROM versions').fetchone()[0]
+
+    @property
+    def duplicates(self) -> int:
+        """Items that are older versions of a key seen again"""
+        return self.versions_seen - self.unique_keys
+
+    def winners(self, digests: List[bytes]) -> Dict[bytes, int]:
+        """Newest version of each of the given keys"""
+        with self._lock:
+            if self._conn is None:
+                return {digest: self._memory[digest] for digest in digests if digest in self._memory}
+            found = {}
+            for i in range(0, len(digests), LOOKUP_CHUNK):
+                chunk = digests[i:i + LOOKUP_CHUNK]
+                placeholders = ','.join('?' * len(chunk))
+                found.update(self._conn.execute(
+                    f'SELECT digest, version FROM versions WHERE digest IN ({placeholders})', chunk))
+            return found
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class CompactionFilter:
+    """Drops items of one export file that are not the newest version of their key"""
+
+    def __init__(self, index: KeyVersionIndex, key_names: List[str], file_seq: int):
+        self.index = index
+        self.key_names = key_names
+        self.file_seq = file_seq
+
+    def newest(self, numbered_items: List[Tuple[int, Dict]]) -> List[Tuple[int, Dict]]:
+        """The (1-based position in the file, item) pairs that win for their key"""
+        digests = [key_digest(item, self.key_names) for _, item in numbered_items]
+        winners = self.index.winners(digests)
+        return [
+            (number, item) for (number, item), digest in zip(numbered_items, digests)
+            if winners.get(digest) == item_version(self.file_seq, number)
+        ]
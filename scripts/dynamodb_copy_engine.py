@@ -0,0 +1,928 @@
+#!/usr/bin/env python3
+"""
+Shared DynamoDB copy engine
+
+Parallel Segment/TotalSegments scan used by copy-dynamodb-tables.py and
+copy-single-table.py. Every segment runs in its own thread with its own
+boto3 session and runs a scan -> transform -> write pipeline that fans
+each page out to a pool of batch writers per target.
+Scans and writes are paced by an adaptive rate controller per table, and
+per-segment scan positions can be checkpointed and resumed. Every Scan and
+BatchWriteItem call can be recorded in a dynamodb_copy_metrics.CopyMetrics.
+
+With raw=True items stay in DynamoDB wire format end to end: the low-level
+client scans and batch-writes the AttributeValue maps unchanged, skipping
+the Decimal round trip of the resource API.
+"""
+
+import base64
+import copy
+import math
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import boto3
+from boto3.dynamodb.types import Binary, TypeDeserializer, TypeSerializer
+
+from dynamodb_copy_metrics import CopyMetrics, response_bytes
+from dynamodb_retry import DeadLetterFile, RetryPolicy
+from dynamodb_throttle import (
+    DEFAULT_INITIAL_READ_RATE,
+    DEFAULT_INITIAL_WRITE_RATE,
+    AdaptiveRateController,
+    consumed_units,
+    is_throttle_error,
+)
+
+# Auto-sizing: one scan segment per this many bytes of source table
+BYTES_PER_SEGMENT = 32 * 1024 * 1024
+
+# Scans are network bound, so allow a few segments per core
+DEFAULT_MAX_SEGMENTS = min(64, (os.cpu_count() or 1) * 4)
+
+# Pages a target writer may fall behind the scan before the scan waits on it
+DEFAULT_QUEUE_DEPTH = 8
+
+# Marks the end of a segment's pages on a writer queue
+_END_OF_SCAN = object()
+
+# BatchWriteItem accepts at most 25 requests
+BATCH_WRITE_LIMIT = 25
+
+# Scan pages hold at most 1 MB of item data; assumed for a page whose response size is unknown
+MAX_PAGE_BYTES = 1024 * 1024
+
+
+def auto_segment_count(table_size_bytes: int, max_segments: int = DEFAULT_MAX_SEGMENTS) -> int:
+    """Pick a segment count from TableSizeBytes"""
+    if not table_size_bytes or table_size_bytes <= 0:
+        return 1
+    segments = math.ceil(table_size_bytes / BYTES_PER_SEGMENT)
+    return max(1, min(segments, max_segments))
+
+
+def get_table_size_bytes(dynamodb_client, table_name: str, size_history=None) -> int:
+    """Get approximate table size in bytes from describe_table
+
+    With a dynamodb_count_history.TableCountHistory, a recent recorded size
+    is used instead and describe_table is only called for tables it lacks.
+    """
+    if size_history is not None:
+        size = size_history.size_bytes(table_name, dynamodb_client.meta.region_name)
+        if size is not None:
+            return size
+    response = dynamodb_client.describe_table(TableName=table_name)
+    return response['Table'].get('TableSizeBytes', 0)
+
+
+def resolve_segment_count(dynamodb_client, table_name: str, segments: int = 1,
+                          auto_segments: bool = False,
+                          max_segments: int = DEFAULT_MAX_SEGMENTS,
+                          size_history=None) -> int:
+    """Resolve the number of scan segments to use for a table"""
+    if auto_segments:
+        return auto_segment_count(get_table_size_bytes(dynamodb_client, table_name, size_history), max_segments)
+    return max(1, min(segments, max_segments))
+
+
+_serializer = TypeSerializer()
+_deserializer = TypeDeserializer()
+
+
+def encode_key(key: Dict, raw: bool = False) -> Dict:
+    """Convert a LastEvaluatedKey to JSON-safe DynamoDB wire format
+
+    raw keys come from the low-level client and are already in wire format.
+    """
+    encoded = {}
+    for name, value in key.items():
+        attr = value if raw else _serializer.serialize(value)
+        if 'B' in attr:
+            attr = {'B': base64.b64encode(bytes(attr['B'])).decode('ascii')}
+        encoded[name] = attr
+    return encoded
+
+
+def decode_key(encoded: Dict, raw: bool = False) -> Dict:
+    """Inverse of encode_key, usable as an ExclusiveStartKey"""
+    key = {}
+    for name, attr in encoded.items():
+        if 'B' in attr:
+            value = base64.b64decode(attr['B'])
+            key[name] = {'B': value} if raw else Binary(value)
+        else:
+            key[name] = attr if raw else _deserializer.deserialize(attr)
+    return key
+
+
+def new_segment_progress() -> Dict:
+    """Checkpoint entry for a segment that has not copied anything yet"""
+    return {'last_key': None, 'pages': 0, 'items_copied': 0, 'done': False}
+
+
+class WriteFailedError(Exception):
+    """Write requests that failed for good, raised when no on_failed handler is set"""
+
+    def __init__(self, requests: List[Dict], error):
+        super().__init__(str(error))
+        self.requests = requests
+
+
+class ThrottledBatchWriter:
+    """Batch writer that paces BatchWriteItem calls through a rate controller
+
+    Drop-in for Table.batch_writer(), but it retries UnprocessedItems,
+    throttles and transient errors itself with the retry policy's backoff,
+    and reports consumed capacity to the controller. A batch rejected
+    outright (e.g. one oversized item) is retried one request at a time so
+    only the bad requests fail. Requests that fail for good go to
+    on_failed(requests, error), or raise WriteFailedError without it.
+
+    Pass a resource's meta.client to write plain Python items, or a low-level
+    client to write wire-format AttributeValue maps unchanged. on_call, if
+    given, is called after every BatchWriteItem call with
+    (seconds, items written, consumed units, throttled).
+    """
+
+    def __init__(self, client, table_name: str, controller: AdaptiveRateController,
+                 on_call: Optional[Callable[[float, int, Optional[float], bool], None]] = None,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 on_failed: Optional[Callable[[List[Dict], Exception], None]] = None):
+        self.client = client
+        self.table_name = table_name
+        self.controller = controller
+        self.on_call = on_call
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.on_failed = on_failed
+        self._buffer: List[Dict] = []
+
+    def put_item(self, Item: Dict):
+        self._buffer.append({'PutRequest': {'Item': Item}})
+        if len(self._buffer) >= BATCH_WRITE_LIMIT:
+            self._flush()
+
+    def delete_item(self, Key: Dict):
+        self._buffer.append({'DeleteRequest': {'Key': Key}})
+        if len(self._buffer) >= BATCH_WRITE_LIMIT:
+            self._flush()
+
+    def _flush(self):
+        batch = self._buffer[:BATCH_WRITE_LIMIT]
+        self._buffer = self._buffer[BATCH_WRITE_LIMIT:]
+        self._write_batch(batch)
+
+    def _fail(self, requests: List[Dict], error):
+        if self.on_failed is None:
+            raise WriteFailedError(requests, error)
+        self.on_failed(requests, error)
+
+    def _write_batch(self, batch: List[Dict]):
+        """Write one batch, retrying until it is written or its attempts run out"""
+        attempt = 0
+        while batch:
+            # Roughly one WCU per item; corrected from ConsumedCapacity below
+            estimate = float(len(batch))
+            self.controller.acquire(estimate)
+
+            started = time.monotonic()
+            try:
+                response = self.client.batch_write_item(
+                    RequestItems={self.table_name: batch},
+                    ReturnConsumedCapacity='TOTAL'
+                )
+            except Exception as e:
+                throttled = is_throttle_error(e)
+                if throttled:
+                    self.controller.record_throttle()
+                if self.on_call:
+                    self.on_call(time.monotonic() - started, 0, None, throttled)
+
+                if not self.retry_policy.is_retryable(e):
+                    if len(batch) > 1:
+                        # Isolate the requests the service rejects
+                        for request in batch:
+                            self._write_batch([request])
+                    else:
+                        self._fail(batch, e)
+                    return
+
+                attempt += 1
+                if attempt >= self.retry_policy.max_attempts:
+                    self._fail(batch, e)
+                    return
+                time.sleep(self.retry_policy.delay(attempt))
+                continue
+
+            consumed = consumed_units(response)
+            self.controller.record_consumed(estimate, consumed)
+
+            unprocessed = response.get('UnprocessedItems', {}).get(self.table_name, [])
+            if unprocessed:
+                self.controller.record_throttle()
+            else:
+                self.controller.record_success()
+
+            if self.on_call:
+                self.on_call(time.monotonic() - started, len(batch) - len(unprocessed), consumed, bool(unprocessed))
+
+            batch = unprocessed
+            if batch:
+                attempt += 1
+                if attempt >= self.retry_policy.max_attempts:
+                    self._fail(batch, f'still unprocessed after {attempt} attempts')
+                    return
+                time.sleep(self.retry_policy.delay(attempt))
+
+    def flush(self):
+        """Write everything buffered so far"""
+        while self._buffer:
+            self._flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.flush()
+
+
+def describe_stages(stages: Dict[str, Dict]) -> List[str]:
+    """One human-readable line per pipeline stage"""
+    return [
+        f"{st['stage']}: {st['utilization'] * 100:.0f}% busy "
+        f"(busy {st['busy_seconds']:.1f}s, waited {st['wait_seconds']:.1f}s, {st['pages']} pages)"
+        for st in stages.values()
+    ]
+
+
+class StageStats:
+    """Busy and wait time of one pipeline stage, summed over its threads
+
+    Busy is time spent doing the stage's own work (scan calls, transforms,
+    batch writes); wait is time blocked on the queues either side of it.
+    The stage with the highest utilization is the bottleneck.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.busy_seconds = 0.0
+        self.wait_seconds = 0.0
+        self.pages = 0
+        self.items = 0
+        self._lock = threading.Lock()
+
+    def add_busy(self, seconds: float, pages: int = 0, items: int = 0):
+        with self._lock:
+            self.busy_seconds += seconds
+            self.pages += pages
+            self.items += items
+
+    def add_wait(self, seconds: float):
+        with self._lock:
+            self.wait_seconds += seconds
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            total = self.busy_seconds + self.wait_seconds
+            return {
+                'stage': self.name,
+                'busy_seconds': round(self.busy_seconds, 3),
+                'wait_seconds': round(self.wait_seconds, 3),
+                'utilization': round(self.busy_seconds / total, 3) if total else 0.0,
+                'pages': self.pages,
+                'items': self.items
+            }
+
+
+class BufferBudget:
+    """Bytes of scanned pages held in a copy pipeline
+
+    A page's size is only known once it has been scanned, so a scanner
+    waits for room before it scans and charges the page afterwards. Every
+    segment can overshoot the budget by at most one page.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max(1, max_bytes)
+        self.used = 0
+        self._cond = threading.Condition()
+
+    def wait_for_room(self):
+        with self._cond:
+            while self.used >= self.max_bytes:
+                self._cond.wait()
+
+    def charge(self, size_bytes: int):
+        with self._cond:
+            self.used += size_bytes
+
+    def release(self, size_bytes: int):
+        with self._cond:
+            self.used -= size_bytes
+            self._cond.notify_all()
+
+
+class _Page:
+    """One scanned page on its way through the pipeline"""
+
+    __slots__ = ('seq', 'items', 'last_key', 'pending', 'size_bytes')
+
+    def __init__(self, seq: int, items: List[Dict], last_key: Optional[Dict], size_bytes: int = 0):
+        self.seq = seq
+        self.items = items
+        self.last_key = last_key
+        self.pending = 0
+        # Response body size, used to estimate bytes written per item
+        self.size_bytes = size_bytes
+
+    @property
+    def buffer_bytes(self) -> int:
+        return self.size_bytes or MAX_PAGE_BYTES
+
+
+class ParallelTableCopy:
+    """Copy one DynamoDB table to one or more targets with a parallel segmented scan
+
+    Every segment is a pipeline of stages joined by bounded queues:
+
+        scanner -> [transform] -> writer pool per target
+
+    Each page is scanned once and fanned out to every target. A target's
+    writers sit behind a queue of queue_depth pages, so a slow target only
+    holds up the scan once it is that far behind. max_buffer_mb caps the
+    bytes of scanned pages alive across all segments, measured by the size
+    of each Scan response. The source and each target get one rate controller shared by
+    all segments; max_read_units/max_write_units cap them per table.
+
+    Writers flush at every page boundary. A page's LastEvaluatedKey is
+    recorded per target and segment once it and every earlier page of the
+    segment are written, so the checkpoint never skips a page even with
+    several writers per target. resume_state takes the same shape
+    ({target: {segment: progress}}); a segment resumes from its least
+    advanced target, and targets that were ahead rewrite a few pages,
+    which is harmless because puts are idempotent.
+
+    write_filter (e.g. dynamodb_delta_sync.DeltaSync) lets a target skip
+    items: changed_items(target, items) picks what to write, and
+    mark_written(target, items) is called with the page's items once they
+    are flushed.
+
+    Writes are retried with retry_policy's backoff. Items that still fail
+    are reported to on_item_error and, with dead_letter, spilled to a
+    dead-letter file so the checkpoint can move past them safely.
+
+    metrics, if given, records every Scan and BatchWriteItem call per
+    segment and target. Bytes are the Scan response body size, and written
+    bytes are estimated from the page's average bytes per item.
+
+    max_workers caps the segments scanned at once (default: all of them);
+    the rest start as earlier ones finish. A copy resumed with a saved
+    segment count uses it to stay within the workers it was granted.
+
+    stop_event, if given, is used instead of a private one, so whoever owns
+    it can stop every segment after its current page. A stopped copy
+    returns with its targets not complete.
+    """
+
+    def __init__(self, region: str, source_table: str, target_tables: List[str],
+                 total_segments: int = 1,
+                 on_page: Optional[Callable[[Dict], None]] = None,
+                 on_item_error: Optional[Callable[[str, Dict, Exception], None]] = None,
+                 queue_depth: int = DEFAULT_QUEUE_DEPTH,
+                 max_read_units: Optional[float] = None,
+                 max_write_units: Optional[float] = None,
+                 resume_state: Optional[Dict[str, Dict[str, Dict]]] = None,
+                 on_progress: Optional[Callable[[Dict], None]] = None,
+                 raw: bool = False,
+                 transform: Optional[Callable[[List[Dict]], List[Dict]]] = None,
+                 writers_per_target: int = 1,
+                 max_buffer_mb: Optional[int] = None,
+                 write_filter=None,
+                 metrics: Optional[CopyMetrics] = None,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 dead_letter: Optional[DeadLetterFile] = None,
+                 stop_event: Optional[threading.Event] = None,
+                 max_workers: Optional[int] = None):
+        self.region = region
+        self.source_table = source_table
+        self.target_tables = list(target_tables)
+        self.total_segments = max(1, total_segments)
+        self.max_workers = max(1, min(max_workers or self.total_segments, self.total_segments))
+        self.on_page = on_page
+        self.on_item_error = on_item_error
+        self.queue_depth = max(1, queue_depth)
+        self.raw = raw
+        self.transform = transform
+        self.writers_per_target = max(1, writers_per_target)
+        self.write_filter = write_filter
+        self.metrics = metrics
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.dead_letter = dead_letter
+
+        self.read_controller = AdaptiveRateController(
+            source_table, DEFAULT_INITIAL_READ_RATE, max_rate=max_read_units)
+        self.write_controllers = {
+            target: AdaptiveRateController(target, DEFAULT_INITIAL_WRITE_RATE, max_rate=max_write_units)
+            for target in self.target_tables
+        }
+
+        # Pages held anywhere in the pipeline, released once every target wrote them
+        self.buffer_budget = BufferBudget(max_buffer_mb * 1024 * 1024) if max_buffer_mb else None
+
+        self.stages = {'scan': StageStats('scan')}
+        if transform:
+            self.stages['transform'] = StageStats('transform')
+        for target in self.target_tables:
+            self.stages[f'write:{target}'] = StageStats(f'write:{target}')
+
+        self.stop_event = stop_event or threading.Event()
+        self._lock = threading.Lock()
+        self.totals = {
+            target: {'items_copied': 0, 'items_failed': 0, 'pages': 0}
+            for target in self.target_tables
+        }
+
+        resume_state = resume_state or {}
+        self.on_progress = on_progress
+        self.progress = {
+            target: {
+                str(segment): copy.deepcopy(
+                    resume_state.get(target, {}).get(str(segment)) or new_segment_progress())
+                for segment in range(self.total_segments)
+            }
+            for target in self.target_tables
+        }
+
+        # Pages written out of order, waiting for earlier pages: {(target, segment): {seq: page}}
+        self._completed_pages: Dict[Tuple[str, int], Dict[int, _Page]] = {}
+        self._next_commit: Dict[Tuple[str, int], int] = {}
+
+    def progress_snapshot(self) -> Dict[str, Dict[str, Dict]]:
+        """Copy of per-target, per-segment scan positions for checkpointing"""
+        with self._lock:
+            return copy.deepcopy(self.progress)
+
+    def stage_snapshot(self) -> Dict[str, Dict]:
+        """Busy/wait figures for every pipeline stage"""
+        return {name: stats.snapshot() for name, stats in self.stages.items()}
+
+    def _commit_page(self, segment: int, target_table: str, page: _Page, copied: int):
+        """Advance the checkpoint past every contiguous written page"""
+        key = (target_table, segment)
+        with self._lock:
+            completed = self._completed_pages.setdefault(key, {})
+            completed[page.seq] = page
+            progress = self.progress[target_table][str(segment)]
+            progress['items_copied'] += copied
+
+            committed = False
+            while self._next_commit.get(key, 0) in completed:
+                done = completed.pop(self._next_commit.get(key, 0))
+                self._next_commit[key] = done.seq + 1
+                progress['last_key'] = encode_key(done.last_key, raw=self.raw) if done.last_key else None
+                progress['done'] = done.last_key is None
+                progress['pages'] += 1
+                committed = True
+
+            snapshot = copy.deepcopy(self.progress) if committed else None
+
+        if snapshot and self.on_progress:
+            self.on_progress(snapshot)
+
+    def _release_page(self, page: _Page):
+        """Drop one target's hold on a page and free its buffer slot after the last"""
+        with self._lock:
+            page.pending -= 1
+            released = page.pending == 0
+        if released and self.buffer_budget:
+            self.buffer_budget.release(page.buffer_bytes)
+
+    def _client(self, session):
+        """Client for scans and batch writes in the configured item format"""
+        if self.raw:
+            return session.client('dynamodb', region_name=self.region)
+        # The resource's client (de)serializes plain Python items
+        return session.resource('dynamodb', region_name=self.region).meta.client
+
+    def _timed_get(self, pages: queue.Queue, stats: StageStats):
+        started = time.monotonic()
+        page = pages.get()
+        stats.add_wait(time.monotonic() - started)
+        return page
+
+    def _timed_put(self, pages: queue.Queue, page, stats: StageStats):
+        started = time.monotonic()
+        pages.put(page)
+        stats.add_wait(time.monotonic() - started)
+
+    def _write_target(self, segment: int, target_table: str, pages: queue.Queue, result: Dict):
+        """One writer of a target's pool, draining pages through its own batch writer"""
+        # boto3 resources are not thread safe, so each writer gets a session
+        session = boto3.session.Session()
+        client = self._client(session)
+        stats = self.stages[f'write:{target_table}']
+
+        # Average bytes per item of the page being written
+        item_bytes = [0.0]
+        on_call = None
+        if self.metrics:
+            def on_call(seconds, written, consumed, throttled):
+                self.metrics.record_write(self.source_table, target_table, segment, seconds, written,
+                                          int(written * item_bytes[0]), consumed, throttled)
+
+        # Items of the current page whose writes failed for good
+        failed_items = []
+
+        def on_failed(requests, error):
+            for request in requests:
+                item = request['PutRequest']['Item']
+                failed_items.append(item)
+                if self.dead_letter:
+                    self.dead_letter.add(target_table, item, error, raw=self.raw, source=self.source_table)
+                if self.on_item_error:
+                    self.on_item_error(target_table, item, error)
+
+        finished = False
+        try:
+            with ThrottledBatchWriter(client, target_table, self.write_controllers[target_table],
+                                      on_call=on_call, retry_policy=self.retry_policy,
+                                      on_failed=on_failed) as batch:
+                while True:
+                    page = self._timed_get(pages, stats)
+                    if page is _END_OF_SCAN:
+                        finished = True
+                        break
+
+                    item_bytes[0] = page.size_bytes / len(page.items) if page.items else 0.0
+                    started = time.monotonic()
+                    failed_items.clear()
+                    try:
+                        items = page.items
+                        if self.write_filter:
+                            items = self.write_filter.changed_items(target_table, items)
+
+                        for item in items:
+                            batch.put_item(Item=item)
+
+                        # Only checkpoint keys whose items are really in the target
+                        batch.flush()
+                        copied = len(items) - len(failed_items)
+
+                        if self.write_filter:
+                            # Retried requests come back as new dicts, so match failures by value
+                            self.write_filter.mark_written(
+                                target_table, [item for item in page.items if item not in failed_items])
+                    finally:
+                        self._release_page(page)
+                    stats.add_busy(time.monotonic() - started, pages=1, items=copied)
+
+                    failed = len(failed_items)
+                    with self._lock:
+                        result['items_copied'] += copied
+                        result['items_failed'] += failed
+                        result['items_unchanged'] += len(page.items) - len(items)
+                        result['pages'] += 1
+                    self._commit_page(segment, target_table, page, copied)
+                    if page.items:
+                        self._record_page(segment, target_table, len(page.items), copied, failed)
+        except Exception as e:
+            with self._lock:
+                result['error'] = str(e)
+
+        # Keep draining so the scan never blocks on a failed target
+        while not finished:
+            page = pages.get()
+            if page is _END_OF_SCAN:
+                finished = True
+            else:
+                self._release_page(page)
+
+    def _fan_out(self, page: _Page, queues: Dict[str, queue.Queue], stats: StageStats):
+        """Hand one page to every active target's writer pool"""
+        page.pending = len(queues)
+        for target_queue in queues.values():
+            self._timed_put(target_queue, page, stats)
+
+    def _transform_pages(self, pages: queue.Queue, queues: Dict[str, queue.Queue],
+                         failed: threading.Event, result: Dict):
+        """Transform stage between the scanner and the writer pools"""
+        stats = self.stages['transform']
+        while True:
+            page = self._timed_get(pages, stats)
+            if page is _END_OF_SCAN:
+                return
+            if failed.is_set():
+                if self.buffer_budget:
+                    self.buffer_budget.release(page.buffer_bytes)
+                continue
+
+            started = time.monotonic()
+            try:
+                page.items = self.transform(page.items)
+            except Exception as e:
+                # Stop the segment here; later pages must not pass a gap
+                result['error'] = f'transform failed: {e}'
+                failed.set()
+                if self.buffer_budget:
+                    self.buffer_budget.release(page.buffer_bytes)
+                continue
+            stats.add_busy(time.monotonic() - started, pages=1, items=len(page.items))
+            self._fan_out(page, queues, stats)
+
+    def _copy_segment(self, segment: int) -> Dict:
+        """Run one segment's scan -> transform -> write pipeline"""
+        session = boto3.session.Session()
+        client = self._client(session)
+        scan_stats = self.stages['scan']
+
+        result = {
+            'segment': segment,
+            'items_scanned': 0,
+            'pages': 0,
+            'resumed': False,
+            'error': None,
+            'targets': {
+                target: {'items_copied': 0, 'items_failed': 0, 'items_unchanged': 0, 'pages': 0, 'error': None}
+                for target in self.target_tables
+            }
+        }
+
+        # Targets that already finished this segment in an earlier run are skipped
+        active_targets = [t for t in self.target_tables if not self.progress[t][str(segment)]['done']]
+        if not active_targets:
+            result['resumed'] = True
+            return result
+
+        scan_kwargs = {'TableName': self.source_table, 'ReturnConsumedCapacity': 'TOTAL'}
+        if self.total_segments > 1:
+            scan_kwargs['Segment'] = segment
+            scan_kwargs['TotalSegments'] = self.total_segments
+
+        # Resume from the least advanced target
+        start = min((self.progress[t][str(segment)] for t in active_targets), key=lambda p: p['pages'])
+        if start['last_key']:
+            scan_kwargs['ExclusiveStartKey'] = decode_key(start['last_key'], raw=self.raw)
+            result['resumed'] = True
+        for target in active_targets:
+            progress = self.progress[target][str(segment)]
+            progress['last_key'] = start['last_key']
+            progress['pages'] = start['pages']
+
+        queues = {target: queue.Queue(maxsize=self.queue_depth) for target in active_targets}
+        threads = [
+            threading.Thread(
+                target=self._write_target,
+                args=(segment, target, queues[target], result['targets'][target]),
+                name=f'{target}-segment-{segment}-writer-{n}',
+                daemon=True
+            )
+            for target in active_targets
+            for n in range(self.writers_per_target)
+        ]
+
+        transform_failed = threading.Event()
+        transform_queue = None
+        if self.transform:
+            transform_queue = queue.Queue(maxsize=self.queue_depth)
+            threads.append(threading.Thread(
+                target=self._transform_pages,
+                args=(transform_queue, queues, transform_failed, result),
+                name=f'{self.source_table}-segment-{segment}-transform',
+                daemon=True
+            ))
+
+        for thread in threads:
+            thread.start()
+
+        # A 1 MB page costs up to 128 RCU; start small and learn from ConsumedCapacity
+        read_estimate = 1.0
+        seq = 0
+
+        try:
+            while not self.stop_event.is_set() and not transform_failed.is_set():
+                if self.buffer_budget:
+                    started = time.monotonic()
+                    self.buffer_budget.wait_for_room()
+                    scan_stats.add_wait(time.monotonic() - started)
+
+                self.read_controller.acquire(read_estimate)
+                started = time.monotonic()
+                try:
+                    response = self.retry_policy.call_except_throttles(client.scan, **scan_kwargs)
+                except Exception as e:
+                    if not is_throttle_error(e):
+                        raise
+                    self.read_controller.record_throttle()
+                    if self.metrics:
+                        self.metrics.record_scan(self.source_table, segment, time.monotonic() - started,
+                                                 0, 0, None, throttled=True)
+                    continue
+
+                consumed = consumed_units(response)
+                self.read_controller.record_consumed(read_estimate, consumed)
+                self.read_controller.record_success()
+                if consumed is not None:
+                    read_estimate = max(1.0, consumed)
+
+                items = response.get('Items', [])
+                last_key = response.get('LastEvaluatedKey')
+                size_bytes = response_bytes(response)
+                scan_stats.add_busy(time.monotonic() - started, pages=1, items=len(items))
+                if self.metrics:
+                    self.metrics.record_scan(self.source_table, segment, time.monotonic() - started,
+                                             len(items), size_bytes, consumed)
+
+                result['items_scanned'] += len(items)
+                result['pages'] += 1
+
+                # Empty final pages still go out so writers can mark the segment done
+                page = _Page(seq, items, last_key, size_bytes)
+                seq += 1
+                if self.buffer_budget:
+                    self.buffer_budget.charge(page.buffer_bytes)
+                if transform_queue:
+                    self._timed_put(transform_queue, page, scan_stats)
+                else:
+                    self._fan_out(page, queues, scan_stats)
+
+                # Check if there are more items to scan
+                if not last_key:
+                    break
+
+                scan_kwargs['ExclusiveStartKey'] = last_key
+        except Exception as e:
+            result['error'] = str(e)
+        finally:
+            if transform_queue:
+                transform_queue.put(_END_OF_SCAN)
+                threads[-1].join()
+            for target in active_targets:
+                for _ in range(self.writers_per_target):
+                    queues[target].put(_END_OF_SCAN)
+            for thread in threads:
+                thread.join()
+
+        return result
+
+    def _record_page(self, segment: int, target_table: str, page_items: int, copied: int, failed: int):
+        """Update shared per-target totals and report progress for one page"""
+        with self._lock:
+            totals = self.totals[target_table]
+            totals['items_copied'] += copied
+            totals['items_failed'] += failed
+            totals['pages'] += 1
+
+            if self.on_page:
+                self.on_page({
+                    'segment': segment,
+                    'total_segments': self.total_segments,
+                    'target': target_table,
+                    'page_items': page_items,
+                    'items_copied': totals['items_copied'],
+                    'items_failed': totals['items_failed'],
+                    'pages': totals['pages']
+                })
+
+    def run(self) -> Dict:
+        """Run every segment and return the combined per-target result"""
+        segment_results: List[Dict] = []
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = [pool.submit(self._copy_segment, segment)
+                       for segment in range(self.total_segments)]
+            try:
+                for future in as_completed(futures):
+                    segment_results.append(future.result())
+            except KeyboardInterrupt:
+                # Let in-flight pages finish, then stop every segment
+                self.stop_event.set()
+                raise
+
+        segment_results.sort(key=lambda r: r['segment'])
+        scan_errors = [f"segment {r['segment']}: {r['error']}" for r in segment_results if r['error']]
+
+        targets = {}
+        for target in self.target_tables:
+            per_segment = [r['targets'][target] for r in segment_results]
+            write_errors = [f"segment {r['segment']}: {r['targets'][target]['error']}"
+                            for r in segment_results if r['targets'][target]['error']]
+            errors = scan_errors + write_errors
+            targets[target] = {
+                'source': self.source_table,
+                'target': target,
+                'items_copied': sum(s['items_copied'] for s in per_segment),
+                'items_failed': sum(s['items_failed'] for s in per_segment),
+                'items_unchanged': sum(s['items_unchanged'] for s in per_segment),
+                'write_throttles': self.write_controllers[target].throttle_count,
+                'error': '; '.join(errors) if errors else None
+            }
+
+        for target in self.target_tables:
+            targets[target]['complete'] = all(p['done'] for p in self.progress[target].values())
+
+        stages = self.stage_snapshot()
+
+        return {
+            'source': self.source_table,
+            'total_segments': self.total_segments,
+            'items_scanned': sum(r['items_scanned'] for r in segment_results),
+            'segments': segment_results,
+            'targets': targets,
+            'progress': self.progress_snapshot(),
+            'read_capacity': self.read_controller.snapshot(),
+            'write_capacity': {t: c.snapshot() for t, c in self.write_controllers.items()},
+            'stages': stages,
+            'bottleneck': max(stages.values(), key=lambda st: st['utilization'])['stage'],
+            'error': '; '.join(scan_errors) if scan_errors else None
+        }
+
+
+class WorkerBudget:
+    """Counting budget of scan workers shared by concurrent table copies
+
+    Waiters are served first come, first served so a large table queued
+    ahead of small ones is not starved of workers.
+    """
+
+    def __init__(self, total_workers: int):
+        self.total_workers = max(1, total_workers)
+        self.available = self.total_workers
+        self._cond = threading.Condition()
+        self._next_ticket = 0
+        self._serving = 0
+
+    def acquire(self, workers: int) -> int:
+        """Block until the requested workers are free and return how many were granted"""
+        workers = max(1, min(workers, self.total_workers))
+        with self._cond:
+            ticket = self._next_ticket
+            self._next_ticket += 1
+            while ticket != self._serving or self.available < workers:
+                self._cond.wait()
+            self.available -= workers
+            self._serving += 1
+            self._cond.notify_all()
+        return workers
+
+    def release(self, workers: int):
+        """Return workers to the budget"""
+        with self._cond:
+            self.available += workers
+            self._cond.notify_all()
+
+
+class TableCopyScheduler:
+    """Run table copies concurrently, largest table first
+
+    max_tables caps how many tables copy at once; max_workers caps the scan
+    segments running across all of them. Each job asks for its own segment
+    count, which is already capped per table by the caller.
+    """
+
+    def __init__(self, max_tables: int, max_workers: int):
+        self.max_tables = max(1, max_tables)
+        self.budget = WorkerBudget(max_workers)
+        self.stop_event = threading.Event()
+
+    def run(self, jobs: List[Tuple[str, int, int]],
+            work: Callable[[str, int], Any],
+            on_complete: Callable[[str, Any, Optional[Exception]], None]):
+        """Run (table_name, size_bytes, segments) jobs largest first
+
+        work(table_name, segments) runs on a scheduler thread and its return
+        value, or the exception it raised, is handed to on_complete from the
+        same thread.
+        """
+        ordered = sorted(jobs, key=lambda job: job[1], reverse=True)
+
+        def run_job(table_name: str, segments: int):
+            if self.stop_event.is_set():
+                return
+            granted = self.budget.acquire(segments)
+            try:
+                if self.stop_event.is_set():
+                    return
+                try:
+                    result = work(table_name, granted)
+                except Exception as e:
+                    on_complete(table_name, None, e)
+                else:
+                    on_complete(table_name, result, None)
+            finally:
+                self.budget.release(granted)
+
+        pool = ThreadPoolExecutor(max_workers=self.max_tables)
+        try:
+            futures = [pool.submit(run_job, table_name, segments)
+                       for table_name, _, segments in ordered]
+            for future in as_completed(futures):
+                future.result()
+        except KeyboardInterrupt:
+            # Tables already copying finish their current page; queued ones never start
+            self.stop_event.set()
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+        pool.shutdown(wait=True)
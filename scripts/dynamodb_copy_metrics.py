@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Throughput and capacity metrics for DynamoDB copy runs
+
+CopyMetrics collects counters per table, per target and per scan segment
+(items, bytes, consumed capacity, throttles) plus latency histograms for
+Scan and BatchWriteItem calls. MetricsReporter periodically hands a
+snapshot to a callback (the copier's JSONL log) and rewrites a Prometheus
+textfile for node_exporter's textfile collector. In the textfile, per-table
+totals and per-segment counters are separate metrics
+(dynamodb_copy_items_total and dynamodb_copy_segment_items_total), so
+either can be summed on its own.
+"""
+
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+# Upper bounds in seconds, Prometheus style (+Inf is implied)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+DEFAULT_METRICS_INTERVAL_SECONDS = 30
+
+
+def response_bytes(response: Dict) -> int:
+    """Body size of a boto3 response from its Content-Length header"""
+    headers = response.get('ResponseMetadata', {}).get('HTTPHeaders', {})
+    try:
+        return int(headers.get('content-length', 0))
+    except (TypeError, ValueError):
+        return 0
+
+
+class LatencyHistogram:
+    """Cumulative-bucket latency histogram"""
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float):
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Approximate quantile as the upper bound of the bucket it falls in"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else float('inf')
+        return float('inf')
+
+    def snapshot(self) -> Dict:
+        return {
+            'count': self.count,
+            'mean_seconds': round(self.sum / self.count, 4) if self.count else None,
+            'p50_seconds': self.quantile(0.5),
+            'p95_seconds': self.quantile(0.95),
+            'p99_seconds': self.quantile(0.99)
+        }
+
+
+class _Counters:
+    """Call counters for one (operation, table, target, segment) series"""
+
+    __slots__ = ('calls', 'items', 'bytes', 'consumed_units', 'throttles', 'first_seen', 'last_seen')
+
+    def __init__(self, now: float):
+        self.calls = 0
+        self.items = 0
+        self.bytes = 0
+        self.consumed_units = 0.0
+        self.throttles = 0
+        self.first_seen = now
+        self.last_seen = now
+
+    def snapshot(self) -> Dict:
+        elapsed = self.last_seen - self.first_seen
+        return {
+            'calls': self.calls,
+            'items': self.items,
+            'bytes': self.bytes,
+            'consumed_units': round(self.consumed_units, 1),
+            'throttles': self.throttles,
+            'items_per_second': round(self.items / elapsed, 1) if elapsed > 0 else None,
+            'bytes_per_second': round(self.bytes / elapsed, 1) if elapsed > 0 else None
+        }
+
+
+class CopyMetrics:
+    """Thread-safe metrics registry shared by every copy in a run"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+        # (op, source, target, segment) -> counters; segment None is the per-table roll-up
+        self._counters: Dict[Tuple[str, str, str, Optional[int]], _Counters] = {}
+        # (op, source, target) -> latency histogram
+        self._latency: Dict[Tuple[str, str, str], LatencyHistogram] = {}
+
+    def _record(self, op: str, source: str, target: str, segment: int, latency: float,
+                items: int, size_bytes: int, consumed: Optional[float], throttled: bool):
+        now = time.monotonic()
+        with self._lock:
+            for key in ((op, source, target, segment), (op, source, target, None)):
+                counters = self._counters.get(key)
+                if counters is None:
+                    counters = self._counters[key] = _Counters(now - latency)
+                counters.calls += 1
+                counters.items += items
+                counters.bytes += size_bytes
+                counters.consumed_units += consumed or 0.0
+                counters.throttles += 1 if throttled else 0
+                counters.last_seen = now
+
+            histogram = self._latency.get((op, source, target))
+            if histogram is None:
+                histogram = self._latency[(op, source, target)] = LatencyHistogram()
+            histogram.observe(latency)
+
+    def record_scan(self, source: str, segment: int, latency: float, items: int,
+                    size_bytes: int, consumed: Optional[float], throttled: bool = False):
+        """One Scan call against a source table"""
+        self._record('scan', source, '', segment, latency, items, size_bytes, consumed, throttled)
+
+    def record_write(self, source: str, target: str, segment: int, latency: float, items: int,
+                     size_bytes: int, consumed: Optional[float], throttled: bool = False):
+        """One BatchWriteItem call against a target table"""
+        self._record('write', source, target, segment, latency, items, size_bytes, consumed, throttled)
+
+    def snapshot(self) -> Dict:
+        """Nested per-table view: scan and per-target write figures, each with segments"""
+        with self._lock:
+            tables: Dict[str, Dict] = {}
+            for (op, source, target, segment), counters in sorted(
+                    self._counters.items(), key=lambda kv: (kv[0][:3], -1 if kv[0][3] is None else kv[0][3])):
+                table = tables.setdefault(source, {'scan': {}, 'targets': {}})
+                series = table['scan'] if op == 'scan' else table['targets'].setdefault(target, {})
+                if segment is None:
+                    series.update(counters.snapshot())
+                    series['latency'] = self._latency[(op, source, target)].snapshot()
+                    if op == 'scan':
+                        series['consumed_rcu'] = series.pop('consumed_units')
+                    else:
+                        series['consumed_wcu'] = series.pop('consumed_units')
+                else:
+                    series.setdefault('segments', {})[str(segment)] = counters.snapshot()
+
+            return {
+                'elapsed_seconds': round(time.monotonic() - self.started, 1),
+                'tables': tables
+            }
+
+    def prometheus_text(self) -> str:
+        """Render every series in the Prometheus text exposition format"""
+        lines = []
+
+        def labels(op, source, target, segment=None):
+            parts = [f'op="{op}"', f'table="{source}"']
+            if target:
+                parts.append(f'target="{target}"')
+            if segment is not None:
+                parts.append(f'segment="{segment}"')
+            return '{' + ','.join(parts) + '}'
+
+        with self._lock:
+            counter_metrics = (
+                ('dynamodb_copy_calls_total', 'API calls made', 'calls'),
+                ('dynamodb_copy_items_total', 'Items scanned or written', 'items'),
+                ('dynamodb_copy_bytes_total', 'Approximate item bytes scanned or written', 'bytes'),
+                ('dynamodb_copy_consumed_capacity_units_total', 'Consumed RCU (scan) or WCU (write)', 'consumed_units'),
+                ('dynamodb_copy_throttles_total', 'Throttled calls', 'throttles'),
+            )
+            # Per-segment series get their own names so summing a metric never counts an item twice
+            series = sorted(self._counters.items(), key=lambda kv: (kv[0][:3], -1 if kv[0][3] is None else kv[0][3]))
+            for name, help_text, attr in counter_metrics:
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} counter')
+                for (op, source, target, segment), counters in series:
+                    if segment is None:
+                        lines.append(f'{name}{labels(op, source, target)} {getattr(counters, attr)}')
+                segment_name = name.replace('dynamodb_copy_', 'dynamodb_copy_segment_', 1)
+                lines.append(f'# HELP {segment_name} {help_text}, per scan segment')
+                lines.append(f'# TYPE {segment_name} counter')
+                for (op, source, target, segment), counters in series:
+                    if segment is not None:
+                        lines.append(f'{segment_name}{labels(op, source, target, segment)} {getattr(counters, attr)}')
+
+            name = 'dynamodb_copy_items_per_second'
+            lines.append(f'# HELP {name} Items per second over the life of the series')
+            lines.append(f'# TYPE {name} gauge')
+            for (op, source, target, segment), counters in series:
+                if segment is None:
+                    rate = counters.snapshot()['items_per_second'] or 0
+                    lines.append(f'{name}{labels(op, source, target)} {rate}')
+
+            name = 'dynamodb_copy_request_duration_seconds'
+            lines.append(f'# HELP {name} Scan and BatchWriteItem call latency')
+            lines.append(f'# TYPE {name} histogram')
+            for (op, source, target), histogram in sorted(self._latency.items()):
+                base = labels(op, source, target)[:-1]
+                cumulative = 0
+                for bound, bucket_count in zip(LATENCY_BUCKETS, histogram.counts):
+                    cumulative += bucket_count
+                    lines.append(f'{name}_bucket{base},le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{base},le="+Inf"}} {histogram.count}')
+                lines.append(f'{name}_sum{labels(op, source, target)} {histogram.sum:.6f}')
+                lines.append(f'{name}_count{labels(op, source, target)} {histogram.count}')
+
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path: Path):
+        """Atomically rewrite a Prometheus textfile"""
+        path = Path(path)
+        tmp_path = path.with_name(path.name + '.tmp')
+        with open(tmp_path, 'w') as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+
+class MetricsReporter:
+    """Background thread that emits metrics every interval and once more on stop"""
+
+    def __init__(self, metrics: CopyMetrics, emit: Callable[[Dict], None],
+                 prometheus_file: Optional[Path] = None,
+                 interval: float = DEFAULT_METRICS_INTERVAL_SECONDS):
+        self.metrics = metrics
+        self.emit = emit
+        self.prometheus_file = prometheus_file
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='metrics-reporter', daemon=True)
+
+    def _report(self):
+        self.emit(self.metrics.snapshot())
+        if self.prometheus_file:
+            self.metrics.write_prometheus(self.prometheus_file)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self._report()
+            except Exception as e:
+                print(f"Warning: Could not write metrics: {e}")
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self._report()
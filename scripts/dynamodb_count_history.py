@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Time series of DynamoDB table counts and sizes
+
+get-all-table-counts.py overwrites its JSON report on every run; this
+module also appends each run to a local SQLite file, one sample per table
+and environment, so the history can be queried:
+
+- growth: items and bytes per day, the least-squares slope of a table's
+  samples over a window
+- drift: how far each environment's copy is from the -dev table, and how
+  fast that gap is changing
+- projection: a table's count and size some days ahead at its growth rate
+
+The newest sample of a table is also a size estimate: the copy scheduler
+and the segment planner can read it instead of calling describe_table for
+every table before a run.
+"""
+
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from dynamodb_exact_count import EXACT
+
+DEFAULT_HISTORY_FILE = 'table-counts-history.sqlite'
+
+# Size estimates older than this are not used; TableSizeBytes itself lags by up to six hours
+DEFAULT_MAX_SIZE_AGE_SECONDS = 24 * 3600
+
+# Samples a growth rate is fitted to
+DEFAULT_GROWTH_WINDOW_DAYS = 30
+
+# Environment every other one is compared against
+SOURCE_ENV = 'dev'
+
+SECONDS_PER_DAY = 86400
+
+
+def sample_time(recorded_at: float) -> str:
+    return datetime.fromtimestamp(recorded_at, timezone.utc).isoformat(timespec='seconds')
+
+
+def fit_slope(points: List[tuple]) -> float:
+    """Least-squares slope of (x, y) points"""
+    n = len(points)
+    mean_x = sum(x for x, _ in points) / n
+    mean_y = sum(y for _, y in points) / n
+    spread = sum((x - mean_x) ** 2 for x, _ in points)
+    if not spread:
+        return 0.0
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / spread
+
+
+class TableCountHistory:
+    """SQLite store of every counts run, one row per table and environment"""
+
+    def __init__(self, path: Path = DEFAULT_HISTORY_FILE, max_size_age_seconds: float = DEFAULT_MAX_SIZE_AGE_SECONDS):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_size_age_seconds = max_size_age_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS runs (
+                id INTEGER PRIMARY KEY,
+                recorded_at REAL NOT NULL,
+                region TEXT NOT NULL,
+                exact INTEGER NOT NULL
+            )
+        ''')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS samples (
+                run_id INTEGER NOT NULL REFERENCES runs (id),
+                recorded_at REAL NOT NULL,
+                region TEXT NOT NULL,
+                table_name TEXT NOT NULL,
+                base_name TEXT NOT NULL,
+                env TEXT NOT NULL,
+                item_count INTEGER NOT NULL,
+                approximate_count INTEGER,
+                exact_status TEXT,
+                size_bytes INTEGER,
+                status TEXT
+            )
+        ''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS samples_by_table ON samples (region, table_name, recorded_at)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS samples_by_base ON samples (region, base_name, env, recorded_at)')
+        self._conn.commit()
+
+    def record_run(self, table_data: Dict[str, Dict[str, Dict]], region: str,
+                   recorded_at: Optional[float] = None) -> int:
+        """Append one get_all_table_counts result; exact counts are used where they finished"""
+        recorded_at = time.time() if recorded_at is None else recorded_at
+        rows = []
+        exact_run = False
+        for base_name, by_env in table_data.items():
+            for env, entry in by_env.items():
+                exact = entry.get('exact')
+                exact_run = exact_run or bool(exact)
+                count = exact['count'] if exact and exact['status'] == EXACT else entry.get('count', 0)
+                rows.append((recorded_at, region, entry['full_name'], base_name, env, count, entry.get('count'),
+                             exact['status'] if exact else None, entry.get('size_bytes'), entry.get('status')))
+        with self._lock:
+            run_id = self._conn.execute('INSERT INTO runs (recorded_at, region, exact) VALUES (?, ?, ?)',
+                                        (recorded_at, region, int(exact_run))).lastrowid
+            self._conn.executemany('''
+                INSERT INTO samples (run_id, recorded_at, region, table_name, base_name, env, item_count,
+                                     approximate_count, exact_status, size_bytes, status)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', [(run_id,) + row for row in rows])
+            self._conn.commit()
+        return run_id
+
+    def latest(self, table_name: str, region: str = 'us-east-2') -> Optional[Dict]:
+        """Newest sample of a table"""
+        with self._lock:
+            row = self._conn.execute('''
+                SELECT recorded_at, item_count, size_bytes FROM samples
+                WHERE region = ? AND table_name = ? ORDER BY recorded_at DESC LIMIT 1
+            ''', (region, table_name)).fetchone()
+        if not row:
+            return None
+        return {'recorded_at': row[0], 'item_count': row[1], 'size_bytes': row[2]}
+
+    def size_bytes(self, table_name: str, region: str = 'us-east-2') -> Optional[int]:
+        """Recorded TableSizeBytes if a sample is newer than max_size_age_seconds, else None
+
+        A recorded size of 0 is not trusted either: the table may have been
+        filled since, and describing it costs one call.
+        """
+        sample = self.latest(table_name, region)
+        if not sample or not sample['size_bytes']:
+            return None
+        if time.time() - sample['recorded_at'] > self.max_size_age_seconds:
+            return None
+        return sample['size_bytes']
+
+    def series(self, table_name: str, region: str = 'us-east-2', since: Optional[float] = None) -> List[Dict]:
+        """Samples of a table, oldest first"""
+        with self._lock:
+            rows = self._conn.execute('''
+                SELECT recorded_at, item_count, size_bytes FROM samples
+                WHERE region = ? AND table_name = ? AND recorded_at >= ? ORDER BY recorded_at
+            ''', (region, table_name, since or 0)).fetchall()
+        return [{'recorded_at': r[0], 'item_count': r[1], 'size_bytes': r[2] or 0} for r in rows]
+
+    def growth_rate(self, table_name: str, region: str = 'us-east-2',
+                    window_days: float = DEFAULT_GROWTH_WINDOW_DAYS) -> Optional[Dict]:
+        """Items and bytes per day over the window before the newest sample; None with under two samples"""
+        sample = self.latest(table_name, region)
+        if not sample:
+            return None
+        samples = self.series(table_name, region, since=sample['recorded_at'] - window_days * SECONDS_PER_DAY)
+        span = samples[-1]['recorded_at'] - samples[0]['recorded_at']
+        if len(samples) < 2 or span <= 0:
+            return None
+        days = [(s['recorded_at'] - samples[0]['recorded_at']) / SECONDS_PER_DAY for s in samples]
+        return {
+            'table': table_name,
+            'samples': len(samples),
+            'span_days': span / SECONDS_PER_DAY,
+            'item_count': samples[-1]['item_count'],
+            'size_bytes': samples[-1]['size_bytes'],
+            'items_per_day': fit_slope([(d, s['item_count']) for d, s in zip(days, samples)]),
+            'bytes_per_day': fit_slope([(d, s['size_bytes']) for d, s in zip(days, samples)]),
+            'recorded_at': sample_time(samples[-1]['recorded_at'])
+        }
+
+    def projection(self, table_name: str, days_ahead: float, region: str = 'us-east-2',
+                   window_days: float = DEFAULT_GROWTH_WINDOW_DAYS) -> Optional[Dict]:
+        """Count and size days_ahead after the newest sample, growing at the fitted rate"""
+        growth = self.growth_rate(table_name, region, window_days)
+        if not growth:
+            return None
+        return {
+            **growth,
+            'days_ahead': days_ahead,
+            'projected_items': max(0, round(growth['item_count'] + growth['items_per_day'] * days_ahead)),
+            'projected_bytes': max(0, round(growth['size_bytes'] + growth['bytes_per_day'] * days_ahead))
+        }
+
+    def tables(self, region: str = 'us-east-2') -> List[Dict]:
+        """Every (table, base name, environment) ever recorded in the region"""
+        with self._lock:
+            rows = self._conn.execute('''
+                SELECT DISTINCT table_name, base_name, env FROM samples WHERE region = ? ORDER BY base_name, env
+            ''', (region,)).fetchall()
+        return [{'table': r[0], 'base_name': r[1], 'env': r[2]} for r in rows]
+
+    def drift(self, region: str = 'us-east-2', window_days: float = DEFAULT_GROWTH_WINDOW_DAYS) -> List[Dict]:
+        """Per table and non-dev environment: newest count against the newest dev count
+
+        difference_per_day is how fast the gap grows (positive: the copy
+        gains on dev), from the two tables' growth rates.
+        """
+        by_base = {}
+        for entry in self.tables(region):
+            by_base.setdefault(entry['base_name'], {})[entry['env']] = entry['table']
+
+        results = []
+        for base_name, by_env in sorted(by_base.items()):
+            source_table = by_env.get(SOURCE_ENV)
+            if not source_table:
+                continue
+            source = self.latest(source_table, region)
+            source_growth = self.growth_rate(source_table, region, window_days)
+            for env, table_name in sorted(by_env.items()):
+                if env == SOURCE_ENV:
+                    continue
+                copy = self.latest(table_name, region)
+                growth = self.growth_rate(table_name, region, window_days)
+                results.append({
+                    'base_name': base_name,
+                    'env': env,
+                    'count': copy['item_count'],
+                    'dev_count': source['item_count'],
+                    'difference': copy['item_count'] - source['item_count'],
+                    'ratio': copy['item_count'] / source['item_count'] if source['item_count'] else None,
+                    'difference_per_day': (growth['items_per_day'] - source_growth['items_per_day']
+                                           if growth and source_growth else None),
+                    'recorded_at': sample_time(copy['recorded_at']),
+                    'dev_recorded_at': sample_time(source['recorded_at'])
+                })
+        return results
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Delta-sync digest index for DynamoDB table copies
+
+Keeps a local SQLite file per target table that maps every primary key
+written to that target to a hash of the item's content. A refresh run only
+writes items whose hash changed, and can delete target items whose keys
+were not seen in the source during a complete sync.
+
+Each sync is a generation. Every item seen in the source is stamped with
+the current generation, so once a full scan has finished, rows with an
+older generation are exactly the items missing from the source. An
+interrupted sync keeps its generation, so resumed scans carry on with it.
+"""
+
+import base64
+import hashlib
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from boto3.dynamodb.types import TypeSerializer
+
+# SQLite's default limit on bound parameters is 999
+LOOKUP_CHUNK = 500
+
+_serializer = TypeSerializer()
+
+
+def canonical_attr(attr):
+    """JSON-safe, order-independent form of a wire-format AttributeValue"""
+    (kind, value), = attr.items()
+    if kind == 'B':
+        return {'B': base64.b64encode(bytes(value)).decode('ascii')}
+    if kind == 'BS':
+        return {'BS': sorted(base64.b64encode(bytes(v)).decode('ascii') for v in value)}
+    if kind in ('SS', 'NS'):
+        return {kind: sorted(value)}
+    if kind == 'M':
+        return {'M': {k: canonical_attr(v) for k, v in value.items()}}
+    if kind == 'L':
+        return {'L': [canonical_attr(v) for v in value]}
+    return {kind: value}
+
+
+def to_wire(item: Dict, raw: bool) -> Dict:
+    """Item in DynamoDB wire format"""
+    if raw:
+        return item
+    return {name: _serializer.serialize(value) for name, value in item.items()}
+
+
+def item_digest(wire_item: Dict) -> bytes:
+    """Content hash of a wire-format item"""
+    canonical = {name: canonical_attr(attr) for name, attr in wire_item.items()}
+    encoded = json.dumps(canonical, sort_keys=True, separators=(',', ':'))
+    return hashlib.blake2b(encoded.encode('utf-8'), digest_size=16).digest()
+
+
+def key_text(wire_item: Dict, key_names: List[str]) -> str:
+    """Stable text form of an item's primary key, readable by engine.decode_key"""
+    key = {name: canonical_attr(wire_item[name]) for name in key_names}
+    return json.dumps(key, sort_keys=True, separators=(',', ':'))
+
+
+class DigestIndex:
+    """SQLite map of primary key -> content digest for one target table"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS digests (
+                pk TEXT PRIMARY KEY,
+                digest BLOB NOT NULL,
+                generation INTEGER NOT NULL
+            )
+        ''')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        self._conn.commit()
+
+        generation = int(self._get_meta('generation') or 0)
+        if self._get_meta('in_progress') != '1':
+            # Start a new sync; an interrupted one keeps its generation
+            generation += 1
+            self._set_meta('generation', str(generation))
+            self._set_meta('in_progress', '1')
+            self._conn.commit()
+        self.generation = generation
+
+    def _get_meta(self, key: str) -> Optional[str]:
+        row = self._conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: str):
+        self._conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+
+    def lookup(self, keys: List[str]) -> Dict[str, bytes]:
+        """Stored digests for the given keys"""
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), LOOKUP_CHUNK):
+                chunk = keys[i:i + LOOKUP_CHUNK]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self._conn.execute(
+                    f'SELECT pk, digest FROM digests WHERE pk IN ({placeholders})', chunk)
+                found.update(rows)
+        return found
+
+    def record(self, entries: List[tuple]):
+        """Store (key, digest) pairs as seen in the current generation"""
+        with self._lock:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO digests (pk, digest, generation) VALUES (?, ?, ?)',
+                [(pk, digest, self.generation) for pk, digest in entries]
+            )
+            self._conn.commit()
+
+    def stale_keys(self) -> Iterator[str]:
+        """Keys not seen in the current generation"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT pk FROM digests WHERE generation < ?', (self.generation,)).fetchall()
+        return (row[0] for row in rows)
+
+    def remove(self, keys: List[str]):
+        with self._lock:
+            self._conn.executemany('DELETE FROM digests WHERE pk = ?', [(pk,) for pk in keys])
+            self._conn.commit()
+
+    def complete(self):
+        """Mark the current generation's sync as finished"""
+        with self._lock:
+            self._set_meta('in_progress', '0')
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class DeltaSync:
+    """Write filter for ParallelTableCopy that skips unchanged items
+
+    changed_items() runs before a page is written to a target and returns
+    only new or changed items; mark_written() runs once the page is flushed
+    and records every item of the page as seen, so nothing is marked synced
+    before it is really in the target.
+    """
+
+    def __init__(self, digest_dir: Path, target_tables: List[str], key_names: List[str], raw: bool = False):
+        self.key_names = list(key_names)
+        self.raw = raw
+        self.indexes = {
+            target: DigestIndex(Path(digest_dir) / f'{target}.sqlite')
+            for target in target_tables
+        }
+
+    def _entries(self, items: List[Dict]) -> List[tuple]:
+        entries = []
+        for item in items:
+            wire = to_wire(item, self.raw)
+            entries.append((key_text(wire, self.key_names), item_digest(wire)))
+        return entries
+
+    def changed_items(self, target_table: str, items: List[Dict]) -> List[Dict]:
+        """Items whose content differs from what was last written to the target"""
+        if not items:
+            return []
+        entries = self._entries(items)
+        stored = self.indexes[target_table].lookup([pk for pk, _ in entries])
+        return [item for item, (pk, digest) in zip(items, entries) if stored.get(pk) != digest]
+
+    def mark_written(self, target_table: str, items: List[Dict]):
+        """Record items as present in the target for the current generation"""
+        if items:
+            self.indexes[target_table].record(self._entries(items))
+
+    def stale_keys(self, target_table: str) -> List[Dict]:
+        """Wire-format keys of target items that were not in the source this sync"""
+        return [json.loads(pk) for pk in self.indexes[target_table].stale_keys()]
+
+    def forget(self, target_table: str, keys: List[Dict]):
+        """Drop deleted keys from the index"""
+        self.indexes[target_table].remove(
+            [json.dumps(key, sort_keys=True, separators=(',', ':')) for key in keys])
+
+    def complete(self, target_table: str):
+        self.indexes[target_table].complete()
+
+    def close(self):
+        for index in self.indexes.values():
+            index.close()
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Exact item counts with parallel-segment COUNT scans
+
+describe_table's ItemCount is refreshed only about every six hours, so
+right after a copy it disagrees with the source even when every item is
+there. A Scan with Select='COUNT' returns no items, only how many each
+page held, and split into segments it counts a large table in the time
+of a fraction of it. Reads are paced per table by an adaptive rate
+controller and, optionally, by one capacity budget shared by every table
+being counted; a table that is still counting at its deadline reports
+the partial count as a lower bound.
+
+Results are cached in a JSON file with the time they were taken, so
+running the report again soon after does not scan the tables again.
+"""
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+import boto3
+
+from dynamodb_copy_engine import DEFAULT_MAX_SEGMENTS, auto_segment_count
+from dynamodb_retry import RetryPolicy
+from dynamodb_throttle import (
+    DEFAULT_INITIAL_READ_RATE,
+    AdaptiveRateController,
+    consumed_units,
+    is_throttle_error,
+)
+
+DEFAULT_CACHE_FILE = 'table-counts-exact-cache.json'
+
+# Cached counts younger than this are reused
+DEFAULT_MAX_AGE_SECONDS = 3600
+
+# A table still counting after this reports a lower bound
+DEFAULT_TABLE_TIMEOUT_SECONDS = 600
+
+# Tables counted at once; each runs its own segments
+DEFAULT_PARALLEL_TABLES = 4
+
+EXACT = 'exact'
+TIMEOUT = 'timeout'
+ERROR = 'error'
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class ExactCountCache:
+    """Exact counts by table name, each with the time it was taken"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.entries: Dict[str, Dict] = {}
+        if self.path.exists():
+            with open(self.path) as f:
+                self.entries = json.load(f)
+
+    def get(self, table_name: str, max_age_seconds: float) -> Optional[Dict]:
+        """A finished count of the table taken within max_age_seconds, if any"""
+        with self._lock:
+            entry = self.entries.get(table_name)
+        if not entry or entry.get('status') != EXACT:
+            return None
+        age = (_now() - datetime.fromisoformat(entry['counted_at'])).total_seconds()
+        if age > max_age_seconds:
+            return None
+        return dict(entry, cached=True, age_seconds=round(age))
+
+    def put(self, result: Dict):
+        with self._lock:
+            self.entries[result['table']] = {k: v for k, v in result.items() if k not in ('cached', 'age_seconds')}
+
+    def save(self):
+        with self._lock:
+            tmp = self.path.with_name(self.path.name + '.tmp')
+            with open(tmp, 'w') as f:
+                json.dump(self.entries, f, indent=2, sort_keys=True)
+            os.replace(tmp, self.path)
+
+
+def count_table(region: str, table_name: str, total_segments: int = 1,
+                timeout: float = DEFAULT_TABLE_TIMEOUT_SECONDS,
+                budget: Optional[AdaptiveRateController] = None,
+                retry_policy: Optional[RetryPolicy] = None) -> Dict:
+    """Count a table's items with a segmented Select='COUNT' scan"""
+    retry_policy = retry_policy or RetryPolicy()
+    controller = AdaptiveRateController(table_name, DEFAULT_INITIAL_READ_RATE,
+                                        max_rate=budget.max_rate if budget else None)
+    total_segments = max(1, total_segments)
+    deadline = time.monotonic() + timeout
+    stop_event = threading.Event()
+    counts = [0] * total_segments
+
+    def count_segment(segment: int) -> bool:
+        # boto3 clients are created per thread from their own session
+        client = boto3.session.Session().client('dynamodb', region_name=region)
+        scan_kwargs = {'TableName': table_name, 'Select': 'COUNT', 'ReturnConsumedCapacity': 'TOTAL'}
+        if total_segments > 1:
+            scan_kwargs['Segment'] = segment
+            scan_kwargs['TotalSegments'] = total_segments
+
+        read_estimate = 1.0
+        while not stop_event.is_set() and time.monotonic() < deadline:
+            controller.acquire(read_estimate)
+            if budget:
+                budget.acquire(read_estimate)
+            try:
+                response = retry_policy.call_except_throttles(client.scan, **scan_kwargs)
+            except Exception as e:
+                if not is_throttle_error(e):
+                    raise
+                controller.record_throttle()
+                continue
+
+            consumed = consumed_units(response)
+            controller.record_consumed(read_estimate, consumed)
+            if budget:
+                budget.record_consumed(read_estimate, consumed)
+            controller.record_success()
+            if consumed is not None:
+                read_estimate = max(1.0, consumed)
+
+            counts[segment] += response.get('Count', 0)
+            if 'LastEvaluatedKey' not in response:
+                return True
+            scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        return False
+
+    started = time.monotonic()
+    status, error = EXACT, None
+    with ThreadPoolExecutor(max_workers=total_segments) as pool:
+        futures = [pool.submit(count_segment, segment) for segment in range(total_segments)]
+        for future in futures:
+            try:
+                if not future.result():
+                    status = status if status == ERROR else TIMEOUT
+            except Exception as e:
+                stop_event.set()
+                status, error = ERROR, str(e)
+
+    result = {
+        'table': table_name,
+        'count': sum(counts),
+        'status': status,
+        'segments': total_segments,
+        'elapsed_seconds': round(time.monotonic() - started, 1),
+        'consumed_units': controller.snapshot()['consumed_units'],
+        'counted_at': _now().isoformat()
+    }
+    if error:
+        result['error'] = error
+    return result
+
+
+def count_tables(region: str, table_sizes: Dict[str, int],
+                 max_read_units: Optional[float] = None,
+                 timeout: float = DEFAULT_TABLE_TIMEOUT_SECONDS,
+                 parallel_tables: int = DEFAULT_PARALLEL_TABLES,
+                 max_segments: int = DEFAULT_MAX_SEGMENTS,
+                 cache: Optional[ExactCountCache] = None,
+                 max_age_seconds: float = DEFAULT_MAX_AGE_SECONDS,
+                 on_result: Optional[Callable[[Dict], None]] = None) -> Dict[str, Dict]:
+    """Exact count of every table, keyed by name; table_sizes gives TableSizeBytes for segmenting
+
+    max_read_units caps the read capacity per second spent by all tables together.
+    """
+    # A fixed-rate bucket: it is never told about throttles, so it only enforces the ceiling
+    budget = AdaptiveRateController('exact-count budget', max_read_units, max_rate=max_read_units,
+                                    increase_step=0) if max_read_units else None
+    results: Dict[str, Dict] = {}
+    lock = threading.Lock()
+
+    def count(table_name):
+        result = cache.get(table_name, max_age_seconds) if cache else None
+        if result is None:
+            segments = auto_segment_count(table_sizes.get(table_name, 0), max_segments)
+            result = count_table(region, table_name, segments, timeout, budget)
+            if cache and result['status'] == EXACT:
+                cache.put(result)
+        with lock:
+            results[table_name] = result
+        if on_result:
+            on_result(result)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(parallel_tables, len(table_sizes)))) as pool:
+            for future in [pool.submit(count, name) for name in sorted(table_sizes)]:
+                future.result()
+    finally:
+        if cache:
+            cache.save()
+    return results
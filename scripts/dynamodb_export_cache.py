@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Local on-disk cache of S3 export data files
+
+Export objects never change once written, so a file is stored under its
+S3 ETag and any later import of the same export (another environment,
+a rerun) reads it from local disk instead of S3. A miss streams from S3
+as usual while teeing the bytes into the cache; the entry only appears
+once the whole object has been read.
+
+The cache is capped in bytes. Reading an entry touches its mtime, and
+when a new entry pushes the total over the cap the least recently used
+entries are removed. Several threads and processes can share one
+directory: entries are written to a temporary name and renamed into
+place.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+DEFAULT_CACHE_DIR = Path.home() / '.cache' / 'bebco-dynamodb-exports'
+DEFAULT_CACHE_MAX_BYTES = 50 * 1024 ** 3
+
+# Age after which an unfinished download is assumed abandoned
+STALE_PARTIAL_SECONDS = 6 * 3600
+
+_SUFFIX = '.gz'
+
+
+def _entry_name(etag: str) -> str:
+    # Multipart ETags ("<md5>-<parts>") are safe file names once unquoted
+    etag = etag.strip('"')
+    if all(c.isalnum() or c == '-' for c in etag):
+        return etag + _SUFFIX
+    return hashlib.sha256(etag.encode()).hexdigest() + _SUFFIX
+
+
+class _TeeBody:
+    """File-like S3 body that copies what is read into a cache entry"""
+
+    def __init__(self, cache: 'ExportCache', body, entry: Path, size: Optional[int]):
+        self.cache = cache
+        self.body = body
+        self.entry = entry
+        self.size = size
+        self.written = 0
+        fd, tmp = tempfile.mkstemp(dir=entry.parent, prefix='.partial-')
+        self._tmp = Path(tmp)
+        self._file = os.fdopen(fd, 'wb')
+
+    def read(self, amt: Optional[int] = None) -> bytes:
+        data = self.body.read(amt)
+        if self._file is None:
+            return data
+        if data:
+            self._file.write(data)
+            self.written += len(data)
+        else:
+            self._commit()
+        return data
+
+    def _commit(self):
+        self._file.close()
+        self._file = None
+        if self.size is not None and self.written != self.size:
+            # Short read; leave nothing behind that looks complete
+            self._tmp.unlink(missing_ok=True)
+            return
+        os.replace(self._tmp, self.entry)
+        self.cache._added(self.entry, self.written)
+
+    def close(self):
+        if self._file is not None:
+            # Abandoned before the end of the object
+            self._file.close()
+            self._file = None
+            self._tmp.unlink(missing_ok=True)
+        self.body.close()
+
+    def __del__(self):
+        if getattr(self, '_file', None) is not None:
+            self._file.close()
+            self._tmp.unlink(missing_ok=True)
+
+
+class ExportCache:
+    """ETag-keyed cache of export objects with a size cap and LRU eviction"""
+
+    def __init__(self, root: Path = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_CACHE_MAX_BYTES):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        for stale in self.root.glob('.partial-*'):
+            # Left by a killed process; live downloads are much younger
+            try:
+                if time.time() - stale.stat().st_mtime > STALE_PARTIAL_SECONDS:
+                    stale.unlink()
+            except FileNotFoundError:
+                pass
+        self.hits = 0
+        self.misses = 0
+        self.bytes_from_cache = 0
+        self.bytes_from_s3 = 0
+        self.evicted = 0
+
+    def path_for(self, etag: str) -> Path:
+        return self.root / _entry_name(etag)
+
+    def open(self, s3_client, bucket: str, key: str, etag: Optional[str] = None,
+             size: Optional[int] = None):
+        """Readable body of an export object, from the cache when present
+
+        Without an ETag (from the listing) the object is HEADed for it.
+        """
+        if etag is None:
+            head = s3_client.head_object(Bucket=bucket, Key=key)
+            etag, size = head['ETag'], head['ContentLength']
+
+        entry = self.path_for(etag)
+        try:
+            f = open(entry, 'rb')
+        except FileNotFoundError:
+            f = None
+        if f is not None:
+            entry_size = os.fstat(f.fileno()).st_size
+            if size is None or entry_size == size:
+                try:
+                    os.utime(entry)
+                except FileNotFoundError:
+                    # Another process evicted it after the open; download it again
+                    pass
+                else:
+                    with self._lock:
+                        self.hits += 1
+                        self.bytes_from_cache += entry_size
+                    return f
+            f.close()
+
+        response = s3_client.get_object(Bucket=bucket, Key=key, IfMatch=etag)
+        size = response.get('ContentLength', size)
+        with self._lock:
+            self.misses += 1
+            self.bytes_from_s3 += size or 0
+        if self.max_bytes <= 0 or (size is not None and size > self.max_bytes):
+            return response['Body']
+        return _TeeBody(self, response['Body'], entry, size)
+
+    def _added(self, entry: Path, size: int):
+        with self._lock:
+            self._evict(keep=entry)
+
+    def _evict(self, keep: Path):
+        entries = []
+        total = 0
+        for item in os.scandir(self.root):
+            if not item.name.endswith(_SUFFIX) or not item.is_file():
+                continue
+            stat = item.stat()
+            entries.append((stat.st_mtime, stat.st_size, Path(item.path)))
+            total += stat.st_size
+
+        # Oldest access first
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                # Another process evicted it first
+                pass
+            total -= size
+            self.evicted += 1
+
+    def add_stats(self, stats: Dict):
+        """Fold in the stats of a copy of this cache used by another process"""
+        with self._lock:
+            self.hits += stats['hits']
+            self.misses += stats['misses']
+            self.bytes_from_cache += stats['bytes_from_cache']
+            self.bytes_from_s3 += stats['bytes_from_s3']
+            self.evicted += stats['evicted']
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'bytes_from_cache': self.bytes_from_cache,
+                'bytes_from_s3': self.bytes_from_s3,
+                'evicted': self.evicted
+            }
@@ -0,0 +1,790 @@
+#!/usr/bin/env python3
+"""
+Concurrent importer for DynamoDB S3 exports
+
+One bounded pool of file workers serves every table being imported. Each
+worker streams an export data file (.json.gz) straight into a batch
+writer, so all tables' files download and write at the same time.
+Per-table limits cap how many files write to one table at once, and
+every table gets one adaptive rate controller shared by its workers.
+
+Files are handed out from the table with the most bytes left, largest
+file first, so the biggest table starts early and the run finishes in
+about the time it takes to import that one table.
+
+The file list comes from the export's manifest-files.json, which also
+gives each file's item count to check the import against. An
+ImportJournal records finished files and how far into each unfinished
+file the flushed writes reached, so a restarted run skips work already
+done. With an ExportCache, files already downloaded by an earlier run
+are read from local disk.
+
+Parsing export lines and building write requests is CPU work that one
+process cannot spread across cores. With processes > 1 each file is
+imported start to finish inside a pool of worker processes, which send
+back only counts and failed items; scheduling, journaling of skipped
+files and dead-lettering stay in this process.
+
+With compaction on, a table is imported from its newest full export with
+the incremental exports taken after it layered on top (find_export_layers):
+a first pass over all those files finds the newest version of every
+primary key, and the import writes only those, deleting keys whose newest
+version is a delete (see dynamodb_compaction).
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import boto3
+
+from dynamodb_compaction import (
+    DEFAULT_MAX_MEMORY_KEYS,
+    CompactionFilter,
+    KeyVersionIndex,
+    file_key_versions,
+)
+from dynamodb_copy_engine import ThrottledBatchWriter
+from dynamodb_delta_sync import LOOKUP_CHUNK
+from dynamodb_export_cache import ExportCache
+from dynamodb_retry import DeadLetterFile, RetryPolicy
+from dynamodb_s3_export import INCREMENTAL_PREFIX, iter_export_writes, open_export_file
+from dynamodb_throttle import DEFAULT_INITIAL_WRITE_RATE, AdaptiveRateController
+
+# Downloads are network bound, so allow a few workers per core
+DEFAULT_FILE_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+# Files writing to the same table at once
+DEFAULT_TABLE_WRITERS = 4
+
+DEFAULT_PROGRESS_INTERVAL_SECONDS = 10
+
+# Items between journal entries for a file in progress
+JOURNAL_INTERVAL_ITEMS = 10000
+
+MANIFEST_FILES = 'manifest-files.json'
+MANIFEST_SUMMARY = 'manifest-summary.json'
+
+
+class ExportFile(NamedTuple):
+    """One export data file; item_count is known when it came from the manifest
+
+    export_time (epoch seconds) orders the layers of find_export_layers;
+    incremental files hold change records instead of items.
+    """
+    key: str
+    size: int
+    item_count: Optional[int] = None
+    etag: Optional[str] = None
+    last_modified: Optional[datetime] = None
+    export_time: Optional[float] = None
+    incremental: bool = False
+
+
+def _list_export_objects(s3_client, bucket: str, source_table: str, root: str = 'exports') -> List[Dict]:
+    paginator = s3_client.get_paginator('list_objects_v2')
+    pages = paginator.paginate(Bucket=bucket, Prefix=f"{root}/{source_table}/AWSDynamoDB/")
+    return [obj for page in pages for obj in page.get('Contents', [])]
+
+
+def list_export_files(s3_client, bucket: str, source_table: str) -> List[ExportFile]:
+    """Every .gz data file under exports/<source_table>/AWSDynamoDB/"""
+    return [
+        ExportFile(obj['Key'], obj['Size'], etag=obj.get('ETag'), last_modified=obj.get('LastModified'))
+        for obj in _list_export_objects(s3_client, bucket, source_table)
+        if obj['Key'].endswith('.gz') and '/data/' in obj['Key']
+    ]
+
+
+def read_export_manifest(s3_client, bucket: str, source_table: str) -> Optional[List[ExportFile]]:
+    """Data files and item counts from the newest export's manifest-files.json
+
+    Returns None when the prefix has no manifest.
+    """
+    objects = _list_export_objects(s3_client, bucket, source_table)
+    manifests = [obj for obj in objects if obj['Key'].endswith('/' + MANIFEST_FILES)]
+    if not manifests:
+        return None
+
+    # A prefix can hold several exports of the same table; use the newest
+    manifest = max(manifests, key=lambda obj: obj['LastModified'])
+    return _read_manifest_files(s3_client, bucket, manifest['Key'], {obj['Key']: obj for obj in objects})
+
+
+def _read_manifest_files(s3_client, bucket: str, manifest_key: str, listed: Dict[str, Dict]) -> List[ExportFile]:
+    body = s3_client.get_object(Bucket=bucket, Key=manifest_key)['Body'].read().decode('utf-8')
+    files = []
+    for line in body.splitlines():
+        if line.strip():
+            entry = json.loads(line)
+            key = entry['dataFileS3Key']
+            obj = listed.get(key, {})
+            files.append(ExportFile(key, obj.get('Size', 0), entry.get('itemCount'),
+                                    obj.get('ETag'), obj.get('LastModified')))
+    return files
+
+
+def _export_summary(s3_client, bucket: str, manifest: Dict) -> Tuple[float, Optional[float], bool]:
+    """(time the export is as of, start of an incremental window, incremental) from manifest-summary.json"""
+    summary_key = manifest['Key'].rsplit('/', 1)[0] + '/' + MANIFEST_SUMMARY
+    try:
+        summary = json.loads(s3_client.get_object(Bucket=bucket, Key=summary_key)['Body'].read())
+    except s3_client.exceptions.NoSuchKey:
+        return manifest['LastModified'].timestamp(), None, False
+
+    def parse(value):
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp() if value else None
+
+    incremental = summary.get('exportType') == 'INCREMENTAL_EXPORT'
+    as_of = parse(summary.get('exportToTime') if incremental else summary.get('exportTime'))
+    return as_of or manifest['LastModified'].timestamp(), parse(summary.get('exportFromTime')), incremental
+
+
+def find_export_layers(s3_client, bucket: str, source_table: str) -> Optional[List[ExportFile]]:
+    """Data files of the newest full export and of every incremental export that ends after it
+
+    Incremental exports come from incremental-exports/<source_table>/.
+    Every file carries its export's time, so the last writer of each key
+    is the newest state of that key. None when there is no full export
+    with a manifest.
+    """
+    objects = _list_export_objects(s3_client, bucket, source_table)
+    manifests = [obj for obj in objects if obj['Key'].endswith('/' + MANIFEST_FILES)]
+    if not manifests:
+        return None
+    full = max(manifests, key=lambda obj: obj['LastModified'])
+    full_time, _, _ = _export_summary(s3_client, bucket, full)
+    files = [f._replace(export_time=full_time)
+             for f in _read_manifest_files(s3_client, bucket, full['Key'], {obj['Key']: obj for obj in objects})]
+
+    objects = _list_export_objects(s3_client, bucket, source_table, root=INCREMENTAL_PREFIX)
+    listed = {obj['Key']: obj for obj in objects}
+    for manifest in (obj for obj in objects if obj['Key'].endswith('/' + MANIFEST_FILES)):
+        as_of, _, incremental = _export_summary(s3_client, bucket, manifest)
+        if not incremental or as_of <= full_time:
+            continue
+        files.extend(f._replace(export_time=as_of, incremental=True)
+                     for f in _read_manifest_files(s3_client, bucket, manifest['Key'], listed))
+    return files
+
+
+def export_files_in(s3_client, bucket: str, export_dir: str) -> List[ExportFile]:
+    """Data files of the one export in export_dir (.../AWSDynamoDB/<export id>), from its manifest"""
+    paginator = s3_client.get_paginator('list_objects_v2')
+    listed = {obj['Key']: obj for page in paginator.paginate(Bucket=bucket, Prefix=f"{export_dir}/data/")
+              for obj in page.get('Contents', [])}
+    return _read_manifest_files(s3_client, bucket, f"{export_dir}/{MANIFEST_FILES}", listed)
+
+
+def find_export_files(s3_client, bucket: str, source_table: str,
+                      layered: bool = False) -> Tuple[List[ExportFile], bool]:
+    """Export data files from the manifest, or from listing the prefix without one
+
+    layered=True adds the incremental exports after the full one, for
+    compaction (find_export_layers). The flag says whether the files came
+    from a manifest.
+    """
+    if layered:
+        files = find_export_layers(s3_client, bucket, source_table)
+    else:
+        files = read_export_manifest(s3_client, bucket, source_table)
+    if files is not None:
+        return files, True
+    return list_export_files(s3_client, bucket, source_table), False
+
+
+class ImportJournal:
+    """Append-only JSONL record of per-file import progress
+
+    Each line is {"target", "key", "items_done", "done"}; the last line for
+    a (target, key) pair wins. items_done counts export items whose writes
+    were flushed (or dead-lettered), so a resumed file skips exactly those.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._entries: Dict[Tuple[str, str], Dict] = {}
+        partial = False
+        if self.path.exists():
+            with open(self.path) as f:
+                for line in f:
+                    partial = not line.endswith('\n')
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A crash can leave a partial last line
+                        continue
+                    self._entries[(entry['target'], entry['key'])] = entry
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, 'a')
+        if partial:
+            # Keep the next entry off the partial line
+            self._file.write('\n')
+
+    def completed(self, target_table: str, key: str) -> Optional[Dict]:
+        entry = self._entries.get((target_table, key))
+        return entry if entry and entry['done'] else None
+
+    def offset(self, target_table: str, key: str) -> int:
+        """Items of the file already written"""
+        with self._lock:
+            entry = self._entries.get((target_table, key))
+        return entry['items_done'] if entry else 0
+
+    def record(self, target_table: str, key: str, items_done: int, done: bool = False):
+        entry = {
+            'target': target_table,
+            'key': key,
+            'items_done': items_done,
+            'done': done,
+            'timestamp': datetime.now().isoformat()
+        }
+        with self._lock:
+            self._entries[(target_table, key)] = entry
+            self._file.write(json.dumps(entry, separators=(',', ':')) + '\n')
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def import_export_file(s3, client, bucket: str, target_table: str, export_file: ExportFile,
+                       controller: AdaptiveRateController, retry_policy: RetryPolicy,
+                       on_failed: Callable[[List[Dict], str], None],
+                       journal: Optional[ImportJournal] = None,
+                       cache: Optional[ExportCache] = None,
+                       compaction: Optional[CompactionFilter] = None) -> Tuple[int, int, int, int, int, int]:
+    """Stream one export file into target_table
+
+    Returns (items written, failed items, bad lines, items skipped as
+    already written, items in the file, older versions not written).
+    An incremental file's deletes count as items written.
+    """
+    key = export_file.key
+    bad_lines = 0
+    failed = 0
+    items = 0
+    seen = 0
+    superseded = 0
+    pending: List[Tuple[int, Dict]] = []
+    deletes = set()
+    resume_at = journal.offset(target_table, key) if journal else 0
+
+    def on_bad_line(line, error):
+        nonlocal bad_lines
+        bad_lines += 1
+
+    def on_batch_failed(requests, error):
+        nonlocal failed
+        failed += len(requests)
+        on_failed(requests, error)
+
+    if cache:
+        body = cache.open(s3, bucket, key, export_file.etag, export_file.size)
+    else:
+        body = open_export_file(s3, bucket, key)
+    try:
+        with ThrottledBatchWriter(client, target_table, controller,
+                                  retry_policy=retry_policy, on_failed=on_batch_failed) as batch:
+            def put_pending():
+                nonlocal items, superseded
+                kept = compaction.newest(pending) if compaction else pending
+                for number, item in kept:
+                    if number in deletes:
+                        batch.delete_item(Key=item)
+                    else:
+                        batch.put_item(Item=item)
+                items += len(kept)
+                superseded += len(pending) - len(kept)
+                pending.clear()
+                deletes.clear()
+
+            for item, deleted in iter_export_writes(body, export_file.incremental, on_bad_line=on_bad_line):
+                seen += 1
+                if seen <= resume_at:
+                    continue
+                # Items go out in groups so compaction looks their keys up together
+                pending.append((seen, item))
+                if deleted:
+                    deletes.add(seen)
+                if len(pending) >= LOOKUP_CHUNK:
+                    put_pending()
+                if journal and seen % JOURNAL_INTERVAL_ITEMS == 0:
+                    # Journal only what is really written
+                    put_pending()
+                    batch.flush()
+                    journal.record(target_table, key, seen)
+            put_pending()
+    finally:
+        body.close()
+
+    if journal:
+        journal.record(target_table, key, seen, done=True)
+    return items - failed, failed, bad_lines, min(resume_at, seen), seen, superseded
+
+
+# Per-process state of import worker processes, set up by _init_import_process
+_process_state: Dict = {}
+
+
+def _init_import_process(region: str, bucket: str, max_write_units: Optional[float],
+                         retry_policy: RetryPolicy, journal_path: Optional[str],
+                         cache_root: Optional[str], cache_max_bytes: int):
+    session = boto3.session.Session()
+    _process_state.update(
+        s3=session.client('s3', region_name=region),
+        client=session.client('dynamodb', region_name=region),
+        bucket=bucket,
+        max_write_units=max_write_units,
+        retry_policy=retry_policy,
+        controllers={},
+        # Appends from several processes interleave whole lines
+        journal=ImportJournal(journal_path) if journal_path else None,
+        cache=ExportCache(cache_root, cache_max_bytes) if cache_root else None,
+        key_indexes={}
+    )
+
+
+def _import_file_in_process(target_table: str, export_file: ExportFile,
+                            compaction: Optional[Tuple[str, List[str], int]] = None) -> Tuple[Tuple, List, Optional[Dict]]:
+    """import_export_file in a worker process
+
+    Returns its counts, the failed writes as (item or key, error, is a
+    delete) and what the file did to the process's cache stats.
+    compaction is (spilled key index path, key names, file sequence
+    number).
+    """
+    state = _process_state
+    compaction_filter = None
+    if compaction:
+        index_path, key_names, file_seq = compaction
+        if index_path not in state['key_indexes']:
+            state['key_indexes'][index_path] = KeyVersionIndex.open_spilled(index_path)
+        compaction_filter = CompactionFilter(state['key_indexes'][index_path], key_names, file_seq)
+    cache = state['cache']
+    cache_before = cache.stats() if cache else None
+    controllers = state['controllers']
+    if target_table not in controllers:
+        controllers[target_table] = AdaptiveRateController(
+            target_table, DEFAULT_INITIAL_WRITE_RATE, max_rate=state['max_write_units'])
+    failed_items = []
+
+    def on_failed(requests, error):
+        for request in requests:
+            if 'PutRequest' in request:
+                failed_items.append((request['PutRequest']['Item'], str(error), False))
+            else:
+                failed_items.append((request['DeleteRequest']['Key'], str(error), True))
+
+    counts = import_export_file(state['s3'], state['client'], state['bucket'], target_table, export_file,
+                                controllers[target_table], state['retry_policy'], on_failed,
+                                journal=state['journal'], cache=cache, compaction=compaction_filter)
+    cache_stats = None
+    if cache:
+        cache_stats = {name: value - cache_before[name] for name, value in cache.stats().items()}
+    return counts, failed_items, cache_stats
+
+
+class ImportJob:
+    """One source export imported into one target table"""
+
+    def __init__(self, source_table: str, target_table: str, files: List[ExportFile]):
+        self.source_table = source_table
+        self.target_table = target_table
+        self.files = list(files)
+        # Oldest export first, for last-writer-wins compaction
+        self.file_seqs = {
+            f.key: seq for seq, f in enumerate(sorted(files, key=lambda f: (
+                f.export_time if f.export_time is not None else
+                f.last_modified.timestamp() if f.last_modified else 0.0, f.key)))
+        }
+        # Largest first; popped from the end
+        self.pending = sorted(files, key=lambda f: f.size)
+        self.total_files = len(files)
+        self.total_bytes = sum(f.size for f in files)
+        self.pending_bytes = self.total_bytes
+        self.active = 0
+        # Files imported (or skipped as already imported); failed files are counted apart
+        self.files_done = 0
+        self.bytes_done = 0
+        self.files_failed = 0
+        self.items = 0
+        self.items_failed = 0
+        self.items_resumed = 0
+        self.files_resumed = 0
+        self.duplicates_removed = 0
+        self.bad_lines = 0
+        self.failed_files: List[Dict] = []
+        self.count_mismatches: List[Dict] = []
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        return not self.pending and self.active == 0
+
+    def summary(self) -> Dict:
+        elapsed = None
+        if self.started_at:
+            elapsed = round((self.finished_at or time.monotonic()) - self.started_at, 1)
+        return {
+            'source': self.source_table,
+            'target': self.target_table,
+            'files': self.total_files,
+            'files_done': self.files_done,
+            'files_failed': self.files_failed,
+            'bytes': self.total_bytes,
+            'bytes_done': self.bytes_done,
+            'items_imported': self.items,
+            'items_failed': self.items_failed,
+            'items_resumed': self.items_resumed,
+            'files_resumed': self.files_resumed,
+            'duplicates_removed': self.duplicates_removed,
+            'bad_lines': self.bad_lines,
+            'failed_files': self.failed_files,
+            'count_mismatches': self.count_mismatches,
+            'active_files': self.active,
+            'elapsed_seconds': elapsed,
+            'complete': self.finished and not self.failed_files and not self.count_mismatches
+        }
+
+
+class ConcurrentImporter:
+    """Import several export jobs through one shared pool of file workers
+
+    Items stay in DynamoDB wire format and go to the low-level client's
+    BatchWriteItem. Write failures are retried with retry_policy and then
+    spilled to dead_letter; a file whose download keeps failing is
+    recorded in its job's failed_files. on_progress gets a progress()
+    snapshot every progress_interval seconds.
+
+    With a journal, files it marks done are skipped and partly imported
+    files resume after their last journaled item. Files with a manifest
+    item count that does not match the items read land in the job's
+    count_mismatches. With a cache, data files are read through it.
+
+    processes > 1 imports files in that many worker processes, one file
+    each at a time, instead of file_workers threads of this process.
+    Every process paces each table on its own, so max_write_units is
+    split between the processes that can write one table at once.
+
+    compact=True runs the last-writer-wins key pass before the import,
+    over jobs whose files come from find_export_layers; its index spills
+    to compact_dir beyond max_memory_keys keys per table.
+    """
+
+    def __init__(self, region: str, bucket: str, jobs: List[ImportJob],
+                 file_workers: int = DEFAULT_FILE_WORKERS,
+                 table_writers: int = DEFAULT_TABLE_WRITERS,
+                 max_write_units: Optional[float] = None,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 dead_letter: Optional[DeadLetterFile] = None,
+                 on_progress: Optional[Callable[[Dict], None]] = None,
+                 progress_interval: float = DEFAULT_PROGRESS_INTERVAL_SECONDS,
+                 journal: Optional[ImportJournal] = None,
+                 cache: Optional[ExportCache] = None,
+                 processes: int = 1,
+                 compact: bool = False,
+                 compact_dir: Optional[Path] = None,
+                 max_memory_keys: int = DEFAULT_MAX_MEMORY_KEYS):
+        self.region = region
+        self.bucket = bucket
+        self.jobs = list(jobs)
+        self.file_workers = max(1, file_workers)
+        self.table_writers = max(1, table_writers)
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.dead_letter = dead_letter
+        self.on_progress = on_progress
+        self.progress_interval = progress_interval
+        self.journal = journal
+        self.cache = cache
+        self.processes = max(1, processes)
+        self.max_write_units = max_write_units
+        self.process_pool: Optional[ProcessPoolExecutor] = None
+        self.compact = compact
+        self.compact_dir = Path(compact_dir) if compact_dir else None
+        self.max_memory_keys = max_memory_keys
+        self.key_indexes: Dict[str, KeyVersionIndex] = {}
+        self.key_names: Dict[str, List[str]] = {}
+        if journal:
+            self._skip_completed()
+
+        self.controllers = {
+            job.target_table: AdaptiveRateController(
+                job.target_table, DEFAULT_INITIAL_WRITE_RATE, max_rate=max_write_units)
+            for job in self.jobs
+        }
+        self.stop_event = threading.Event()
+        self._cond = threading.Condition()
+        self.started_at = None
+
+    def _skip_completed(self):
+        """Count files the journal marks done as finished without touching them"""
+        for job in self.jobs:
+            remaining = []
+            for export_file in job.pending:
+                entry = self.journal.completed(job.target_table, export_file.key)
+                if entry:
+                    job.files_done += 1
+                    job.files_resumed += 1
+                    job.bytes_done += export_file.size
+                    job.items_resumed += entry['items_done']
+                    job.pending_bytes -= export_file.size
+                else:
+                    remaining.append(export_file)
+            job.pending = remaining
+
+    def _next_file(self) -> Optional[Tuple[ImportJob, ExportFile]]:
+        """Block until some table has a free slot; None once nothing is left"""
+        with self._cond:
+            while True:
+                if self.stop_event.is_set():
+                    return None
+                open_jobs = [job for job in self.jobs if job.pending]
+                if not open_jobs:
+                    return None
+                ready = [job for job in open_jobs if job.active < self.table_writers]
+                if ready:
+                    job = max(ready, key=lambda j: j.pending_bytes)
+                    export_file = job.pending.pop()
+                    job.pending_bytes -= export_file.size
+                    job.active += 1
+                    if job.started_at is None:
+                        job.started_at = time.monotonic()
+                    return job, export_file
+                self._cond.wait()
+
+    def _spill(self, job: ImportJob, requests: List[Dict], error):
+        """Dead-letter failed put and delete requests"""
+        if self.dead_letter:
+            for request in requests:
+                if 'PutRequest' in request:
+                    self.dead_letter.add(job.target_table, request['PutRequest']['Item'], error,
+                                         raw=True, source=job.source_table)
+                else:
+                    self.dead_letter.add(job.target_table, request['DeleteRequest']['Key'], error,
+                                         raw=True, source=job.source_table, delete=True)
+
+    def _import_file(self, job: ImportJob, export_file: ExportFile, s3, client) -> Tuple[int, ...]:
+        def on_failed(requests, error):
+            self._spill(job, requests, error)
+
+        compaction = None
+        if job.target_table in self.key_indexes:
+            compaction = CompactionFilter(self.key_indexes[job.target_table], self.key_names[job.target_table],
+                                          job.file_seqs[export_file.key])
+        return import_export_file(s3, client, self.bucket, job.target_table, export_file,
+                                  self.controllers[job.target_table], self.retry_policy, on_failed,
+                                  journal=self.journal, cache=self.cache, compaction=compaction)
+
+    def _import_file_remote(self, job: ImportJob, export_file: ExportFile) -> Tuple[int, ...]:
+        compaction = None
+        if job.target_table in self.key_indexes:
+            compaction = (str(self.key_indexes[job.target_table].path), self.key_names[job.target_table],
+                          job.file_seqs[export_file.key])
+        counts, failed_items, cache_stats = self.process_pool.submit(
+            _import_file_in_process, job.target_table, export_file, compaction).result()
+        for attrs, error, delete in failed_items:
+            self._spill(job, [{'DeleteRequest': {'Key': attrs}} if delete else {'PutRequest': {'Item': attrs}}], error)
+        if cache_stats:
+            self.cache.add_stats(cache_stats)
+        return counts
+
+    def _start_process_pool(self):
+        # spawn: boto3 sessions and threads do not survive fork
+        writers_per_table = min(self.processes, self.table_writers)
+        self.process_pool = ProcessPoolExecutor(
+            max_workers=self.processes,
+            mp_context=get_context('spawn'),
+            initializer=_init_import_process,
+            initargs=(
+                self.region, self.bucket,
+                self.max_write_units / writers_per_table if self.max_write_units else None,
+                self.retry_policy,
+                str(self.journal.path) if self.journal else None,
+                str(self.cache.root) if self.cache else None,
+                self.cache.max_bytes if self.cache else 0
+            )
+        )
+
+    def _worker(self):
+        if self.process_pool:
+            # The file is imported in a worker process; this thread only waits for it
+            import_file = self._import_file_remote
+            clients = ()
+        else:
+            # boto3 clients are created per thread from their own session
+            session = boto3.session.Session()
+            import_file = self._import_file
+            clients = (session.client('s3', region_name=self.region),
+                       session.client('dynamodb', region_name=self.region))
+
+        while True:
+            work = self._next_file()
+            if work is None:
+                return
+            job, export_file = work
+            try:
+                # A dropped download restarts the file from its last journaled item
+                items, failed, bad_lines, resumed, seen, superseded = self.retry_policy.call(
+                    import_file, job, export_file, *clients)
+                error = None
+            except Exception as e:
+                items = failed = bad_lines = resumed = seen = superseded = 0
+                error = str(e)
+
+            with self._cond:
+                job.active -= 1
+                if error:
+                    job.files_failed += 1
+                else:
+                    job.files_done += 1
+                    job.bytes_done += export_file.size
+                job.items += items
+                job.items_failed += failed
+                job.items_resumed += resumed
+                job.duplicates_removed += superseded
+                job.bad_lines += bad_lines
+                if error:
+                    job.failed_files.append({'key': export_file.key, 'error': error})
+                elif export_file.item_count is not None and seen != export_file.item_count:
+                    job.count_mismatches.append({
+                        'key': export_file.key,
+                        'manifest_items': export_file.item_count,
+                        'items_read': seen
+                    })
+                if job.finished:
+                    job.finished_at = time.monotonic()
+                self._cond.notify_all()
+
+    def progress(self) -> Dict:
+        """Aggregated progress across all jobs"""
+        with self._cond:
+            jobs = [job.summary() for job in self.jobs]
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0.0
+        items = sum(j['items_imported'] for j in jobs)
+        return {
+            'elapsed_seconds': round(elapsed, 1),
+            'files': sum(j['files'] for j in jobs),
+            'files_done': sum(j['files_done'] for j in jobs),
+            'files_failed': sum(j['files_failed'] for j in jobs),
+            'bytes': sum(j['bytes'] for j in jobs),
+            'bytes_done': sum(j['bytes_done'] for j in jobs),
+            'items_imported': items,
+            'items_failed': sum(j['items_failed'] for j in jobs),
+            'items_resumed': sum(j['items_resumed'] for j in jobs),
+            'duplicates_removed': sum(j['duplicates_removed'] for j in jobs),
+            'items_per_second': round(items / elapsed, 1) if elapsed > 0 else 0.0,
+            'tables_done': sum(1 for j in jobs if j['files_done'] == j['files']),
+            'tables': len(jobs),
+            'cache': self.cache.stats() if self.cache else None,
+            'jobs': jobs
+        }
+
+    def _index_key_versions(self):
+        """First compaction pass: newest version of every key, per table"""
+        dynamodb = boto3.client('dynamodb', region_name=self.region)
+        work = []
+        for job in self.jobs:
+            if not job.pending:
+                continue
+            table = dynamodb.describe_table(TableName=job.target_table)['Table']
+            self.key_names[job.target_table] = [k['AttributeName'] for k in table['KeySchema']]
+            self.key_indexes[job.target_table] = KeyVersionIndex(
+                self.compact_dir / f"{job.target_table}.keys.sqlite", self.max_memory_keys)
+            # Files already imported still hold versions that later files can replace
+            work.extend((job, export_file) for export_file in job.files)
+
+        local = threading.local()
+
+        def index_file(job, export_file):
+            if not hasattr(local, 's3'):
+                local.s3 = boto3.session.Session().client('s3', region_name=self.region)
+            if self.cache:
+                # Also fills the cache for the import pass
+                body = self.cache.open(local.s3, self.bucket, export_file.key, export_file.etag, export_file.size)
+            else:
+                body = open_export_file(local.s3, self.bucket, export_file.key)
+            try:
+                versions, seen = file_key_versions(
+                    (item for item, _ in iter_export_writes(body, export_file.incremental)),
+                    self.key_names[job.target_table], job.file_seqs[export_file.key])
+            finally:
+                body.close()
+            self.key_indexes[job.target_table].add(versions, seen)
+
+        with ThreadPoolExecutor(max_workers=self.file_workers) as pool:
+            futures = [pool.submit(self.retry_policy.call, index_file, job, export_file)
+                       for job, export_file in work]
+            for future in futures:
+                future.result()
+        for index in self.key_indexes.values():
+            # Worker processes read the index from disk
+            index.finish(spill=self.processes > 1)
+
+    def run(self) -> Dict:
+        """Import every job and return the final progress snapshot"""
+        self.started_at = time.monotonic()
+        if self.compact:
+            cleanup_dir = self.compact_dir is None
+            if cleanup_dir:
+                self.compact_dir = Path(tempfile.mkdtemp(prefix='import-compact-'))
+            try:
+                self._index_key_versions()
+                return self._run_import()
+            finally:
+                for index in self.key_indexes.values():
+                    index.close()
+                if cleanup_dir:
+                    shutil.rmtree(self.compact_dir, ignore_errors=True)
+        return self._run_import()
+
+    def _run_import(self) -> Dict:
+        for job in self.jobs:
+            if not job.pending:
+                job.started_at = job.finished_at = self.started_at
+
+        file_workers = self.file_workers
+        if self.processes > 1:
+            self._start_process_pool()
+            file_workers = self.processes
+        workers = [
+            threading.Thread(target=self._worker, name=f'import-worker-{n}', daemon=True)
+            for n in range(min(file_workers, sum(j.total_files for j in self.jobs)) or 1)
+        ]
+        for worker in workers:
+            worker.start()
+
+        next_report = time.monotonic() + self.progress_interval
+        try:
+            while True:
+                alive = [worker for worker in workers if worker.is_alive()]
+                if not alive:
+                    break
+                alive[0].join(max(0.0, next_report - time.monotonic()))
+                if time.monotonic() >= next_report:
+                    next_report += self.progress_interval
+                    if self.on_progress:
+                        self.on_progress(self.progress())
+        except KeyboardInterrupt:
+            # Files in flight finish; nothing new starts
+            with self._cond:
+                self.stop_event.set()
+                self._cond.notify_all()
+            raise
+        finally:
+            if self.process_pool:
+                self.process_pool.shutdown(cancel_futures=True)
+
+        return self.progress()
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Refresh us-east-2 tables from incremental point-in-time exports
+
+A full export and import moves every item of a table on every refresh.
+An incremental export holds only the items that changed between two
+points in time, each once in its final state: NewImage is the item as it
+is now and OldImage as it was, and a deleted item has no NewImage. This
+module starts such exports from the time the last refresh reached,
+streams their data files and writes each change to the target tables:
+a put for every NewImage and a delete for every item that is gone. The
+cost of a refresh follows the amount of change, not the size of the
+table.
+
+AWS caps one incremental export at 24 hours of changes, so a longer gap
+is split into equal windows, exported side by side and applied in order.
+The state file keeps, per table, the time up to which changes have been
+applied (the watermark) and the exports started but not yet applied.
+Applied data files are journaled per target with ImportJournal, so an
+interrupted apply resumes where it stopped.
+
+Writes that still fail after retries are not dead-lettered: replaying
+them after a later window had been applied would put an old image over
+a newer one. The file stays unfinished instead and the watermark does
+not move, so the next run applies the window again. The same goes for a
+file with change records that cannot be parsed.
+"""
+
+import json
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from dynamodb_copy_engine import ThrottledBatchWriter
+from dynamodb_export_cache import ExportCache
+from dynamodb_import_engine import JOURNAL_INTERVAL_ITEMS, ExportFile, ImportJournal
+from dynamodb_retry import RetryPolicy
+from dynamodb_s3_export import INCREMENTAL_PREFIX, iter_export_changes, open_export_file
+from dynamodb_throttle import AdaptiveRateController
+
+# Limits AWS puts on the window of one incremental export
+MIN_WINDOW = timedelta(minutes=15)
+MAX_WINDOW = timedelta(hours=24)
+
+# Stay this far behind now so the window end is a valid restore time
+EXPORT_TO_LAG = timedelta(minutes=5)
+
+DEFAULT_STATE_FILE = 'incremental-export-state.json'
+
+
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def export_windows(start: datetime, end: datetime) -> List[Tuple[datetime, datetime]]:
+    """Equal windows of at most MAX_WINDOW from start to end; none if the gap is under MIN_WINDOW"""
+    if end - start < MIN_WINDOW:
+        return []
+    count = math.ceil((end - start) / MAX_WINDOW)
+    step = (end - start) / count
+    bounds = [start + step * i for i in range(count)] + [end]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def newest_full_export_time(client, table_arn: str) -> Optional[datetime]:
+    """Point in time of the table's newest completed full export"""
+    newest = None
+    kwargs = {'TableArn': table_arn}
+    while True:
+        response = client.list_exports(**kwargs)
+        for summary in response.get('ExportSummaries', []):
+            if summary.get('ExportStatus') != 'COMPLETED' or summary.get('ExportType', 'FULL_EXPORT') != 'FULL_EXPORT':
+                continue
+            export = client.describe_export(ExportArn=summary['ExportArn'])['ExportDescription']
+            export_time = export.get('ExportTime')
+            if export_time and (newest is None or export_time > newest):
+                newest = export_time
+        if not response.get('NextToken'):
+            return newest
+        kwargs['NextToken'] = response['NextToken']
+
+
+def start_incremental_export(client, table_arn: str, bucket: str, prefix: str,
+                             export_from: datetime, export_to: datetime) -> str:
+    """Start one incremental export of both images; returns its ARN"""
+    response = client.export_table_to_point_in_time(
+        TableArn=table_arn,
+        S3Bucket=bucket,
+        S3Prefix=prefix,
+        ExportFormat='DYNAMODB_JSON',
+        ExportType='INCREMENTAL_EXPORT',
+        IncrementalExportSpecification={
+            'ExportFromTime': export_from,
+            'ExportToTime': export_to,
+            'ExportViewType': 'NEW_AND_OLD_IMAGES'
+        }
+    )
+    return response['ExportDescription']['ExportArn']
+
+
+def export_dir_of(description: Dict) -> str:
+    """S3 directory (<prefix>/AWSDynamoDB/<export id>) a completed export wrote to"""
+    if description.get('ExportManifest'):
+        return description['ExportManifest'].rsplit('/', 1)[0]
+    return f"{description['S3Prefix']}/AWSDynamoDB/{description['ExportArn'].split('/')[-1]}"
+
+
+class IncrementalExportState:
+    """Per table: the watermark and the exports started after it, kept in a JSON file"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.tables: Dict[str, Dict] = {}
+        if self.path.exists():
+            with open(self.path) as f:
+                self.tables = json.load(f).get('tables', {})
+
+    def _table(self, name: str) -> Dict:
+        return self.tables.setdefault(name, {'watermark': None, 'exports': []})
+
+    def watermark(self, name: str) -> Optional[datetime]:
+        with self._lock:
+            value = self._table(name)['watermark']
+        return datetime.fromisoformat(value) if value else None
+
+    def pending(self, name: str) -> List[Dict]:
+        """Exports not yet applied, oldest window first"""
+        with self._lock:
+            return sorted((dict(e) for e in self._table(name)['exports']), key=lambda e: e['from'])
+
+    def add_export(self, name: str, arn: str, export_from: datetime, export_to: datetime):
+        with self._lock:
+            self._table(name)['exports'].append({
+                'arn': arn,
+                'from': export_from.isoformat(),
+                'to': export_to.isoformat(),
+                'started_at': utc_now().isoformat()
+            })
+        self.save()
+
+    def mark_applied(self, name: str, export: Dict):
+        """The export's changes are in every target; the watermark moves to its end"""
+        with self._lock:
+            state = self._table(name)
+            state['exports'] = [e for e in state['exports'] if e['arn'] != export['arn']]
+            state['watermark'] = export['to']
+            state['applied_at'] = utc_now().isoformat()
+        self.save()
+
+    def drop_pending(self, name: str):
+        """Forget unapplied exports, e.g. after one failed; the next run starts again from the watermark"""
+        with self._lock:
+            self._table(name)['exports'] = []
+        self.save()
+
+    def set_watermark(self, name: str, watermark: datetime):
+        with self._lock:
+            self._table(name)['watermark'] = watermark.isoformat()
+        self.save()
+
+    def save(self):
+        with self._lock:
+            tmp_path = self.path.with_name(self.path.name + '.tmp')
+            with open(tmp_path, 'w') as f:
+                json.dump({'updated_at': utc_now().isoformat(), 'tables': self.tables}, f, indent=2)
+            os.replace(tmp_path, self.path)
+
+
+def new_change_counts() -> Dict:
+    return {'records': 0, 'inserted': 0, 'updated': 0, 'deleted': 0, 'failed': 0,
+            'bad_lines': 0, 'resumed': 0, 'files_skipped': 0, 'incomplete_files': 0}
+
+
+def apply_change_file(s3, client, bucket: str, target_tables: List[str], export_file: ExportFile,
+                      controllers: Dict[str, AdaptiveRateController], retry_policy: RetryPolicy,
+                      journal: Optional[ImportJournal] = None,
+                      cache: Optional[ExportCache] = None) -> Dict:
+    """Stream one incremental export file and write its changes to every target
+
+    A put or delete that still fails, or a line that cannot be parsed,
+    leaves the file unfinished in the journal, so the next run applies it
+    again; the puts and deletes are idempotent.
+    """
+    key = export_file.key
+    counts = new_change_counts()
+    resume_at = min(journal.offset(target, key) for target in target_tables) if journal else 0
+    incomplete = False
+
+    def on_bad_line(line, error):
+        nonlocal incomplete
+        counts['bad_lines'] += 1
+        incomplete = True
+
+    def on_batch_failed(requests, error):
+        nonlocal incomplete
+        counts['failed'] += len(requests)
+        incomplete = True
+
+    writers = [ThrottledBatchWriter(client, target, controllers[target],
+                                    retry_policy=retry_policy, on_failed=on_batch_failed)
+               for target in target_tables]
+    if cache:
+        body = cache.open(s3, bucket, key, export_file.etag, export_file.size)
+    else:
+        body = open_export_file(s3, bucket, key)
+    seen = 0
+    try:
+        for record in iter_export_changes(body, on_bad_line=on_bad_line):
+            seen += 1
+            if seen <= resume_at:
+                continue
+            new_image = record.get('NewImage')
+            if new_image is None:
+                for writer in writers:
+                    writer.delete_item(Key=record['Keys'])
+                counts['deleted'] += 1
+            else:
+                for writer in writers:
+                    writer.put_item(Item=new_image)
+                counts['updated' if record.get('OldImage') else 'inserted'] += 1
+            if journal and seen % JOURNAL_INTERVAL_ITEMS == 0 and not incomplete:
+                # Journal only what is really written
+                for writer in writers:
+                    writer.flush()
+                for target in target_tables:
+                    journal.record(target, key, seen)
+        for writer in writers:
+            writer.flush()
+    finally:
+        body.close()
+
+    if journal and not incomplete:
+        for target in target_tables:
+            journal.record(target, key, seen, done=True)
+    counts['records'] = seen
+    counts['resumed'] = min(resume_at, seen)
+    counts['incomplete_files'] = int(incomplete)
+    return counts
+
+
+def apply_export(s3, client, bucket: str, target_tables: List[str], files: List[ExportFile],
+                 controllers: Dict[str, AdaptiveRateController], retry_policy: RetryPolicy,
+                 journal: Optional[ImportJournal] = None,
+                 cache: Optional[ExportCache] = None,
+                 file_workers: int = 4) -> Dict:
+    """Apply every data file of one incremental export, file_workers files at a time
+
+    An export holds each changed item once, so its files can be applied in any order.
+    """
+    totals = new_change_counts()
+    lock = threading.Lock()
+
+    def apply(export_file):
+        if journal and all(journal.completed(target, export_file.key) for target in target_tables):
+            with lock:
+                totals['files_skipped'] += 1
+            return
+        counts = apply_change_file(s3, client, bucket, target_tables, export_file, controllers,
+                                   retry_policy, journal=journal, cache=cache)
+        with lock:
+            for name, value in counts.items():
+                totals[name] += value
+
+    with ThreadPoolExecutor(max_workers=max(1, min(file_workers, len(files)))) as pool:
+        for future in [pool.submit(apply, export_file) for export_file in files]:
+            future.result()
+    return totals
@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+"""
+Watch DynamoDB export and import jobs until they finish
+
+Every job that is not yet terminal is described once per interval, all
+at the same time, so a poll costs one round trip and one API call per
+ARN however many jobs there are. Throughput comes from successive
+samples of a job's progress and the ETA is the remainder at that rate.
+Imports count items: ProcessedItemCount against the itemCount of the
+exports they read, since ProcessedSizeBytes is uncompressed and cannot
+be compared with the gzipped files in S3. Exports report nothing while
+running, so they are timed in bytes against the rate finished exports
+achieved.
+
+The interval backs off while nothing changes and snaps back to the
+minimum when a job changes state; it never sleeps past the soonest ETA.
+"""
+
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+import boto3
+from botocore.config import Config
+
+from dynamodb_retry import RetryPolicy
+
+TERMINAL_STATUSES = ('COMPLETED', 'FAILED', 'CANCELLED')
+
+DEFAULT_MIN_INTERVAL_SECONDS = 15.0
+DEFAULT_MAX_INTERVAL_SECONDS = 300.0
+DEFAULT_POLL_WORKERS = 16
+
+# Interval growth per poll in which no job changed state
+BACKOFF_FACTOR = 1.5
+
+# Weight of the newest sample in a job's smoothed rate
+RATE_SMOOTHING = 0.3
+
+# Tells transient describe_* errors, worth polling again, from permanent ones
+_retry_policy = RetryPolicy()
+
+
+def poll_client(region: str, workers: int = DEFAULT_POLL_WORKERS):
+    """DynamoDB client whose connection pool fits every poll in flight"""
+    return boto3.client('dynamodb', region_name=region,
+                        config=Config(max_pool_connections=max(10, workers)))
+
+
+def format_duration(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return '?'
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+
+
+def format_bytes(size: Optional[float]) -> str:
+    if size is None:
+        return '?'
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def format_amount(amount: Optional[float], unit: str) -> str:
+    if unit == 'bytes':
+        return format_bytes(amount)
+    return '?' if amount is None else f"{int(amount):,} {unit}"
+
+
+def _seconds(start: Optional[datetime], end: Optional[datetime]) -> Optional[float]:
+    if not start or not end:
+        return None
+    return (end - start).total_seconds()
+
+
+class ImportStatusSource:
+    """describe_import, with the import's item total read once from S3
+
+    The total is the itemCount of every export manifest-summary.json the
+    import reads from. Imports of the same table read from the same
+    export prefix, so each table's prefix is listed once for the run and
+    each summary is read once.
+    """
+
+    kind = 'import'
+    unit = 'items'
+
+    def __init__(self, client, s3=None):
+        self.client = client
+        self.s3 = s3
+        self._totals: Dict[str, Optional[int]] = {}
+        self._listings: Dict[Tuple[str, str], List[str]] = {}
+        self._summaries: Dict[Tuple[str, str], Optional[int]] = {}
+        self._lock = threading.Lock()
+
+    def _listing(self, bucket: str, prefix: str) -> List[str]:
+        """Keys under the table's prefix, listed on first use"""
+        # Export data lives in <table prefix>/AWSDynamoDB/<export id>/data/
+        root = prefix.split('/AWSDynamoDB/')[0] + '/' if '/AWSDynamoDB/' in prefix else prefix
+        with self._lock:
+            if (bucket, root) not in self._listings:
+                keys = []
+                paginator = self.s3.get_paginator('list_objects_v2')
+                for page in paginator.paginate(Bucket=bucket, Prefix=root):
+                    keys.extend(obj['Key'] for obj in page.get('Contents', []))
+                self._listings[(bucket, root)] = keys
+            return self._listings[(bucket, root)]
+
+    def _summary_items(self, bucket: str, key: str) -> Optional[int]:
+        with self._lock:
+            if (bucket, key) not in self._summaries:
+                summary = json.loads(self.s3.get_object(Bucket=bucket, Key=key)['Body'].read())
+                self._summaries[(bucket, key)] = summary.get('itemCount')
+            return self._summaries[(bucket, key)]
+
+    def _input_items(self, description: Dict) -> Optional[int]:
+        source = description.get('S3BucketSource') or {}
+        if not self.s3 or 'S3Bucket' not in source:
+            return None
+        bucket, prefix = source['S3Bucket'], source.get('S3KeyPrefix', '')
+        total = None
+        for key in self._listing(bucket, prefix):
+            if not key.endswith('/manifest-summary.json'):
+                continue
+            # The import reads this export if its prefix covers the export's data
+            data = key.rsplit('/', 1)[0] + '/data/'
+            if data.startswith(prefix) or prefix.startswith(data):
+                items = self._summary_items(bucket, key)
+                if items is None:
+                    return None
+                total = (total or 0) + items
+        return total
+
+    def describe(self, arn: str) -> Dict:
+        description = self.client.describe_import(ImportArn=arn)['ImportTableDescription']
+        if arn not in self._totals:
+            try:
+                self._totals[arn] = self._input_items(description)
+            except Exception:
+                self._totals[arn] = None
+        return {
+            'status': description['ImportStatus'],
+            'done': description.get('ProcessedItemCount', 0),
+            'total': self._totals[arn],
+            'bytes': description.get('ProcessedSizeBytes', 0),
+            'items': description.get('ImportedItemCount') or description.get('ProcessedItemCount', 0),
+            'start': description.get('StartTime'),
+            'end': description.get('EndTime'),
+            'failure': ' '.join(filter(None, [description.get('FailureCode'), description.get('FailureMessage')]))
+        }
+
+
+class ExportStatusSource:
+    """describe_export, with each source table's size read once for the ETA
+
+    The size is cached per table for the whole run, so after the first
+    poll that sees a table's export running, polls make no describe_table
+    calls at all.
+    """
+
+    kind = 'export'
+    unit = 'bytes'
+
+    def __init__(self, client):
+        self.client = client
+        self._table_sizes: Dict[str, Optional[int]] = {}
+        self._lock = threading.Lock()
+
+    def _table_size(self, table_name: str) -> Optional[int]:
+        with self._lock:
+            if table_name not in self._table_sizes:
+                try:
+                    table = self.client.describe_table(TableName=table_name)['Table']
+                    self._table_sizes[table_name] = table.get('TableSizeBytes', 0)
+                except Exception:
+                    self._table_sizes[table_name] = None
+            return self._table_sizes[table_name]
+
+    def describe(self, arn: str) -> Dict:
+        description = self.client.describe_export(ExportArn=arn)['ExportDescription']
+        status = description['ExportStatus']
+        if status == 'COMPLETED':
+            total = description.get('BilledSizeBytes')
+        elif status in TERMINAL_STATUSES:
+            total = None
+        else:
+            total = self._table_size(description['TableArn'].split('/')[-1])
+        return {
+            'status': status,
+            'done': total if status == 'COMPLETED' else None,
+            'total': total,
+            'bytes': total if status == 'COMPLETED' else None,
+            'items': description.get('ItemCount', 0),
+            'start': description.get('StartTime'),
+            'end': description.get('EndTime'),
+            'failure': ' '.join(filter(None, [description.get('FailureCode'), description.get('FailureMessage')]))
+        }
+
+
+class RateEstimator:
+    """Smoothed rate per second from successive (time, progress) samples"""
+
+    def __init__(self):
+        self.rate: Optional[float] = None
+        self._last: Optional[Tuple[float, float]] = None
+
+    def add(self, when: float, done: float):
+        if self._last is not None:
+            last_when, last_done = self._last
+            if when > last_when and done >= last_done:
+                sample = (done - last_done) / (when - last_when)
+                self.rate = sample if self.rate is None else RATE_SMOOTHING * sample + (1 - RATE_SMOOTHING) * self.rate
+        self._last = (when, done)
+
+
+class JobWatcher:
+    """Polls a set of jobs concurrently until every one is terminal"""
+
+    def __init__(self, source, jobs: List[Tuple[str, str]],
+                 workers: int = DEFAULT_POLL_WORKERS,
+                 min_interval: float = DEFAULT_MIN_INTERVAL_SECONDS,
+                 max_interval: float = DEFAULT_MAX_INTERVAL_SECONDS):
+        self.source = source
+        self.jobs = jobs
+        self.workers = workers
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.interval = min_interval
+        self.states: Dict[str, Dict] = {}
+        self.rates = {arn: RateEstimator() for arn, _ in jobs}
+        self.polls = 0
+
+    def _describe(self, arn: str) -> Dict:
+        try:
+            return self.source.describe(arn)
+        except Exception as e:
+            # Transient errors keep the job in the watch; anything else ends it
+            status = 'POLL_ERROR' if _retry_policy.is_retryable(e) else 'ERROR'
+            return {'status': status, 'failure': str(e)[:120], 'done': None, 'total': None, 'items': 0}
+
+    def is_terminal(self, arn: str) -> bool:
+        return self.states.get(arn, {}).get('status') in TERMINAL_STATUSES + ('ERROR',)
+
+    def poll(self) -> bool:
+        """Describe every unfinished job once; True if any job changed state"""
+        pending = [arn for arn, _ in self.jobs if not self.is_terminal(arn)]
+        now = time.monotonic()
+        with ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(pending)))) as pool:
+            results = list(pool.map(self._describe, pending))
+
+        changed = False
+        for arn, state in zip(pending, results):
+            if state['status'] == 'POLL_ERROR' and arn in self.states:
+                # Keep the last good sample so the ETA survives one failed poll
+                self.states[arn]['poll_error'] = state['failure']
+                continue
+            if self.states.get(arn, {}).get('status') != state['status']:
+                changed = True
+            if state.get('done') is not None:
+                self.rates[arn].add(now, state['done'])
+            self.states[arn] = state
+        self.polls += 1
+        return changed
+
+    def finished_rate(self) -> Optional[float]:
+        """Progress per second achieved by the jobs that completed"""
+        size = seconds = 0.0
+        for state in self.states.values():
+            duration = _seconds(state.get('start'), state.get('end'))
+            if state['status'] == 'COMPLETED' and duration and state.get('total'):
+                size += state['total']
+                seconds += duration
+        return size / seconds if seconds else None
+
+    def rate_of(self, arn: str) -> Optional[float]:
+        """Smoothed rate between polls, or the average since the job started before there are two"""
+        if self.rates[arn].rate is not None:
+            return self.rates[arn].rate
+        state = self.states.get(arn, {})
+        if state.get('done') and state.get('start'):
+            elapsed = (datetime.now(state['start'].tzinfo) - state['start']).total_seconds()
+            return state['done'] / elapsed if elapsed > 0 else None
+        return None
+
+    def eta_of(self, arn: str) -> Optional[float]:
+        """Seconds until the job should finish, from its own rate or that of finished jobs"""
+        state = self.states.get(arn)
+        if not state or state['status'] in TERMINAL_STATUSES or not state.get('total'):
+            return None
+        rate = self.rate_of(arn)
+        if rate and state.get('done') is not None:
+            return max(0.0, state['total'] - state['done']) / rate
+        finished = self.finished_rate()
+        if finished and state.get('start'):
+            elapsed = (datetime.now(state['start'].tzinfo) - state['start']).total_seconds()
+            return max(0.0, state['total'] / finished - elapsed)
+        return None
+
+    def overall_eta(self) -> Optional[float]:
+        """Jobs run side by side, so everything is done when the slowest one is"""
+        etas = [self.eta_of(arn) for arn, _ in self.jobs if not self.is_terminal(arn)]
+        if not etas or any(eta is None for eta in etas):
+            return None
+        return max(etas)
+
+    def counts(self) -> Dict[str, int]:
+        counts = {'completed': 0, 'in_progress': 0, 'failed': 0}
+        for arn, _ in self.jobs:
+            status = self.states.get(arn, {}).get('status')
+            if status == 'COMPLETED':
+                counts['completed'] += 1
+            elif status in ('FAILED', 'CANCELLED', 'ERROR'):
+                counts['failed'] += 1
+            else:
+                counts['in_progress'] += 1
+        return counts
+
+    @property
+    def done(self) -> bool:
+        return all(self.is_terminal(arn) for arn, _ in self.jobs)
+
+    def next_interval(self, changed: bool) -> float:
+        """Back off while nothing changes, but wake up for the soonest expected finish"""
+        if changed:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.max_interval, self.interval * BACKOFF_FACTOR)
+        etas = [eta for eta in (self.eta_of(arn) for arn, _ in self.jobs if not self.is_terminal(arn))
+                if eta is not None]
+        if etas:
+            return max(self.min_interval, min(self.interval, min(etas)))
+        return self.interval
+
+    def print_report(self):
+        unit = self.source.unit
+        counts = self.counts()
+        overall = self.overall_eta()
+        print(f"[{datetime.now():%H:%M:%S}] {counts['completed']}/{len(self.jobs)} completed, "
+              f"{counts['in_progress']} in progress, {counts['failed']} failed"
+              + (f" | overall ETA {format_duration(overall)}" if counts['in_progress'] else ""))
+        for arn, table_name in self.jobs:
+            state = self.states.get(arn)
+            if not state:
+                continue
+            status = state['status']
+            if status == 'COMPLETED':
+                print(f"  ✅ {table_name}: {state['items']:,} items, {format_bytes(state.get('bytes'))}")
+            elif status in ('FAILED', 'CANCELLED', 'ERROR'):
+                print(f"  ❌ {table_name}: {status} {state.get('failure', '')[:80]}")
+            else:
+                rate = self.rate_of(arn)
+                done = f"{format_amount(state.get('done'), unit)}/" if state.get('done') is not None else ""
+                print(f"  ⏳ {table_name}: {status} {done}{format_amount(state.get('total'), unit)}"
+                      + (f", {format_bytes(state['bytes'])}" if state.get('bytes') else "")
+                      + (f", {format_amount(rate, unit)}/s" if rate else "")
+                      + f", ETA {format_duration(self.eta_of(arn))}"
+                      + (f" (last poll failed: {state['poll_error'][:40]})" if state.get('poll_error') else ""))
+        print(flush=True)
+
+    def run(self, on_poll: Optional[Callable[['JobWatcher'], None]] = None) -> Dict[str, int]:
+        """Poll until every job is terminal; returns the final counts"""
+        on_poll = on_poll or JobWatcher.print_report
+        while True:
+            changed = self.poll()
+            on_poll(self)
+            if self.done:
+                return self.counts()
+            time.sleep(self.next_interval(changed))
+
+
+def add_watch_arguments(parser):
+    parser.add_argument('--watch', action='store_true',
+                        help='Keep polling every job until all of them have finished, with a live ETA')
+    parser.add_argument('--min-interval', type=float, default=DEFAULT_MIN_INTERVAL_SECONDS,
+                        help=f'Shortest wait between polls in seconds (default: {DEFAULT_MIN_INTERVAL_SECONDS:g})')
+    parser.add_argument('--max-interval', type=float, default=DEFAULT_MAX_INTERVAL_SECONDS,
+                        help=f'Longest wait between polls in seconds (default: {DEFAULT_MAX_INTERVAL_SECONDS:g})')
+    parser.add_argument('--workers', type=int, default=DEFAULT_POLL_WORKERS,
+                        help=f'describe calls in flight at once (default: {DEFAULT_POLL_WORKERS})')
+
+
+def watch(source, jobs: List[Tuple[str, str]], args) -> int:
+    """Run a watch from parsed add_watch_arguments; exit status 0 only if every job completed"""
+    print(f"Watching {len(jobs)} {source.kind} jobs (polls every {args.min_interval:g}-{args.max_interval:g}s)...")
+    print()
+    watcher = JobWatcher(source, jobs, args.workers, args.min_interval, args.max_interval)
+    counts = watcher.run()
+    if counts['failed']:
+        print(f"⚠️  {counts['failed']} {source.kind}s failed. Review errors above.")
+        return 1
+    print(f"🎉 All {len(jobs)} {source.kind}s complete!")
+    return 0
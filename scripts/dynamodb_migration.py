@@ -0,0 +1,455 @@
+#!/usr/bin/env python3
+"""
+Migration of DynamoDB tables as a dependency graph of stages
+
+Every table moves through the same stages:
+
+    export -> wait_export -> import -> wait_import -> copy -> verify
+
+export starts a point-in-time export of the us-east-1 table to S3 and
+import creates the -dev table in us-east-2 from exactly that export, with
+the table's import config or, failing that, its saved us-east-1 schema;
+the wait stages poll AWS until the job is done. copy scans the new -dev table
+once and fans every page out to the developer environments' tables, and
+verify compares their contents with the digest trees of dynamodb_verify.
+
+A stage starts the moment the stages it depends on finish for that table,
+regardless of how far other tables have got. Concurrency is capped two
+ways: max_active bounds the stages doing work at once (the wait stages
+only poll, so they do not count), and every stage group has its own cap.
+A group spans a job and its wait, so the export cap bounds exports
+running in AWS, not just how many are being submitted.
+
+Progress lives in a JSON state file, rewritten atomically after every
+change, so an interrupted migration picks up where it stopped: export
+and import ARNs are kept, and a stage that was running starts again.
+Setting MigrationStages.stop_event ends the running stages promptly: the
+wait stages check it between polls, copy and verify between scan pages.
+"""
+
+import json
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import boto3
+
+from dynamodb_copy_engine import DEFAULT_MAX_SEGMENTS, ParallelTableCopy, resolve_segment_count
+from dynamodb_retry import DeadLetterFile, RetryPolicy
+from dynamodb_verify import ScanStopped, verify_tables
+
+SOURCE_REGION = 'us-east-1'
+TARGET_REGION = 'us-east-2'
+
+DEFAULT_MAX_ACTIVE = 4
+DEFAULT_STAGE_LIMITS = {'export': 10, 'import': 10, 'copy': 2, 'verify': 2}
+DEFAULT_POLL_INTERVAL_SECONDS = 30.0
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+
+
+class Stage(NamedTuple):
+    name: str
+    after: Tuple[str, ...]
+    # Stages of one group share a concurrency slot, held from the first to the last
+    group: str
+    # Only polls AWS: takes no worker slot and runs in the slot of the stage before it
+    waits: bool = False
+
+
+STAGES = (
+    Stage('export', (), 'export'),
+    Stage('wait_export', ('export',), 'export', waits=True),
+    Stage('import', ('wait_export',), 'import'),
+    Stage('wait_import', ('import',), 'import', waits=True),
+    Stage('copy', ('wait_import',), 'copy'),
+    Stage('verify', ('copy',), 'verify'),
+)
+STAGE_NAMES = [stage.name for stage in STAGES]
+
+# Stages --start-at may begin from; those before it are skipped
+START_STAGES = ('export', 'copy', 'verify')
+
+
+class MigrationError(Exception):
+    """A stage failed for a reason retrying it right away will not fix"""
+
+
+def dev_table_name(source_table: str) -> str:
+    """bebco-borrower-staging-banks -> bebco-borrower-banks-dev"""
+    return source_table.replace('bebco-borrower-staging-', 'bebco-borrower-') + '-dev'
+
+
+def env_table_name(source_table: str, env: str) -> str:
+    return dev_table_name(source_table)[:-len('-dev')] + f'-{env}'
+
+
+def creation_parameters(description: Dict, table_name: str) -> Dict:
+    """import_table TableCreationParameters from a describe_table 'Table' description"""
+    if description.get('LocalSecondaryIndexes'):
+        raise MigrationError(f"{description['TableName']} has local secondary indexes, which import_table cannot create")
+    indexes = [{
+        'IndexName': index['IndexName'],
+        'KeySchema': index['KeySchema'],
+        'Projection': index['Projection']
+    } for index in description.get('GlobalSecondaryIndexes', [])]
+    used = {k['AttributeName'] for k in description['KeySchema']}
+    used.update(k['AttributeName'] for index in indexes for k in index['KeySchema'])
+    parameters = {
+        'TableName': table_name,
+        'AttributeDefinitions': [a for a in description['AttributeDefinitions'] if a['AttributeName'] in used],
+        'KeySchema': description['KeySchema'],
+        'BillingMode': 'PAY_PER_REQUEST'
+    }
+    if indexes:
+        parameters['GlobalSecondaryIndexes'] = indexes
+    return parameters
+
+
+class MigrationState:
+    """Status and results of every (table, stage), kept in a JSON file"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.tables: Dict[str, Dict[str, Dict]] = {}
+        if self.path.exists():
+            with open(self.path) as f:
+                self.tables = json.load(f).get('tables', {})
+
+    def add_table(self, table: str, start_at: str = 'export'):
+        """Track a table; stages before start_at are skipped if it is new"""
+        with self._lock:
+            if table in self.tables:
+                return
+            first = STAGE_NAMES.index(start_at)
+            self.tables[table] = {
+                name: {'status': SKIPPED if i < first else PENDING, 'attempts': 0, 'data': {}}
+                for i, name in enumerate(STAGE_NAMES)
+            }
+        self.save()
+
+    def get(self, table: str, stage: str) -> Dict:
+        with self._lock:
+            return json.loads(json.dumps(self.tables[table][stage]))
+
+    def data(self, table: str) -> Dict:
+        """Results of every finished stage of a table, merged"""
+        with self._lock:
+            merged = {}
+            for name in STAGE_NAMES:
+                merged.update(self.tables[table][name]['data'])
+            return merged
+
+    def update(self, table: str, stage: str, **fields):
+        with self._lock:
+            entry = self.tables[table][stage]
+            data = fields.pop('data', None)
+            if data:
+                entry['data'].update(data)
+            entry.update(fields)
+        self.save()
+
+    def reset(self, statuses=(RUNNING,)):
+        """Make stages in the given statuses pending again, e.g. after an interrupted run"""
+        with self._lock:
+            for stages in self.tables.values():
+                for entry in stages.values():
+                    if entry['status'] in statuses:
+                        entry['status'] = PENDING
+                        entry.pop('error', None)
+        self.save()
+
+    def save(self):
+        with self._lock:
+            tmp_path = self.path.with_name(self.path.name + '.tmp')
+            with open(tmp_path, 'w') as f:
+                json.dump({'updated_at': datetime.now().isoformat(), 'tables': self.tables}, f, indent=2, default=str)
+            os.replace(tmp_path, self.path)
+
+
+class MigrationStages:
+    """What each stage does for one table"""
+
+    def __init__(self, bucket: str, config_dir: Path, target_envs: List[str],
+                 poll_interval: float = DEFAULT_POLL_INTERVAL_SECONDS,
+                 max_segments: int = DEFAULT_MAX_SEGMENTS,
+                 max_read_units: Optional[float] = None,
+                 max_write_units: Optional[float] = None,
+                 dead_letter_dir: Path = Path('.'),
+                 retry_policy: Optional[RetryPolicy] = None,
+                 size_history=None,
+                 schema_dir: Optional[Path] = None):
+        self.bucket = bucket
+        self.config_dir = Path(config_dir)
+        # describe_table output of the us-east-1 tables, for those without a config
+        self.schema_dir = Path(schema_dir) if schema_dir else None
+        self._creation_parameters: Dict[str, Dict] = {}
+        self.target_envs = list(target_envs)
+        self.poll_interval = poll_interval
+        self.max_segments = max_segments
+        self.max_read_units = max_read_units
+        self.max_write_units = max_write_units
+        self.dead_letter_dir = Path(dead_letter_dir)
+        self.retry_policy = retry_policy or RetryPolicy()
+        # Recorded -dev table sizes for segment counts (dynamodb_count_history.TableCountHistory)
+        self.size_history = size_history
+        self.stop_event = threading.Event()
+        # us-east-1 is only read from (exports do not touch the table)
+        self.source = boto3.client('dynamodb', region_name=SOURCE_REGION)
+        self.target = boto3.client('dynamodb', region_name=TARGET_REGION)
+
+    def run(self, stage: str, table: str, data: Dict) -> Dict:
+        return getattr(self, f'run_{stage}')(table, data)
+
+    def table_creation_parameters(self, table: str) -> Dict:
+        """How import creates the -dev table
+
+        From config_dir/<table>.json when there is one, else built from the
+        saved schema in schema_dir, else from describe_table of the us-east-1
+        table.
+        """
+        if table in self._creation_parameters:
+            return self._creation_parameters[table]
+        config_file = self.config_dir / f'{table}.json'
+        schema_file = self.schema_dir / f'{table}.json' if self.schema_dir else None
+        if config_file.exists():
+            with open(config_file) as f:
+                parameters = json.load(f)
+        elif schema_file and schema_file.exists():
+            with open(schema_file) as f:
+                parameters = creation_parameters(json.load(f)['Table'], dev_table_name(table))
+        else:
+            try:
+                description = self.retry_policy.call(self.source.describe_table, TableName=table)['Table']
+            except self.source.exceptions.ResourceNotFoundException:
+                raise MigrationError(f'{table} does not exist in {SOURCE_REGION} and has no table configuration')
+            parameters = creation_parameters(description, dev_table_name(table))
+        self._creation_parameters[table] = parameters
+        return parameters
+
+    def _wait(self):
+        if self.stop_event.wait(self.poll_interval):
+            raise MigrationError('migration stopped')
+
+    def run_export(self, table: str, data: Dict) -> Dict:
+        if data.get('export_arn'):
+            return {}
+        table_arn = self.retry_policy.call(self.source.describe_table, TableName=table)['Table']['TableArn']
+        response = self.retry_policy.call(
+            self.source.export_table_to_point_in_time,
+            TableArn=table_arn,
+            S3Bucket=self.bucket,
+            S3Prefix=f'exports/{table}',
+            ExportFormat='DYNAMODB_JSON'
+        )
+        return {'export_arn': response['ExportDescription']['ExportArn']}
+
+    def run_wait_export(self, table: str, data: Dict) -> Dict:
+        while True:
+            export = self.retry_policy.call(self.source.describe_export, ExportArn=data['export_arn'])['ExportDescription']
+            if export['ExportStatus'] == 'COMPLETED':
+                # Exports land in <prefix>/AWSDynamoDB/<export id>/
+                manifest = export.get('ExportManifest') or (
+                    f"{export.get('S3Prefix', f'exports/{table}')}/AWSDynamoDB/"
+                    f"{data['export_arn'].split('/')[-1]}/manifest-summary.json")
+                return {'export_manifest': manifest, 'export_items': export.get('ItemCount', 0)}
+            if export['ExportStatus'] == 'FAILED':
+                raise MigrationError(f"export failed: {export.get('FailureCode')} {export.get('FailureMessage', '')}")
+            self._wait()
+
+    def run_import(self, table: str, data: Dict) -> Dict:
+        if data.get('import_arn'):
+            return {}
+        table_config = self.table_creation_parameters(table)
+        try:
+            self.target.describe_table(TableName=table_config['TableName'])
+        except self.target.exceptions.ResourceNotFoundException:
+            pass
+        else:
+            raise MigrationError(f"{table_config['TableName']} already exists; rerun with --start-at copy")
+
+        # Import only this export's data files, not older exports under the same prefix
+        data_prefix = data['export_manifest'].rsplit('/', 1)[0] + '/data/'
+        response = self.retry_policy.call(
+            self.target.import_table,
+            S3BucketSource={'S3Bucket': self.bucket, 'S3KeyPrefix': data_prefix},
+            InputFormat='DYNAMODB_JSON',
+            InputCompressionType='GZIP',
+            TableCreationParameters=table_config
+        )
+        return {'import_arn': response['ImportTableDescription']['ImportArn']}
+
+    def run_wait_import(self, table: str, data: Dict) -> Dict:
+        while True:
+            described = self.retry_policy.call(self.target.describe_import, ImportArn=data['import_arn'])
+            status = described['ImportTableDescription']['ImportStatus']
+            if status == 'COMPLETED':
+                return {'imported_items': described['ImportTableDescription'].get('ImportedItemCount', 0)}
+            if status in ('FAILED', 'CANCELLED'):
+                description = described['ImportTableDescription']
+                raise MigrationError(f"import {status.lower()}: {description.get('FailureCode')} "
+                                     f"{description.get('FailureMessage', '')}")
+            self._wait()
+
+    def _existing(self, tables: List[str]) -> List[str]:
+        existing = []
+        for name in tables:
+            try:
+                self.target.describe_table(TableName=name)
+                existing.append(name)
+            except self.target.exceptions.ResourceNotFoundException:
+                pass
+        return existing
+
+    def run_copy(self, table: str, data: Dict) -> Dict:
+        dev_table = dev_table_name(table)
+        targets = self._existing([env_table_name(table, env) for env in self.target_envs])
+        if not targets:
+            raise MigrationError(f"no {'/'.join(self.target_envs)} tables exist for {dev_table}")
+
+        segments = resolve_segment_count(self.target, dev_table, auto_segments=True, max_segments=self.max_segments,
+                                         size_history=self.size_history)
+        dead_letter = DeadLetterFile(self.dead_letter_dir / f'dead-letter-{dev_table}.jsonl')
+        try:
+            result = ParallelTableCopy(
+                TARGET_REGION, dev_table, targets,
+                total_segments=segments,
+                max_read_units=self.max_read_units,
+                max_write_units=self.max_write_units,
+                retry_policy=self.retry_policy,
+                dead_letter=dead_letter,
+                stop_event=self.stop_event
+            ).run()
+        finally:
+            dead_letter.close()
+        if self.stop_event.is_set():
+            raise MigrationError('migration stopped')
+
+        errors = [f"{t}: {r['error']}" for t, r in result['targets'].items() if r['error']]
+        if errors:
+            raise MigrationError('; '.join(errors))
+        if dead_letter.count:
+            raise MigrationError(f"{dead_letter.count:,} items failed; re-drive with "
+                                 f"./replay-dead-letters.py {dead_letter.path}")
+        return {
+            'copy_targets': targets,
+            'items_copied': {t: r['items_copied'] for t, r in result['targets'].items()}
+        }
+
+    def run_verify(self, table: str, data: Dict) -> Dict:
+        dev_table = dev_table_name(table)
+        targets = data.get('copy_targets') or self._existing([env_table_name(table, env) for env in self.target_envs])
+        key_names = [k['AttributeName'] for k in self.target.describe_table(TableName=dev_table)['Table']['KeySchema']]
+        segments = resolve_segment_count(self.target, dev_table, auto_segments=True, max_segments=self.max_segments,
+                                         size_history=self.size_history)
+        try:
+            result = verify_tables(TARGET_REGION, dev_table, targets, key_names, total_segments=segments,
+                                   max_read_units=self.max_read_units, stop_event=self.stop_event)
+        except ScanStopped:
+            raise MigrationError('migration stopped')
+
+        mismatched = [t for t, r in result['targets'].items() if not r['match']]
+        if mismatched:
+            raise MigrationError('content differs: ' + ', '.join(
+                f"{t} ({result['targets'][t]['target_items']:,} items vs {result['source_items']:,})" for t in mismatched))
+        return {'verified_items': result['source_items']}
+
+
+class MigrationOrchestrator:
+    """Runs every table's stage graph with global and per-group concurrency caps"""
+
+    def __init__(self, tables: List[str], state: MigrationState,
+                 run_stage: Callable[[str, str, Dict], Dict],
+                 max_active: int = DEFAULT_MAX_ACTIVE,
+                 stage_limits: Optional[Dict[str, int]] = None,
+                 on_event: Optional[Callable[[str, str, str, Dict], None]] = None):
+        self.tables = list(tables)
+        self.state = state
+        self.run_stage = run_stage
+        self.max_active = max(1, max_active)
+        self.stage_limits = dict(DEFAULT_STAGE_LIMITS, **(stage_limits or {}))
+        self.on_event = on_event or (lambda table, stage, event, detail: None)
+
+        self._group_last = {stage.group: stage.name for stage in STAGES}
+        self._group_held = {group: set() for group in self._group_last}
+        self._active = 0
+        self._running = 0
+        self._done: queue.Queue = queue.Queue()
+
+    def _ready(self, table: str, stage: Stage) -> bool:
+        if self.state.get(table, stage.name)['status'] != PENDING:
+            return False
+        if any(self.state.get(table, after)['status'] not in (DONE, SKIPPED) for after in stage.after):
+            return False
+        if table in self._group_held[stage.group]:
+            return True
+        if stage.waits:
+            # The job it waits on was submitted by an earlier run; take the slot now
+            return len(self._group_held[stage.group]) < self.stage_limits.get(stage.group, len(self.tables))
+        return (self._active < self.max_active and
+                len(self._group_held[stage.group]) < self.stage_limits.get(stage.group, len(self.tables)))
+
+    def _start(self, pool: ThreadPoolExecutor, table: str, stage: Stage):
+        self._group_held[stage.group].add(table)
+        if not stage.waits:
+            self._active += 1
+        self._running += 1
+        entry = self.state.get(table, stage.name)
+        self.state.update(table, stage.name, status=RUNNING, started_at=datetime.now().isoformat(),
+                          attempts=entry['attempts'] + 1)
+        self.on_event(table, stage.name, 'started', {})
+        data = self.state.data(table)
+
+        def work():
+            try:
+                result = self.run_stage(stage.name, table, data)
+            except Exception as e:
+                self._done.put((table, stage, None, e))
+            else:
+                self._done.put((table, stage, result or {}, None))
+
+        pool.submit(work)
+
+    def _finish(self, table: str, stage: Stage, result: Optional[Dict], error: Optional[Exception]):
+        if not stage.waits:
+            self._active -= 1
+        self._running -= 1
+        finished_at = datetime.now().isoformat()
+        if error is None:
+            self.state.update(table, stage.name, status=DONE, finished_at=finished_at, data=result)
+            self.on_event(table, stage.name, 'done', result)
+        else:
+            self.state.update(table, stage.name, status=FAILED, finished_at=finished_at, error=str(error))
+            self.on_event(table, stage.name, 'failed', {'error': str(error)})
+        # A group's slot is free once its last stage ends, or as soon as any of its stages fails
+        if error is not None or self._group_last[stage.group] == stage.name:
+            self._group_held[stage.group].discard(table)
+
+    def run(self) -> Dict[str, Dict[str, str]]:
+        """Run until no stage can start; returns the status of every (table, stage)"""
+        pool = ThreadPoolExecutor(max_workers=self.max_active + len(self.tables))
+        try:
+            while True:
+                for table in self.tables:
+                    for stage in STAGES:
+                        if self._ready(table, stage):
+                            self._start(pool, table, stage)
+                if not self._running:
+                    break
+                self._finish(*self._done.get())
+        finally:
+            pool.shutdown(wait=False)
+        return self.statuses()
+
+    def statuses(self) -> Dict[str, Dict[str, str]]:
+        return {table: {name: self.state.get(table, name)['status'] for name in STAGE_NAMES}
+                for table in self.tables}
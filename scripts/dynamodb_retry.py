@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Retry policy and dead-letter file for DynamoDB writes
+
+RetryPolicy retries transient failures (throttling, 5xx, dropped
+connections) with capped exponential backoff and full jitter. Writes that
+still fail are spilled to a DeadLetterFile: one compact JSON line per
+item in DynamoDB wire format, with binary values base64 encoded, so
+replay-dead-letters.py can re-drive exactly those items later instead of
+re-copying a whole table. Deletes that fail are spilled as their key, in
+records marked "delete", and are re-driven as deletes.
+"""
+
+import base64
+import json
+import random
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+from botocore.exceptions import (
+    ClientError,
+    ConnectionError as BotocoreConnectionError,
+    IncompleteReadError,
+    ReadTimeoutError,
+    ResponseStreamingError,
+)
+
+from dynamodb_delta_sync import canonical_attr, to_wire
+from dynamodb_throttle import THROTTLE_ERROR_CODES, is_throttle_error
+
+DEFAULT_MAX_ATTEMPTS = 8
+DEFAULT_BASE_DELAY_SECONDS = 0.05
+DEFAULT_MAX_DELAY_SECONDS = 20.0
+
+# Server-side errors that are worth another attempt besides throttling
+TRANSIENT_ERROR_CODES = THROTTLE_ERROR_CODES + (
+    'InternalServerError',
+    'ServiceUnavailable',
+    'TransactionInProgressException',
+    'RequestTimeout',
+    'SlowDown',
+)
+
+
+class RetryPolicy:
+    """Capped exponential backoff with full jitter"""
+
+    def __init__(self, max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+                 base_delay: float = DEFAULT_BASE_DELAY_SECONDS,
+                 max_delay: float = DEFAULT_MAX_DELAY_SECONDS):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int) -> float:
+        """Seconds to wait before retry number attempt (1-based)"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def is_retryable(self, error: Exception) -> bool:
+        if isinstance(error, ClientError):
+            code = error.response.get('Error', {}).get('Code')
+            status = error.response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0)
+            return code in TRANSIENT_ERROR_CODES or status >= 500
+        # Dropped connections, including ones that break a streaming S3 body
+        return isinstance(error, (BotocoreConnectionError, ReadTimeoutError,
+                                  IncompleteReadError, ResponseStreamingError))
+
+    def call(self, fn: Callable, *args, **kwargs):
+        """Call fn, retrying transient errors; the last error is raised"""
+        return self._call(fn, args, kwargs, retry_throttles=True)
+
+    def call_except_throttles(self, fn: Callable, *args, **kwargs):
+        """Like call, but throttling errors are raised at once
+
+        For callers that pace themselves with an AdaptiveRateController and
+        need to see every throttle to back off, while 5xx errors and
+        dropped connections are still retried here.
+        """
+        return self._call(fn, args, kwargs, retry_throttles=False)
+
+    def _call(self, fn: Callable, args, kwargs, retry_throttles: bool):
+        attempt = 0
+        while True:
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                if not retry_throttles and is_throttle_error(e):
+                    raise
+                attempt += 1
+                if attempt >= self.max_attempts or not self.is_retryable(e):
+                    raise
+                time.sleep(self.delay(attempt))
+
+
+def decode_attr(attr: Dict) -> Dict:
+    """Inverse of canonical_attr: JSON-safe AttributeValue back to wire format"""
+    (kind, value), = attr.items()
+    if kind == 'B':
+        return {'B': base64.b64decode(value)}
+    if kind == 'BS':
+        return {'BS': [base64.b64decode(v) for v in value]}
+    if kind == 'M':
+        return {'M': {k: decode_attr(v) for k, v in value.items()}}
+    if kind == 'L':
+        return {'L': [decode_attr(v) for v in value]}
+    return {kind: value}
+
+
+class DeadLetterFile:
+    """Append-only JSONL file of items whose writes failed for good
+
+    The file is only created once the first item fails. Every record is
+    flushed as it is written so a crash loses nothing already spilled.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.count = 0
+        self._lock = threading.Lock()
+        self._file = None
+
+    def add(self, table_name: str, item: Dict, error, raw: bool = False, source: Optional[str] = None,
+            delete: bool = False):
+        """Spill one item, or with delete=True the key of a failed delete
+
+        raw=False items are plain Python values from the resource API.
+        """
+        wire = to_wire(item, raw)
+        record = {
+            'table': table_name,
+            'key' if delete else 'item': {name: canonical_attr(attr) for name, attr in wire.items()},
+            'error': str(error),
+            'failed_at': datetime.now().isoformat()
+        }
+        if delete:
+            record['delete'] = True
+        if source:
+            record['source'] = source
+        line = json.dumps(record, separators=(',', ':')) + '\n'
+        with self._lock:
+            if self._file is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._file = open(self.path, 'a')
+            self._file.write(line)
+            self._file.flush()
+            self.count += 1
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+
+def read_dead_letters(path: Path) -> Iterator[Tuple[str, Dict, bool]]:
+    """(table, wire-format item or key, is a delete) for every record in a dead-letter file"""
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A crash can leave a partial last line
+                continue
+            delete = record.get('delete', False)
+            attrs = record['key'] if delete else record['item']
+            yield record['table'], {name: decode_attr(attr) for name, attr in attrs.items()}, delete
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Streaming reader for DynamoDB S3 export data files
+
+Export data files are gzipped JSON lines of {"Item": {...}} in wire
+format; incremental exports hold change records instead (see
+iter_export_changes). The reader pulls the S3 body in fixed-size chunks, inflates each
+chunk with a bounded output size and yields one item per line, so memory
+stays constant whatever the size of the file.
+
+Parsing the JSON lines is the CPU-heavy part; orjson is used for it when
+installed.
+"""
+
+import json
+import zlib
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Compressed bytes read from S3 per call
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+# Upper bound on decompressed bytes produced from one step of a chunk
+MAX_INFLATE_BYTES = 4 * 1024 * 1024
+
+# Incremental exports go under their own prefix so full-export tooling never mistakes them for items
+INCREMENTAL_PREFIX = 'incremental-exports'
+
+JSON_PARSER = 'orjson' if orjson else 'json'
+_loads = orjson.loads if orjson else json.loads
+
+
+def iter_gzip_lines(body, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[bytes]:
+    """Lines of a gzip stream read from a file-like body, without line endings"""
+    decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+    pending = b''
+
+    def inflate(data: bytes) -> Iterator[bytes]:
+        nonlocal decompressor
+        while data:
+            out = decompressor.decompress(data, MAX_INFLATE_BYTES)
+            yield out
+            data = decompressor.unconsumed_tail
+            if decompressor.eof:
+                # Concatenated gzip members continue after the end of the first
+                data = decompressor.unused_data + data
+                decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+
+    while True:
+        chunk = body.read(chunk_size)
+        if not chunk:
+            break
+        for out in inflate(chunk):
+            pending += out
+            if b'\n' not in out:
+                continue
+            lines = pending.split(b'\n')
+            pending = lines.pop()
+            yield from lines
+
+    pending += decompressor.flush()
+    if pending:
+        yield pending
+
+
+def iter_export_items(body, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                      on_bad_line: Optional[Callable[[bytes, Exception], None]] = None) -> Iterator[Dict]:
+    """Wire-format items of one export data file
+
+    Lines that are not valid JSON go to on_bad_line and are skipped.
+    """
+    for line in iter_gzip_lines(body, chunk_size):
+        if not line.strip():
+            continue
+        try:
+            record = _loads(line)
+        except ValueError as e:
+            if on_bad_line:
+                on_bad_line(line, e)
+            continue
+        if 'Item' in record:
+            yield record['Item']
+
+
+def iter_export_changes(body, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                        on_bad_line: Optional[Callable[[bytes, Exception], None]] = None) -> Iterator[Dict]:
+    """Change records of one incremental export data file
+
+    Each is {"Keys", "NewImage", "OldImage", "Metadata"} in wire format:
+    an item deleted during the export window has no NewImage, and one
+    created during it has no OldImage.
+    """
+    for line in iter_gzip_lines(body, chunk_size):
+        if not line.strip():
+            continue
+        try:
+            record = _loads(line)
+        except ValueError as e:
+            if on_bad_line:
+                on_bad_line(line, e)
+            continue
+        if 'Keys' in record:
+            yield record
+
+
+def iter_export_writes(body, incremental: bool = False, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                       on_bad_line: Optional[Callable[[bytes, Exception], None]] = None) -> Iterator[Tuple[Dict, bool]]:
+    """(item, False) for every item to put, (keys, True) for every item deleted
+
+    A full export file only has puts; an incremental one has a put for
+    every NewImage and a delete for every record without one.
+    """
+    if not incremental:
+        for item in iter_export_items(body, chunk_size, on_bad_line):
+            yield item, False
+        return
+    for record in iter_export_changes(body, chunk_size, on_bad_line):
+        new_image = record.get('NewImage')
+        if new_image is None:
+            yield record['Keys'], True
+        else:
+            yield new_image, False
+
+
+def open_export_file(s3_client, bucket: str, key: str):
+    """Streaming body of an export data file"""
+    return s3_client.get_object(Bucket=bucket, Key=key)['Body']
@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""
+Compact local snapshots of DynamoDB tables
+
+A snapshot is a directory holding manifest.json and a set of chunk files.
+Each chunk is a sequence of blocks; a block is a zlib-compressed JSON
+array of items in DynamoDB wire format, behind an 8-byte header
+(compressed length, item count). Binary values are base64 encoded, the
+only attributes that need a pass after parsing. Restoring a block costs
+one inflate and one JSON parse (orjson when installed), and the items go
+to BatchWriteItem without a TypeDeserializer pass, so restore speed is set
+by write capacity rather than by parsing.
+
+Every chunk has a sorted key index (.idx, zlib-compressed JSON) mapping
+each primary key to the offset of its block, and the manifest carries the
+table schema, taken from exports/dynamodb-schemas when a matching file
+exists. Chunks are independent, so a restore hands them to a pool of
+processes.
+"""
+
+import bisect
+import hashlib
+import json
+import os
+import re
+import struct
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import boto3
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from dynamodb_copy_engine import ThrottledBatchWriter
+from dynamodb_delta_sync import canonical_attr, key_text
+from dynamodb_retry import DEFAULT_MAX_ATTEMPTS, DeadLetterFile, RetryPolicy, decode_attr
+from dynamodb_throttle import DEFAULT_INITIAL_WRITE_RATE, AdaptiveRateController
+from dynamodb_verify import TableScanner
+
+SNAPSHOT_FORMAT = 'bebco-dynamodb-snapshot'
+SNAPSHOT_VERSION = 1
+
+MANIFEST_NAME = 'manifest.json'
+
+SCHEMA_DIR = Path(__file__).resolve().parent.parent / 'exports' / 'dynamodb-schemas'
+
+# Items per compressed block; the unit of decoding and of index lookups
+DEFAULT_BLOCK_ITEMS = 500
+
+# Items per chunk file; the unit of parallel restore
+DEFAULT_CHUNK_ITEMS = 100000
+
+DEFAULT_RESTORE_PROCESSES = os.cpu_count() or 1
+
+_BLOCK_HEADER = struct.Struct('>II')
+
+# Attribute types that hold binary values at any depth
+_BINARY_KINDS = frozenset(('B', 'BS', 'M', 'L'))
+
+_loads = orjson.loads if orjson else json.loads
+
+# bebco-borrower-<name>-<env> tables were created from bebco-borrower-staging-<name>
+_ENV_TABLE = re.compile(r'^bebco-borrower-(?!staging-)(?P<name>.+)-[a-z0-9]+$')
+
+
+class SnapshotError(Exception):
+    """Snapshot directory missing, of another format, or damaged"""
+
+
+def find_schema_file(table_name: str, schema_dir: Path = SCHEMA_DIR) -> Optional[Path]:
+    """Exported describe_table output for a table or the staging table it came from"""
+    path = Path(schema_dir) / f"{table_name}.json"
+    if path.exists():
+        return path
+    match = _ENV_TABLE.match(table_name)
+    if match:
+        path = Path(schema_dir) / f"bebco-borrower-staging-{match.group('name')}.json"
+        if path.exists():
+            return path
+    return None
+
+
+def resolve_schema(client, table_name: str, schema_dir: Path = SCHEMA_DIR) -> Tuple[Dict, str]:
+    """(schema, where it came from) for a table being snapshotted
+
+    The exported schema file is used when its key schema matches the live
+    table; otherwise the live description is.
+    """
+    live = client.describe_table(TableName=table_name)['Table']
+    path = find_schema_file(table_name, schema_dir)
+    if path:
+        with open(path) as f:
+            exported = json.load(f)['Table']
+        if exported['KeySchema'] == live['KeySchema']:
+            return exported, str(path)
+    return live, 'describe_table'
+
+
+def key_names_of(schema: Dict) -> List[str]:
+    """Primary key attribute names, hash key first"""
+    keys = sorted(schema['KeySchema'], key=lambda k: k['KeyType'] != 'HASH')
+    return [k['AttributeName'] for k in keys]
+
+
+def create_table_request(schema: Dict, table_name: str) -> Dict:
+    """create_table arguments for an on-demand table shaped like schema"""
+    request = {
+        'TableName': table_name,
+        'KeySchema': schema['KeySchema'],
+        'AttributeDefinitions': schema['AttributeDefinitions'],
+        'BillingMode': 'PAY_PER_REQUEST'
+    }
+    for kind in ('GlobalSecondaryIndexes', 'LocalSecondaryIndexes'):
+        if schema.get(kind):
+            request[kind] = [
+                {'IndexName': index['IndexName'], 'KeySchema': index['KeySchema'],
+                 'Projection': index['Projection']}
+                for index in schema[kind]
+            ]
+    stream = schema.get('StreamSpecification')
+    if stream and stream.get('StreamEnabled'):
+        request['StreamSpecification'] = stream
+    return request
+
+
+def _dumps(value) -> bytes:
+    if orjson:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(',', ':')).encode('utf-8')
+
+
+def encode_item(item: Dict) -> Dict:
+    """JSON-safe wire-format item, binary values base64 encoded"""
+    return {name: canonical_attr(attr) if next(iter(attr)) in _BINARY_KINDS else attr
+            for name, attr in item.items()}
+
+
+def decode_item(item: Dict) -> Dict:
+    """Inverse of encode_item"""
+    for name, attr in item.items():
+        if next(iter(attr)) in _BINARY_KINDS:
+            item[name] = decode_attr(attr)
+    return item
+
+
+class ChunkWriter:
+    """Writes one chunk file and its key index"""
+
+    def __init__(self, path: Path, key_names: List[str], block_items: int = DEFAULT_BLOCK_ITEMS):
+        self.path = Path(path)
+        self.key_names = key_names
+        self.block_items = block_items
+        self.items = 0
+        self.bytes = 0
+        self._block: List[Dict] = []
+        self._index: List[Tuple[str, int]] = []
+        self._sha256 = hashlib.sha256()
+        self._file = open(self.path, 'wb')
+
+    def add(self, item: Dict):
+        self._index.append((key_text(item, self.key_names), self.bytes))
+        self._block.append(encode_item(item))
+        self.items += 1
+        if len(self._block) >= self.block_items:
+            self._write_block()
+
+    def _write_block(self):
+        payload = zlib.compress(_dumps(self._block), 6)
+        data = _BLOCK_HEADER.pack(len(payload), len(self._block)) + payload
+        self._file.write(data)
+        self._sha256.update(data)
+        self.bytes += len(data)
+        self._block = []
+
+    def close(self) -> Dict:
+        """Finish the chunk and return its manifest entry"""
+        if self._block:
+            self._write_block()
+        self._file.close()
+        self._index.sort()
+        index_path = self.path.with_suffix('.idx')
+        index = {'keys': [key for key, _ in self._index], 'offsets': [offset for _, offset in self._index]}
+        with open(index_path, 'wb') as f:
+            f.write(zlib.compress(_dumps(index), 6))
+        return {
+            'file': self.path.name,
+            'index': index_path.name,
+            'items': self.items,
+            'bytes': self.bytes,
+            'sha256': self._sha256.hexdigest()
+        }
+
+
+def iter_chunk_blocks(path: Path, start: int = 0) -> Iterator[List[Dict]]:
+    """Item lists of a chunk's blocks, from byte offset start"""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while True:
+            header = f.read(_BLOCK_HEADER.size)
+            if not header:
+                return
+            if len(header) < _BLOCK_HEADER.size:
+                raise SnapshotError(f"{path}: truncated block header")
+            length, count = _BLOCK_HEADER.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length:
+                raise SnapshotError(f"{path}: truncated block")
+            items = _loads(zlib.decompress(payload))
+            if len(items) != count:
+                raise SnapshotError(f"{path}: block holds {len(items)} items, header says {count}")
+            yield [decode_item(item) for item in items]
+
+
+def dump_table(region: str, table_name: str, output_dir: Path, total_segments: int = 1,
+               max_read_units: Optional[float] = None,
+               chunk_items: int = DEFAULT_CHUNK_ITEMS,
+               block_items: int = DEFAULT_BLOCK_ITEMS,
+               schema_dir: Path = SCHEMA_DIR) -> Dict:
+    """Snapshot a table into output_dir and return the manifest
+
+    Each scan segment writes its own chunks, rolling over every
+    chunk_items items.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    client = boto3.client('dynamodb', region_name=region)
+    schema, schema_source = resolve_schema(client, table_name, schema_dir)
+    key_names = key_names_of(schema)
+    started = time.monotonic()
+
+    chunks: List[List[Dict]] = [[] for _ in range(max(1, total_segments))]
+    writers: Dict[int, ChunkWriter] = {}
+
+    def make_sink(segment):
+        def sink(item):
+            writer = writers.get(segment)
+            if writer is None:
+                number = len(chunks[segment])
+                writer = ChunkWriter(output_dir / f"chunk-{segment:03d}-{number:04d}.bin", key_names, block_items)
+                writers[segment] = writer
+            writer.add(item)
+            if writer.items >= chunk_items:
+                chunks[segment].append(writer.close())
+                del writers[segment]
+        return sink
+
+    scanner = TableScanner(region, table_name, key_names, total_segments, max_read_units)
+    scanner.scan(make_sink)
+    for segment, writer in writers.items():
+        chunks[segment].append(writer.close())
+
+    manifest = {
+        'format': SNAPSHOT_FORMAT,
+        'version': SNAPSHOT_VERSION,
+        'table': table_name,
+        'region': region,
+        'created_at': datetime.now().isoformat(),
+        'elapsed_seconds': round(time.monotonic() - started, 1),
+        'schema_source': schema_source,
+        'schema': {k: schema[k] for k in ('KeySchema', 'AttributeDefinitions', 'GlobalSecondaryIndexes',
+                                          'LocalSecondaryIndexes', 'StreamSpecification') if k in schema},
+        'key_names': key_names,
+        'items': sum(chunk['items'] for segment in chunks for chunk in segment),
+        'bytes': sum(chunk['bytes'] for segment in chunks for chunk in segment),
+        'chunks': [chunk for segment in chunks for chunk in segment]
+    }
+    tmp = output_dir / (MANIFEST_NAME + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, output_dir / MANIFEST_NAME)
+    return manifest
+
+
+class Snapshot:
+    """A snapshot directory opened for reading"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        try:
+            with open(self.path / MANIFEST_NAME) as f:
+                self.manifest = json.load(f)
+        except FileNotFoundError:
+            raise SnapshotError(f"{self.path}: no {MANIFEST_NAME}; dump not finished?")
+        if self.manifest.get('format') != SNAPSHOT_FORMAT:
+            raise SnapshotError(f"{self.path}: not a {SNAPSHOT_FORMAT} directory")
+        if self.manifest['version'] > SNAPSHOT_VERSION:
+            raise SnapshotError(f"{self.path}: snapshot version {self.manifest['version']} is newer than this tool")
+        self.key_names = self.manifest['key_names']
+        self._indexes: Dict[str, Dict[str, List]] = {}
+
+    @property
+    def chunks(self) -> List[Dict]:
+        return self.manifest['chunks']
+
+    def _index(self, chunk: Dict) -> Dict[str, List]:
+        """Sorted keys and their block offsets"""
+        if chunk['file'] not in self._indexes:
+            with open(self.path / chunk['index'], 'rb') as f:
+                self._indexes[chunk['file']] = _loads(zlib.decompress(f.read()))
+        return self._indexes[chunk['file']]
+
+    def get(self, key: Dict) -> Optional[Dict]:
+        """Item with the given wire-format primary key, read from its block only"""
+        wanted = key_text(key, self.key_names)
+        for chunk in self.chunks:
+            index = self._index(chunk)
+            keys = index['keys']
+            position = bisect.bisect_left(keys, wanted)
+            if position < len(keys) and keys[position] == wanted:
+                block = next(iter_chunk_blocks(self.path / chunk['file'], index['offsets'][position]))
+                for item in block:
+                    if key_text(item, self.key_names) == wanted:
+                        return item
+        return None
+
+    def verify(self) -> List[str]:
+        """Chunks whose checksum does not match the manifest"""
+        damaged = []
+        for chunk in self.chunks:
+            sha256 = hashlib.sha256()
+            with open(self.path / chunk['file'], 'rb') as f:
+                for data in iter(lambda: f.read(1024 * 1024), b''):
+                    sha256.update(data)
+            if sha256.hexdigest() != chunk['sha256']:
+                damaged.append(chunk['file'])
+        return damaged
+
+
+def restore_chunk(snapshot_dir: str, chunk_file: str, region: str, target_table: str,
+                  max_write_units: Optional[float], max_attempts: int,
+                  dead_letter_dir: str) -> Dict:
+    """Write one chunk to target_table; runs in a restore worker process"""
+    started = time.monotonic()
+    client = boto3.session.Session().client('dynamodb', region_name=region)
+    controller = AdaptiveRateController(target_table, DEFAULT_INITIAL_WRITE_RATE, max_rate=max_write_units)
+    dead_letter = DeadLetterFile(Path(dead_letter_dir) / f"{target_table}.{Path(chunk_file).stem}.dead-letter.jsonl")
+    items = 0
+
+    def on_failed(requests, error):
+        for request in requests:
+            dead_letter.add(target_table, request['PutRequest']['Item'], error, raw=True)
+
+    with dead_letter:
+        with ThrottledBatchWriter(client, target_table, controller,
+                                  retry_policy=RetryPolicy(max_attempts=max_attempts),
+                                  on_failed=on_failed) as batch:
+            for block in iter_chunk_blocks(Path(snapshot_dir) / chunk_file):
+                for item in block:
+                    batch.put_item(Item=item)
+                items += len(block)
+
+    return {
+        'file': chunk_file,
+        'items': items - dead_letter.count,
+        'failed': dead_letter.count,
+        'dead_letter_file': str(dead_letter.path) if dead_letter.count else None,
+        'elapsed_seconds': round(time.monotonic() - started, 1)
+    }
+
+
+def restore_snapshot(snapshot: Snapshot, region: str, target_table: str,
+                     processes: int = DEFAULT_RESTORE_PROCESSES,
+                     max_write_units: Optional[float] = None,
+                     max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+                     dead_letter_dir: Optional[Path] = None,
+                     on_chunk: Optional[Callable[[Dict], None]] = None) -> Dict:
+    """Restore every chunk into target_table with a pool of processes
+
+    max_write_units is the ceiling for the whole restore, split evenly
+    between the processes.
+    """
+    processes = max(1, min(processes, len(snapshot.chunks) or 1))
+    per_process_units = max_write_units / processes if max_write_units else None
+    dead_letter_dir = Path(dead_letter_dir or snapshot.path)
+    started = time.monotonic()
+    results = []
+
+    # spawn: boto3 sessions and threads do not survive fork
+    with ProcessPoolExecutor(max_workers=processes, mp_context=get_context('spawn')) as pool:
+        futures = [
+            pool.submit(restore_chunk, str(snapshot.path), chunk['file'], region, target_table,
+                        per_process_units, max_attempts, str(dead_letter_dir))
+            for chunk in snapshot.chunks
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if on_chunk:
+                on_chunk(result)
+
+    elapsed = time.monotonic() - started
+    items = sum(r['items'] for r in results)
+    return {
+        'target': target_table,
+        'chunks': len(results),
+        'items_restored': items,
+        'items_failed': sum(r['failed'] for r in results),
+        'dead_letter_files': [r['dead_letter_file'] for r in results if r['dead_letter_file']],
+        'elapsed_seconds': round(elapsed, 1),
+        'items_per_second': round(items / elapsed, 1) if elapsed > 0 else 0.0
+    }
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Adaptive DynamoDB throttle controller
+
+Token bucket measured in capacity units per second whose rate follows AIMD:
+every clean call adds a fixed step, every throttle (exception or
+UnprocessedItems) halves it. Consumed capacity reported by
+ReturnConsumedCapacity is charged against the bucket so the pace tracks
+real RCU/WCU use rather than item counts.
+"""
+
+import threading
+import time
+from typing import Optional
+
+from botocore.exceptions import ClientError
+
+THROTTLE_ERROR_CODES = (
+    'ProvisionedThroughputExceededException',
+    'ThrottlingException',
+    'RequestLimitExceeded',
+)
+
+# Starting rates in capacity units per second; AIMD finds the real limit
+DEFAULT_INITIAL_READ_RATE = 1000.0
+DEFAULT_INITIAL_WRITE_RATE = 500.0
+
+MIN_RATE = 1.0
+INCREASE_STEP = 5.0
+DECREASE_FACTOR = 0.5
+
+# One burst of throttles only halves the rate once
+DECREASE_COOLDOWN_SECONDS = 1.0
+
+
+def is_throttle_error(error: Exception) -> bool:
+    """Check whether an exception is a DynamoDB throttling error"""
+    if isinstance(error, ClientError):
+        return error.response.get('Error', {}).get('Code') in THROTTLE_ERROR_CODES
+    return False
+
+
+def consumed_units(response: dict) -> Optional[float]:
+    """Sum CapacityUnits from a ReturnConsumedCapacity response"""
+    consumed = response.get('ConsumedCapacity')
+    if consumed is None:
+        return None
+    if isinstance(consumed, dict):
+        consumed = [consumed]
+    return float(sum(c.get('CapacityUnits', 0) for c in consumed))
+
+
+class AdaptiveRateController:
+    """Thread-safe AIMD token bucket shared by every worker hitting one table"""
+
+    def __init__(self, name: str, initial_rate: float,
+                 max_rate: Optional[float] = None,
+                 min_rate: float = MIN_RATE,
+                 increase_step: float = INCREASE_STEP,
+                 decrease_factor: float = DECREASE_FACTOR):
+        self.name = name
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+
+        self.rate = min(initial_rate, max_rate) if max_rate else initial_rate
+        self.tokens = self.rate
+        self.throttle_count = 0
+        self.consumed_total = 0.0
+
+        self._lock = threading.Lock()
+        self._last_refill = time.monotonic()
+        self._last_decrease = 0.0
+
+    def _refill(self):
+        """Add tokens for the time since the last refill, capped at one second of burst"""
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def acquire(self, units: float):
+        """Reserve capacity units, sleeping until the bucket can pay for them"""
+        with self._lock:
+            self._refill()
+            self.tokens -= units
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+
+        if wait > 0:
+            time.sleep(wait)
+
+    def record_consumed(self, estimated: float, consumed: Optional[float]):
+        """Charge the difference between the estimate and real consumed capacity"""
+        if consumed is None:
+            return
+        with self._lock:
+            self.tokens -= consumed - estimated
+            self.consumed_total += consumed
+
+    def record_success(self):
+        """Additive increase after a call that was not throttled"""
+        with self._lock:
+            self.rate += self.increase_step
+            if self.max_rate:
+                self.rate = min(self.rate, self.max_rate)
+
+    def record_throttle(self):
+        """Multiplicative decrease after a throttled call"""
+        with self._lock:
+            self.throttle_count += 1
+            now = time.monotonic()
+            if now - self._last_decrease >= DECREASE_COOLDOWN_SECONDS:
+                self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+                self._last_decrease = now
+            # Make the next caller wait for fresh tokens
+            self.tokens = min(self.tokens, 0)
+
+    def snapshot(self) -> dict:
+        """Current controller state for logs and summaries"""
+        with self._lock:
+            return {
+                'table': self.name,
+                'rate': round(self.rate, 1),
+                'max_rate': self.max_rate,
+                'throttle_count': self.throttle_count,
+                'consumed_units': round(self.consumed_total, 1)
+            }
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+Checksum verification of DynamoDB table copies
+
+Every item is placed in a bucket by a hash of its primary key, so the
+same item lands in the same bucket of every table no matter the scan
+order. A bucket holds an order-independent sum of item hashes and an item
+count, and buckets are the leaves of a binary Merkle tree. Comparing two
+trees top down finds the differing buckets without looking at the equal
+ones. Memory is fixed by the tree depth, not the table size.
+
+To name the missing, extra and changed items, the source and every
+target with differing buckets are scanned a second time in full: a scan
+cannot be limited to a key-hash range, so every item is read again and
+per-item digests are kept only for items in differing buckets. Any
+difference therefore roughly doubles the read cost; max_diff_buckets=0
+skips the second pass and reports bucket ranges only.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+import boto3
+
+from dynamodb_delta_sync import item_digest, key_text
+from dynamodb_retry import RetryPolicy
+from dynamodb_throttle import DEFAULT_INITIAL_READ_RATE, AdaptiveRateController, consumed_units, is_throttle_error
+
+# 2^12 = 4096 leaf buckets
+DEFAULT_TREE_DEPTH = 12
+
+# More differing buckets than this is reported as ranges only
+DEFAULT_MAX_DIFF_BUCKETS = 64
+
+# Items listed per target in a report
+DEFAULT_MAX_ITEM_DIFFS = 1000
+
+_KEY_HASH_BITS = 64
+_SUM_MASK = (1 << 128) - 1
+
+
+class ScanStopped(Exception):
+    """A scan was stopped from outside before it covered the table"""
+
+
+def key_hash(pk: str) -> int:
+    """64-bit hash of a primary key's text form"""
+    return int.from_bytes(hashlib.blake2b(pk.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def bucket_of(pk: str, depth: int) -> int:
+    """Leaf bucket of a primary key"""
+    return key_hash(pk) >> (_KEY_HASH_BITS - depth)
+
+
+def bucket_range(first: int, last: int, depth: int) -> str:
+    """Key-hash range covered by leaves first..last, as hex"""
+    shift = _KEY_HASH_BITS - depth
+    low = first << shift
+    high = ((last + 1) << shift) - 1
+    return f'{low:016x}-{high:016x}'
+
+
+class DigestTree:
+    """Merkle tree over key-hash buckets of one table"""
+
+    def __init__(self, depth: int = DEFAULT_TREE_DEPTH):
+        self.depth = depth
+        self.sums = [0] * (1 << depth)
+        self.counts = [0] * (1 << depth)
+
+    def add(self, pk: str, digest: bytes):
+        bucket = bucket_of(pk, self.depth)
+        entry = hashlib.blake2b(pk.encode('utf-8') + digest, digest_size=16).digest()
+        self.sums[bucket] = (self.sums[bucket] + int.from_bytes(entry, 'big')) & _SUM_MASK
+        self.counts[bucket] += 1
+
+    def merge(self, other: 'DigestTree'):
+        """Fold in a tree built from another scan segment"""
+        for i in range(len(self.sums)):
+            self.sums[i] = (self.sums[i] + other.sums[i]) & _SUM_MASK
+            self.counts[i] += other.counts[i]
+
+    @property
+    def item_count(self) -> int:
+        return sum(self.counts)
+
+    def levels(self) -> List[List[bytes]]:
+        """Node hashes from the leaves (levels[0]) up to the root (levels[-1])"""
+        level = [
+            hashlib.blake2b(s.to_bytes(16, 'big') + c.to_bytes(8, 'big'), digest_size=16).digest()
+            for s, c in zip(self.sums, self.counts)
+        ]
+        levels = [level]
+        while len(level) > 1:
+            level = [hashlib.blake2b(level[i] + level[i + 1], digest_size=16).digest()
+                     for i in range(0, len(level), 2)]
+            levels.append(level)
+        return levels
+
+    @property
+    def root(self) -> str:
+        return self.levels()[-1][0].hex()
+
+
+def compare_trees(source: DigestTree, target: DigestTree) -> Tuple[List[int], int]:
+    """Differing leaf buckets, found by descending only into unequal subtrees
+
+    Returns the buckets and the number of tree nodes compared.
+    """
+    source_levels = source.levels()
+    target_levels = target.levels()
+    nodes = [0]
+    compared = 0
+    for depth in range(len(source_levels) - 1, -1, -1):
+        differing = []
+        for node in nodes:
+            compared += 1
+            if source_levels[depth][node] != target_levels[depth][node]:
+                differing.append(node)
+        if depth == 0:
+            return differing, compared
+        nodes = [child for node in differing for child in (2 * node, 2 * node + 1)]
+    return [], compared
+
+
+def collapse_ranges(buckets: List[int], depth: int) -> List[str]:
+    """Merge adjacent buckets into key-hash ranges"""
+    ranges = []
+    start = prev = None
+    for bucket in sorted(buckets):
+        if start is None:
+            start = prev = bucket
+        elif bucket == prev + 1:
+            prev = bucket
+        else:
+            ranges.append(bucket_range(start, prev, depth))
+            start = prev = bucket
+    if start is not None:
+        ranges.append(bucket_range(start, prev, depth))
+    return ranges
+
+
+class TableScanner:
+    """Parallel segmented raw scan of one table, paced by a rate controller"""
+
+    def __init__(self, region: str, table_name: str, key_names: List[str],
+                 total_segments: int = 1, max_read_units: Optional[float] = None,
+                 stop_event: Optional[threading.Event] = None,
+                 retry_policy: Optional[RetryPolicy] = None):
+        self.region = region
+        self.table_name = table_name
+        self.key_names = list(key_names)
+        self.total_segments = max(1, total_segments)
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.controller = AdaptiveRateController(
+            table_name, DEFAULT_INITIAL_READ_RATE, max_rate=max_read_units)
+        # Set when a segment fails; the caller's stop_event is only read
+        self.stop_event = threading.Event()
+        self.caller_stop_event = stop_event
+
+    def _stopped(self) -> bool:
+        return self.stop_event.is_set() or (self.caller_stop_event is not None and self.caller_stop_event.is_set())
+
+    def _scan_segment(self, segment: int, on_item: Callable[[Dict], None]) -> int:
+        # boto3 clients are created per thread from their own session
+        client = boto3.session.Session().client('dynamodb', region_name=self.region)
+        scan_kwargs = {'TableName': self.table_name, 'ReturnConsumedCapacity': 'TOTAL'}
+        if self.total_segments > 1:
+            scan_kwargs['Segment'] = segment
+            scan_kwargs['TotalSegments'] = self.total_segments
+
+        read_estimate = 1.0
+        scanned = 0
+        while not self._stopped():
+            self.controller.acquire(read_estimate)
+            try:
+                response = self.retry_policy.call_except_throttles(client.scan, **scan_kwargs)
+            except Exception as e:
+                if not is_throttle_error(e):
+                    raise
+                self.controller.record_throttle()
+                continue
+
+            consumed = consumed_units(response)
+            self.controller.record_consumed(read_estimate, consumed)
+            self.controller.record_success()
+            if consumed is not None:
+                read_estimate = max(1.0, consumed)
+
+            for item in response.get('Items', []):
+                on_item(item)
+            scanned += len(response.get('Items', []))
+
+            if 'LastEvaluatedKey' not in response:
+                break
+            scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        return scanned
+
+    def scan(self, make_sink: Callable[[int], Callable[[Dict], None]]):
+        """Scan every segment at once; make_sink(segment) gets that segment's raw items"""
+        with ThreadPoolExecutor(max_workers=self.total_segments) as pool:
+            futures = [pool.submit(self._scan_segment, segment, make_sink(segment))
+                       for segment in range(self.total_segments)]
+            try:
+                for future in futures:
+                    future.result()
+            except BaseException:
+                self.stop_event.set()
+                raise
+        if self.caller_stop_event is not None and self.caller_stop_event.is_set():
+            raise ScanStopped(f'scan of {self.table_name} stopped')
+
+    def build_tree(self, depth: int = DEFAULT_TREE_DEPTH) -> DigestTree:
+        """Digest tree of the whole table, one partial tree per segment"""
+        trees = [DigestTree(depth) for _ in range(self.total_segments)]
+
+        def make_sink(segment):
+            tree = trees[segment]
+            return lambda item: tree.add(key_text(item, self.key_names), item_digest(item))
+
+        self.scan(make_sink)
+        tree = trees[0]
+        for other in trees[1:]:
+            tree.merge(other)
+        return tree
+
+    def collect_buckets(self, buckets: Set[int], depth: int) -> Dict[str, bytes]:
+        """Key -> digest for the items that fall in the given buckets, from a full scan"""
+        found: Dict[str, bytes] = {}
+        lock = threading.Lock()
+
+        def make_sink(segment):
+            def sink(item):
+                pk = key_text(item, self.key_names)
+                if bucket_of(pk, depth) in buckets:
+                    with lock:
+                        found[pk] = item_digest(item)
+            return sink
+
+        self.scan(make_sink)
+        return found
+
+
+def diff_items(source_items: Dict[str, bytes], target_items: Dict[str, bytes],
+               limit: int = DEFAULT_MAX_ITEM_DIFFS) -> Dict:
+    """Missing, extra and changed keys between two bucket collections"""
+    missing = sorted(pk for pk in source_items if pk not in target_items)
+    extra = sorted(pk for pk in target_items if pk not in source_items)
+    changed = sorted(pk for pk, digest in source_items.items()
+                     if pk in target_items and target_items[pk] != digest)
+    return {
+        'missing_count': len(missing),
+        'extra_count': len(extra),
+        'changed_count': len(changed),
+        'missing': [json.loads(pk) for pk in missing[:limit]],
+        'extra': [json.loads(pk) for pk in extra[:limit]],
+        'changed': [json.loads(pk) for pk in changed[:limit]]
+    }
+
+
+def verify_tables(region: str, source_table: str, target_tables: List[str], key_names: List[str],
+                  total_segments: int = 1, depth: int = DEFAULT_TREE_DEPTH,
+                  max_read_units: Optional[float] = None,
+                  max_diff_buckets: int = DEFAULT_MAX_DIFF_BUCKETS,
+                  max_item_diffs: int = DEFAULT_MAX_ITEM_DIFFS,
+                  stop_event: Optional[threading.Event] = None) -> Dict:
+    """Compare a source table with each target and describe every difference
+
+    The source and all targets are scanned at the same time, each with
+    total_segments segments. Setting stop_event stops every scan after its
+    current page and raises ScanStopped.
+    """
+    started = time.monotonic()
+    tables = [source_table] + list(target_tables)
+    scanners = {
+        table: TableScanner(region, table, key_names, total_segments, max_read_units, stop_event)
+        for table in tables
+    }
+
+    with ThreadPoolExecutor(max_workers=len(tables)) as pool:
+        futures = {table: pool.submit(scanners[table].build_tree, depth) for table in tables}
+        trees = {table: future.result() for table, future in futures.items()}
+
+    source_tree = trees[source_table]
+    result = {
+        'source': source_table,
+        'source_items': source_tree.item_count,
+        'source_root': source_tree.root,
+        'depth': depth,
+        'total_segments': total_segments,
+        'targets': {}
+    }
+
+    drill_down = {}
+    for target in target_tables:
+        buckets, compared = compare_trees(source_tree, trees[target])
+        result['targets'][target] = {
+            'target': target,
+            'target_items': trees[target].item_count,
+            'target_root': trees[target].root,
+            'match': not buckets,
+            'nodes_compared': compared,
+            'differing_buckets': len(buckets),
+            'differing_ranges': collapse_ranges(buckets, depth)
+        }
+        if buckets and len(buckets) <= max_diff_buckets:
+            drill_down[target] = set(buckets)
+
+    # Second full scan, keeping only items in differing buckets, to name them
+    if drill_down:
+        source_buckets = set().union(*drill_down.values())
+        with ThreadPoolExecutor(max_workers=len(drill_down) + 1) as pool:
+            source_future = pool.submit(scanners[source_table].collect_buckets, source_buckets, depth)
+            target_futures = {
+                target: pool.submit(scanners[target].collect_buckets, buckets, depth)
+                for target, buckets in drill_down.items()
+            }
+            source_items = source_future.result()
+            for target, future in target_futures.items():
+                buckets = drill_down[target]
+                in_scope = {pk: d for pk, d in source_items.items() if bucket_of(pk, depth) in buckets}
+                result['targets'][target]['items'] = diff_items(in_scope, future.result(), max_item_diffs)
+
+    result['read_capacity'] = {table: scanner.controller.snapshot() for table, scanner in scanners.items()}
+    result['duration_seconds'] = round(time.monotonic() - started, 1)
+    return result
@@ -1,179 +1,321 @@
 #!/usr/bin/env python3
 """
 Get comprehensive table counts across all environments
+
+Environments come from config/environments/*-<region>.json (their
+naming.environmentSuffix), and every table's describe_table call is
+issued at once through a bounded thread pool, so the report takes about
+one round trip however many environments exist.
+
+ItemCount is refreshed only about every six hours; --exact also counts
+every table with a parallel COUNT scan and shows both side by side.
+
+Every run is also appended to table-counts-history.sqlite; query growth,
+drift from dev and projected sizes with ./table-count-history.py.
 """
+import argparse
 import boto3
 import json
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from collections import defaultdict
+from pathlib import Path
 
-def get_all_table_counts(region='us-east-2'):
-    dynamodb = boto3.client('dynamodb', region_name=region)
-    
-    print("Fetching all DynamoDB table counts...")
-    print(f"Region: {region}")
-    print("")
-    
-    # Get all tables
+from dynamodb_copy_engine import DEFAULT_MAX_SEGMENTS
+from dynamodb_count_history import DEFAULT_HISTORY_FILE, TableCountHistory
+from dynamodb_exact_count import (
+    DEFAULT_CACHE_FILE,
+    DEFAULT_MAX_AGE_SECONDS,
+    DEFAULT_PARALLEL_TABLES,
+    DEFAULT_TABLE_TIMEOUT_SECONDS,
+    EXACT,
+    TIMEOUT,
+    ExactCountCache,
+    count_tables,
+)
+
+CONFIG_DIR = Path(__file__).resolve().parent.parent / 'config' / 'environments'
+
+# Copies are compared against this environment
+SOURCE_ENV = 'dev'
+
+# Used when config/environments has nothing for the region
+DEFAULT_ENVS = ['dev', 'jpl', 'din']
+
+# describe_table calls in flight at once
+DEFAULT_DESCRIBE_WORKERS = 32
+
+def load_environment_suffixes(region='us-east-2', config_dir=CONFIG_DIR):
+    """Table suffixes of every environment configured in the region, dev first"""
+    suffixes = set()
+    for path in sorted(Path(config_dir).glob(f'*-{region}.json')):
+        with open(path) as f:
+            config = json.load(f)
+        suffix = config.get('naming', {}).get('environmentSuffix')
+        if suffix and config.get('region', region) == region:
+            suffixes.add(suffix)
+    if not suffixes:
+        return list(DEFAULT_ENVS)
+    return sorted(suffixes, key=lambda s: (s != SOURCE_ENV, s))
+
+def list_tables(dynamodb):
     response = dynamodb.list_tables()
     all_tables = response['TableNames']
-    
+
     # Handle pagination
     while 'LastEvaluatedTableName' in response:
         response = dynamodb.list_tables(
             ExclusiveStartTableName=response['LastEvaluatedTableName']
         )
         all_tables.extend(response['TableNames'])
-    
-    # Filter for dev, jpl, din tables
-    target_tables = [t for t in all_tables if t.endswith(('-dev', '-jpl', '-din'))]
-    target_tables.sort()
-    
-    print(f"Found {len(target_tables)} tables across dev, jpl, din environments")
+
+    return all_tables
+
+def get_all_table_counts(region='us-east-2', envs=None, workers=DEFAULT_DESCRIBE_WORKERS):
+    envs = envs or load_environment_suffixes(region)
+    # One client shared by the pool; its connection pool must be as large
+    dynamodb = boto3.client('dynamodb', region_name=region,
+                            config=Config(max_pool_connections=max(10, workers)))
+
+    print("Fetching all DynamoDB table counts...")
+    print(f"Region: {region}")
+    print(f"Environments: {', '.join(envs)}")
+    print("")
+
+    suffixes = tuple(f'-{env}' for env in envs)
+    target_tables = sorted(t for t in list_tables(dynamodb) if t.endswith(suffixes))
+
+    print(f"Found {len(target_tables)} tables across {len(envs)} environments")
     print("")
-    
+
+    def describe(table_name):
+        try:
+            return table_name, dynamodb.describe_table(TableName=table_name)['Table'], None
+        except Exception as e:
+            return table_name, None, e
+
     # Organize by base name and environment
     table_data = defaultdict(dict)
-    
-    for table_name in target_tables:
-        # Get table details
-        try:
-            table_info = dynamodb.describe_table(TableName=table_name)
-            item_count = table_info['Table']['ItemCount']
-            status = table_info['Table']['TableStatus']
-            
-            # Extract base name and environment
-            if table_name.endswith('-dev'):
-                base_name = table_name[:-4]
-                env = 'dev'
-            elif table_name.endswith('-jpl'):
-                base_name = table_name[:-4]
-                env = 'jpl'
-            elif table_name.endswith('-din'):
-                base_name = table_name[:-4]
-                env = 'din'
-            else:
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(target_tables)))) as pool:
+        for table_name, table, error in pool.map(describe, target_tables):
+            if error:
+                print(f"Error fetching {table_name}: {error}")
                 continue
-            
+
+            base_name, env = table_name.rsplit('-', 1)
             table_data[base_name][env] = {
-                'count': item_count,
-                'status': status,
+                'count': table['ItemCount'],
+                'status': table['TableStatus'],
+                'size_bytes': table.get('TableSizeBytes', 0),
                 'full_name': table_name
             }
-            
-        except Exception as e:
-            print(f"Error fetching {table_name}: {e}")
-    
+
     return table_data
 
-def print_summary(table_data):
+def add_exact_counts(table_data, region='us-east-2', max_read_units=None,
+                     timeout=DEFAULT_TABLE_TIMEOUT_SECONDS, parallel_tables=DEFAULT_PARALLEL_TABLES,
+                     max_segments=DEFAULT_MAX_SEGMENTS, cache=None, max_age_seconds=DEFAULT_MAX_AGE_SECONDS):
+    """Count every table exactly and store the result under its 'exact' key"""
+    entries = {entry['full_name']: entry for by_env in table_data.values() for entry in by_env.values()}
+    budget = f"{max_read_units:g} RCU/s" if max_read_units else "adaptive"
+    print(f"Counting {len(entries)} tables exactly ({parallel_tables} at a time, {budget}, "
+          f"{timeout:g}s timeout per table)...")
+
+    def on_result(result):
+        if result.get('cached'):
+            detail = f"cached {result['age_seconds']}s ago"
+        else:
+            detail = f"{result['segments']} segments, {result['elapsed_seconds']}s, {result['consumed_units']:,.0f} RCU"
+        if result['status'] == EXACT:
+            print(f"  ✓ {result['table']}: {result['count']:,} ({detail})", flush=True)
+        elif result['status'] == TIMEOUT:
+            print(f"  ⏱ {result['table']}: at least {result['count']:,} (timed out; {detail})", flush=True)
+        else:
+            print(f"  ✗ {result['table']}: {result['error']}", flush=True)
+
+    results = count_tables(
+        region, {name: entry['size_bytes'] for name, entry in entries.items()},
+        max_read_units=max_read_units,
+        timeout=timeout,
+        parallel_tables=parallel_tables,
+        max_segments=max_segments,
+        cache=cache,
+        max_age_seconds=max_age_seconds,
+        on_result=on_result
+    )
+    for name, result in results.items():
+        entries[name]['exact'] = result
+    print("")
+
+def best_count(entry):
+    """Exact count when one finished, otherwise ItemCount"""
+    exact = entry.get('exact')
+    if exact and exact['status'] == EXACT:
+        return exact['count']
+    return entry.get('count', 0)
+
+def format_count(entry, exact_mode):
+    if not exact_mode:
+        count = entry.get('count', 0)
+        return f"{count:,}" if count > 0 else "-"
+    if not entry:
+        return "-"
+    approx = f"(~{entry['count']:,})"
+    exact = entry.get('exact')
+    if not exact:
+        return f"? {approx}"
+    if exact['status'] == EXACT:
+        return f"{exact['count']:,} {approx}"
+    if exact['status'] == TIMEOUT:
+        return f">={exact['count']:,} {approx}"
+    return f"error {approx}"
+
+def print_summary(table_data, envs, exact_mode=False):
     """Print formatted summary"""
-    
-    print("="*120)
-    print(f"{'TABLE NAME':<50} {'DEV':<20} {'JPL':<20} {'DIN':<20}")
-    print("="*120)
-    
-    dev_total = 0
-    jpl_total = 0
-    din_total = 0
-    
+    copies = [env for env in envs if env != SOURCE_ENV]
+    column = 28 if exact_mode else 16
+    width = 50 + column * len(envs)
+
+    if exact_mode:
+        print("Exact COUNT scan, with describe_table ItemCount in parentheses")
+    print("="*width)
+    print(f"{'TABLE NAME':<50}" + ''.join(f"{env.upper():<{column}}" for env in envs))
+    print("="*width)
+
+    totals = {env: 0 for env in envs}
+    mismatches = []
+
     for base_name in sorted(table_data.keys()):
-        envs = table_data[base_name]
-        
-        dev_count = envs.get('dev', {}).get('count', 0)
-        jpl_count = envs.get('jpl', {}).get('count', 0)
-        din_count = envs.get('din', {}).get('count', 0)
-        
-        dev_total += dev_count
-        jpl_total += jpl_count
-        din_total += din_count
-        
+        counts = {env: best_count(table_data[base_name].get(env, {})) for env in envs}
+        for env in envs:
+            totals[env] += counts[env]
+
         # Color code mismatches
         match_indicator = ""
-        if dev_count > 0:
-            if jpl_count != dev_count or din_count != dev_count:
-                match_indicator = " ⚠️"
-        
-        dev_str = f"{dev_count:,}" if dev_count > 0 else "-"
-        jpl_str = f"{jpl_count:,}" if jpl_count > 0 else "-"
-        din_str = f"{din_count:,}" if din_count > 0 else "-"
-        
-        print(f"{base_name:<50} {dev_str:<20} {jpl_str:<20} {din_str:<20}{match_indicator}")
-    
-    print("="*120)
-    print(f"{'TOTALS':<50} {dev_total:,<20} {jpl_total:,<20} {din_total:,<20}")
-    print("="*120)
+        source_count = counts.get(SOURCE_ENV, 0)
+        if source_count > 0 and any(counts[env] != source_count for env in copies):
+            match_indicator = " ⚠️"
+            mismatches.append({'table': base_name, **counts})
+
+        cells = ''.join(f"{format_count(table_data[base_name].get(env, {}), exact_mode):<{column}}" for env in envs)
+        print(f"{base_name:<50}{cells}{match_indicator}")
+
+    print("="*width)
+    print(f"{'TOTALS':<50}" + ''.join(f"{totals[env]:<{column},}" for env in envs))
+    print("="*width)
     print("")
-    
+
     # Summary statistics
-    tables_with_data = sum(1 for base, envs in table_data.items() if envs.get('dev', {}).get('count', 0) > 0)
-    tables_empty = sum(1 for base, envs in table_data.items() if envs.get('dev', {}).get('count', 0) == 0)
-    
+    tables_with_data = sum(1 for base, counts in table_data.items() if best_count(counts.get(SOURCE_ENV, {})) > 0)
+    tables_empty = len(table_data) - tables_with_data
+
     print(f"Summary:")
     print(f"  Total table groups: {len(table_data)}")
-    print(f"  Tables with data (dev): {tables_with_data}")
-    print(f"  Empty tables (dev): {tables_empty}")
+    print(f"  Tables with data ({SOURCE_ENV}): {tables_with_data}")
+    print(f"  Empty tables ({SOURCE_ENV}): {tables_empty}")
     print("")
-    
-    # Check for mismatches
-    mismatches = []
-    for base_name, envs in table_data.items():
-        dev_count = envs.get('dev', {}).get('count', 0)
-        jpl_count = envs.get('jpl', {}).get('count', 0)
-        din_count = envs.get('din', {}).get('count', 0)
-        
-        if dev_count > 0 and (jpl_count != dev_count or din_count != dev_count):
-            mismatches.append({
-                'table': base_name,
-                'dev': dev_count,
-                'jpl': jpl_count,
-                'din': din_count
-            })
-    
+
     if mismatches:
         print(f"⚠️  Tables with mismatched counts: {len(mismatches)}")
         for m in mismatches:
-            print(f"  - {m['table']}: dev={m['dev']:,}, jpl={m['jpl']:,}, din={m['din']:,}")
+            print(f"  - {m['table']}: " + ', '.join(f"{env}={m[env]:,}" for env in envs))
+        if exact_mode:
+            print("  Counts agree only in number; run ./verify-dynamodb-tables.py to compare contents")
+        else:
+            print("  ItemCount is approximate; rerun with --exact, or ./verify-dynamodb-tables.py for a full comparison")
     else:
         print("✅ All tables synchronized!")
-    
+
     return {
-        'total': {
-            'dev': dev_total,
-            'jpl': jpl_total,
-            'din': din_total
-        },
+        'total': totals,
         'tables_with_data': tables_with_data,
         'tables_empty': tables_empty,
         'mismatches': mismatches
     }
 
-def save_json_report(table_data, summary, filename='table-counts-report.json'):
+def save_json_report(table_data, summary, envs, region='us-east-2', filename='table-counts-report.json'):
     """Save detailed JSON report"""
     report = {
         'timestamp': datetime.now().isoformat(),
-        'region': 'us-east-2',
+        'region': region,
+        'environments': envs,
         'summary': summary,
         'tables': {}
     }
-    
-    for base_name, envs in table_data.items():
-        report['tables'][base_name] = {
-            'dev': envs.get('dev', {}).get('count', 0),
-            'jpl': envs.get('jpl', {}).get('count', 0),
-            'din': envs.get('din', {}).get('count', 0),
-            'dev_table': envs.get('dev', {}).get('full_name', ''),
-            'jpl_table': envs.get('jpl', {}).get('full_name', ''),
-            'din_table': envs.get('din', {}).get('full_name', '')
-        }
-    
+
+    for base_name, by_env in table_data.items():
+        entry = {env: by_env.get(env, {}).get('count', 0) for env in envs}
+        entry.update({f'{env}_table': by_env.get(env, {}).get('full_name', '') for env in envs})
+        for env in envs:
+            exact = by_env.get(env, {}).get('exact')
+            if exact:
+                entry[f'{env}_exact'] = exact['count']
+                entry[f'{env}_exact_status'] = exact['status']
+                entry[f'{env}_counted_at'] = exact['counted_at']
+        report['tables'][base_name] = entry
+
     with open(filename, 'w') as f:
         json.dump(report, f, indent=2)
-    
+
     print(f"\nDetailed JSON report saved to: {filename}")
 
-if __name__ == '__main__':
-    table_data = get_all_table_counts()
-    summary = print_summary(table_data)
-    save_json_report(table_data, summary)
+def save_history(table_data, region='us-east-2', filename=DEFAULT_HISTORY_FILE):
+    """Append this run to the SQLite history"""
+    history = TableCountHistory(Path(filename))
+    try:
+        history.record_run(table_data, region)
+    finally:
+        history.close()
+    print(f"Run added to history: {filename}")
+
+def main():
+    parser = argparse.ArgumentParser(description='DynamoDB item counts of every table in every environment')
+    parser.add_argument('--region', default='us-east-2', help='AWS region (default: us-east-2)')
+    parser.add_argument('--env', action='append', metavar='SUFFIX',
+                        help='Only these environment suffixes, repeatable (default: all in config/environments)')
+    parser.add_argument('--workers', type=int, default=DEFAULT_DESCRIBE_WORKERS,
+                        help=f'describe_table calls in flight at once (default: {DEFAULT_DESCRIBE_WORKERS})')
+    parser.add_argument('--output', default='table-counts-report.json',
+                        help='JSON report file (default: table-counts-report.json)')
+    parser.add_argument('--history-file', default=DEFAULT_HISTORY_FILE,
+                        help=f'SQLite file every run is appended to (default: {DEFAULT_HISTORY_FILE})')
+    parser.add_argument('--no-history', action='store_true', help='Do not record this run in the history')
+    parser.add_argument('--exact', action='store_true',
+                        help='Also count every table with a parallel Select=COUNT scan (consumes read capacity)')
+    parser.add_argument('--max-rcu', type=float,
+                        help='Read capacity units per second for all exact counts together (default: adaptive)')
+    parser.add_argument('--table-timeout', type=float, default=DEFAULT_TABLE_TIMEOUT_SECONDS,
+                        help=f'Seconds before a table\'s count is reported as a lower bound (default: {DEFAULT_TABLE_TIMEOUT_SECONDS})')
+    parser.add_argument('--parallel-tables', type=int, default=DEFAULT_PARALLEL_TABLES,
+                        help=f'Tables counted at once (default: {DEFAULT_PARALLEL_TABLES})')
+    parser.add_argument('--max-segments', type=int, default=DEFAULT_MAX_SEGMENTS,
+                        help=f'Upper bound on scan segments per table (default: {DEFAULT_MAX_SEGMENTS})')
+    parser.add_argument('--cache-file', default=DEFAULT_CACHE_FILE,
+                        help=f'Where exact counts are cached (default: {DEFAULT_CACHE_FILE})')
+    parser.add_argument('--max-age', type=float, default=DEFAULT_MAX_AGE_SECONDS,
+                        help=f'Reuse cached exact counts younger than this many seconds, 0 to recount (default: {DEFAULT_MAX_AGE_SECONDS})')
+    args = parser.parse_args()
 
+    envs = args.env or load_environment_suffixes(args.region)
+    if SOURCE_ENV not in envs:
+        envs = [SOURCE_ENV] + envs
+    table_data = get_all_table_counts(args.region, envs, args.workers)
+    if args.exact:
+        add_exact_counts(
+            table_data, args.region,
+            max_read_units=args.max_rcu,
+            timeout=args.table_timeout,
+            parallel_tables=args.parallel_tables,
+            max_segments=args.max_segments,
+            cache=ExactCountCache(Path(args.cache_file)),
+            max_age_seconds=args.max_age
+        )
+    summary = print_summary(table_data, envs, args.exact)
+    save_json_report(table_data, summary, envs, args.region, args.output)
+    if not args.no_history:
+        save_history(table_data, args.region, args.history_file)
+
+if __name__ == '__main__':
+    main()
@@ -2,21 +2,48 @@
 """
 Import data from S3 exports into existing DynamoDB tables in us-east-2
 Uses batch-write to load data from exported JSON files
+
+All tables import at once: a shared pool of file workers streams the
+export parts of every table, with a cap on files writing to one table.
+
+Progress is journaled per file, so re-running after an interruption
+picks up where the last run stopped (--fresh starts over). Downloaded
+export files are kept in a local cache keyed by ETag, so importing the
+same exports into another environment reads them from disk.
+
+Parsing export lines is CPU bound; with --processes the files are
+imported in that many worker processes so it spreads over the cores.
+
+With --compact, the incremental exports taken after the full export
+(refresh-from-incremental-export.py) are layered on top of it, and only
+the newest version of each primary key is written or deleted.
 """
 
+import argparse
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
 import boto3
-import json
-import gzip
-from decimal import Decimal
-from boto3.dynamodb.types import TypeDeserializer
+
+from dynamodb_compaction import DEFAULT_MAX_MEMORY_KEYS
+from dynamodb_export_cache import DEFAULT_CACHE_DIR, DEFAULT_CACHE_MAX_BYTES, ExportCache
+from dynamodb_import_engine import (
+    DEFAULT_FILE_WORKERS,
+    DEFAULT_PROGRESS_INTERVAL_SECONDS,
+    DEFAULT_TABLE_WRITERS,
+    ConcurrentImporter,
+    ImportJob,
+    ImportJournal,
+    find_export_files,
+)
+from dynamodb_retry import DeadLetterFile
+from dynamodb_s3_export import JSON_PARSER
 
 S3_BUCKET = 'bebco-dynamodb-migration-temp-303555290462'
 TARGET_REGION = 'us-east-2'
 
-s3 = boto3.client('s3', region_name=TARGET_REGION)
-dynamodb = boto3.resource('dynamodb', region_name=TARGET_REGION)
-deserializer = TypeDeserializer()
-
 tables_to_import = [
     ("bebco-borrower-staging-accounts", "bebco-borrower-accounts-dev"),
     ("bebco-borrower-staging-ach-batches", "bebco-borrower-ach-batches-dev"),
@@ -39,109 +66,178 @@ tables_to_import = [
     ("bebco-borrower-staging-users", "bebco-borrower-users-dev"),
 ]
 
-def find_export_data_files(s3_prefix):
-    """Find all .gz data files in the export"""
+DEFAULT_JOURNAL = 'import-journal.jsonl'
+
+def find_export_data_files(s3, source_table, layered=False):
+    """Data files of the export from its manifest, with sizes and item counts"""
     try:
-        # List all objects under the export prefix
-        paginator = s3.get_paginator('list_objects_v2')
-        pages = paginator.paginate(Bucket=S3_BUCKET, Prefix=f"{s3_prefix}/AWSDynamoDB/")
-        
-        data_files = []
-        for page in pages:
-            if 'Contents' in page:
-                for obj in page['Contents']:
-                    if obj['Key'].endswith('.gz') and '/data/' in obj['Key']:
-                        data_files.append(obj['Key'])
-        
-        return data_files
+        data_files, from_manifest = find_export_files(s3, S3_BUCKET, source_table, layered)
     except Exception as e:
-        print(f"  Error finding data files: {e}")
+        print(f"  Error finding data files for {source_table}: {e}")
         return []
+    if data_files and not from_manifest:
+        print(f"  ⚠️  {source_table}: no manifest-files.json, item counts will not be checked")
+    return data_files
+
+def print_progress(progress):
+    """One aggregated progress line, plus the tables still importing"""
+    percent = progress['bytes_done'] / progress['bytes'] * 100 if progress['bytes'] else 100.0
+    failed = f", {progress['files_failed']} failed" if progress['files_failed'] else ''
+    print(f"[{progress['elapsed_seconds']:.0f}s] {progress['files_done']}/{progress['files']} files{failed} "
+          f"({percent:.0f}%), {progress['tables_done']}/{progress['tables']} tables, "
+          f"{progress['items_imported']:,} items ({progress['items_per_second']:.0f} items/sec)", flush=True)
+    for job in progress['jobs']:
+        if job['active_files']:
+            print(f"    {job['target']}: {job['files_done']}/{job['files']} files, "
+                  f"{job['items_imported']:,} items, {job['active_files']} in flight")
+
+def main():
+    parser = argparse.ArgumentParser(description='Import S3 exports into existing DynamoDB tables concurrently')
+    parser.add_argument('--tables', nargs='+', metavar='SOURCE_TABLE',
+                        help='Only import these source tables (default: all of tables_to_import)')
+    parser.add_argument('--file-workers', type=int, default=DEFAULT_FILE_WORKERS,
+                        help=f'Export files imported at once across all tables (default: {DEFAULT_FILE_WORKERS})')
+    parser.add_argument('--table-writers', type=int, default=DEFAULT_TABLE_WRITERS,
+                        help=f'Export files writing to one table at once (default: {DEFAULT_TABLE_WRITERS})')
+    parser.add_argument('--max-wcu', type=float,
+                        help='Ceiling on write capacity units per second per table (default: adaptive)')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='Import files in this many worker processes, one file each at a time, '
+                             'instead of --file-workers threads of one process (default: 1)')
+    parser.add_argument('--progress-interval', type=float, default=DEFAULT_PROGRESS_INTERVAL_SECONDS,
+                        help=f'Seconds between progress reports (default: {DEFAULT_PROGRESS_INTERVAL_SECONDS})')
+    parser.add_argument('--dead-letter-file',
+                        help='JSONL file for items that still fail after retries '
+                             '(default: dead-letter-import-<timestamp>.jsonl)')
+    parser.add_argument('--journal', default=DEFAULT_JOURNAL,
+                        help=f'Per-file progress journal used to resume an interrupted run (default: {DEFAULT_JOURNAL})')
+    parser.add_argument('--fresh', action='store_true',
+                        help='Discard the journal and import every file again')
+    parser.add_argument('--cache-dir', default=str(DEFAULT_CACHE_DIR),
+                        help=f'Local cache of downloaded export files (default: {DEFAULT_CACHE_DIR})')
+    parser.add_argument('--cache-max-gb', type=float, default=DEFAULT_CACHE_MAX_BYTES / 1024 ** 3,
+                        help=f'Size cap of the cache; least recently used files are evicted '
+                             f'(default: {DEFAULT_CACHE_MAX_BYTES // 1024 ** 3})')
+    parser.add_argument('--no-cache', action='store_true', help='Always read export files from S3')
+    parser.add_argument('--compact', action='store_true',
+                        help='Layer the incremental exports after the full one and write only the newest version of every key')
+    parser.add_argument('--compact-dir',
+                        help='Where the compaction key index spills to disk (default: a temporary directory)')
+    parser.add_argument('--compact-memory-keys', type=int, default=DEFAULT_MAX_MEMORY_KEYS,
+                        help=f'Keys per table held in memory before spilling (default: {DEFAULT_MAX_MEMORY_KEYS})')
+    args = parser.parse_args()
+
+    pairs = tables_to_import
+    if args.tables:
+        pairs = [(s, t) for s, t in tables_to_import if s in args.tables]
+        unknown = set(args.tables) - {s for s, _ in pairs}
+        if unknown:
+            parser.error(f"not in tables_to_import: {', '.join(sorted(unknown))}")
+
+    print("="*70)
+    print("DynamoDB Data Import from S3 to Existing Tables")
+    print("="*70)
+    print()
+    print(f"Source: s3://{S3_BUCKET}/exports/")
+    print(f"Target: DynamoDB tables in {TARGET_REGION}")
+    print()
+    if args.processes > 1:
+        workers = f"{args.processes} worker processes"
+    else:
+        workers = f"{args.file_workers} file workers"
+    print(f"Importing {len(pairs)} tables with {workers} (up to {args.table_writers} per table), "
+          f"parsing with {JSON_PARSER}...")
+    print()
 
-def import_table_data(source_table, target_table):
-    """Import data from S3 export into existing DynamoDB table"""
-    s3_prefix = f"exports/{source_table}"
-    
-    print(f"\n{'='*70}")
-    print(f"Importing: {source_table}")
-    print(f"Target: {target_table}")
-    print(f"{'='*70}")
-    
     # Find data files
-    print("  Finding export data files...")
-    data_files = find_export_data_files(s3_prefix)
-    
-    if not data_files:
-        print(f"  ⚠️  No data files found (table may be empty)")
-        return 0
-    
-    print(f"  Found {len(data_files)} data file(s)")
-    
-    # Get table resource
-    table = dynamodb.Table(target_table)
-    
-    total_items = 0
-    
-    for i, data_file in enumerate(data_files, 1):
-        print(f"  Processing file {i}/{len(data_files)}: {data_file.split('/')[-1]}")
-        
-        try:
-            # Download and decompress file
-            response = s3.get_object(Bucket=S3_BUCKET, Key=data_file)
-            compressed_data = response['Body'].read()
-            json_data = gzip.decompress(compressed_data).decode('utf-8')
-            
-            # Parse items
-            items = []
-            for line in json_data.strip().split('\n'):
-                if line:
-                    item_data = json.loads(line)
-                    # Convert Item wrapper format to regular Python format
-                    if 'Item' in item_data:
-                        dynamodb_item = item_data['Item']
-                        # Deserialize DynamoDB JSON to Python types
-                        python_item = {k: deserializer.deserialize(v) for k, v in dynamodb_item.items()}
-                        items.append(python_item)
-            
-            # Batch write items
-            if items:
-                with table.batch_writer() as batch:
-                    for item in items:
-                        batch.put_item(Item=item)
-                
-                total_items += len(items)
-                print(f"    ✓ Wrote {len(items)} items")
-        
-        except Exception as e:
-            print(f"    ✗ Error: {str(e)[:60]}")
-    
-    print(f"  ✅ Total items imported: {total_items}")
-    return total_items
-
-# Main execution
-print("="*70)
-print("DynamoDB Data Import from S3 to Existing Tables")
-print("="*70)
-print()
-print(f"Source: s3://{S3_BUCKET}/exports/")
-print(f"Target: DynamoDB tables in {TARGET_REGION}")
-print()
-print(f"Importing {len(tables_to_import)} tables...")
-
-total_imported = 0
-
-for source_table, target_table in tables_to_import:
+    s3 = boto3.client('s3', region_name=TARGET_REGION)
+    jobs = []
+    for source_table, target_table in pairs:
+        data_files = find_export_data_files(s3, source_table, args.compact)
+        if not data_files:
+            print(f"  ⚠️  {source_table}: no data files found (table may be empty)")
+        jobs.append(ImportJob(source_table, target_table, data_files))
+    print(f"  Found {sum(job.total_files for job in jobs)} data files")
+    print()
+
+    if args.fresh:
+        Path(args.journal).unlink(missing_ok=True)
+    journal = ImportJournal(args.journal)
+    cache = None
+    if not args.no_cache:
+        cache = ExportCache(args.cache_dir, int(args.cache_max_gb * 1024 ** 3))
+
+    dead_letter = DeadLetterFile(
+        args.dead_letter_file or f"dead-letter-import-{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl")
+    importer = ConcurrentImporter(
+        TARGET_REGION, S3_BUCKET, jobs,
+        file_workers=args.file_workers,
+        table_writers=args.table_writers,
+        max_write_units=args.max_wcu,
+        dead_letter=dead_letter,
+        on_progress=print_progress,
+        progress_interval=args.progress_interval,
+        journal=journal,
+        cache=cache,
+        processes=args.processes,
+        compact=args.compact,
+        compact_dir=args.compact_dir,
+        max_memory_keys=args.compact_memory_keys
+    )
+    resumed = sum(job.files_resumed for job in jobs)
+    if resumed:
+        print(f"  Resuming: {resumed} files already imported per {journal.path}")
+        print()
+
+    if args.compact:
+        print("  Indexing primary keys for compaction before importing...")
+        print()
+    start_time = time.time()
     try:
-        items_imported = import_table_data(source_table, target_table)
-        total_imported += items_imported
-    except Exception as e:
-        print(f"\n✗ Failed to import {source_table}: {str(e)[:80]}\n")
+        result = importer.run()
+    except KeyboardInterrupt:
+        print("\n✗ Interrupted; files in flight were finished")
+        sys.exit(1)
+    finally:
+        dead_letter.close()
+        journal.close()
+    elapsed_time = time.time() - start_time
+
+    print()
+    for job in result['jobs']:
+        status = "✅" if job['complete'] else "✗"
+        print(f"  {status} {job['target']}: {job['items_imported']:,} items from {job['files']} files "
+              f"in {job['elapsed_seconds'] or 0:.1f}s")
+        for failed in job['failed_files']:
+            print(f"      ✗ {failed['key'].split('/')[-1]}: {failed['error'][:60]}")
+        if job['bad_lines']:
+            print(f"      ⚠️  {job['bad_lines']} unparseable lines skipped")
+        if job['duplicates_removed']:
+            print(f"      {job['duplicates_removed']:,} older versions of keys not written")
+        for mismatch in job['count_mismatches']:
+            print(f"      ✗ {mismatch['key'].split('/')[-1]}: read {mismatch['items_read']:,} items, "
+                  f"manifest says {mismatch['manifest_items']:,}")
+
+    print()
+    print("="*70)
+    print(f"✅ Import Complete!")
+    print("="*70)
+    print()
+    print(f"Total items imported: {result['items_imported']:,}")
+    if result['items_resumed']:
+        print(f"Already imported:     {result['items_resumed']:,} (from {journal.path})")
+    if args.compact:
+        print(f"Duplicates removed:   {result['duplicates_removed']:,}")
+    print(f"Time taken:           {elapsed_time:.1f} seconds")
+    if result['cache']:
+        cached = result['cache']
+        print(f"Export cache:         {cached['hits']} files from {cache.root}, {cached['misses']} from S3")
+    if dead_letter.count:
+        print(f"Failed items:         {dead_letter.count:,} (re-drive with ./replay-dead-letters.py {dead_letter.path})")
+    print()
 
-print()
-print("="*70)
-print(f"✅ Import Complete!")
-print("="*70)
-print()
-print(f"Total items imported: {total_imported:,}")
-print()
+    if any(job['failed_files'] or job['count_mismatches'] for job in result['jobs']):
+        sys.exit(1)
 
+if __name__ == '__main__':
+    main()
@@ -1,100 +1,141 @@
 #!/usr/bin/env python3
-"""Import a single table from S3 to us-east-2"""
+"""Import a single table from S3 to us-east-2
 
+Re-running resumes from import-journal-<target-table>.jsonl; pass --fresh
+to start over. Export files are read through the local export cache
+(EXPORT_CACHE_DIR, default ~/.cache/bebco-dynamodb-exports).
+"""
+
+import argparse
 import boto3
-import json
-import gzip
+import os
 import sys
 import time
-from boto3.dynamodb.types import TypeDeserializer
-
-if len(sys.argv) != 3:
-    print("Usage: python3 import-single-table.py <source-table> <target-table>")
-    sys.exit(1)
+from pathlib import Path
 
-source_table = sys.argv[1]
-target_table = sys.argv[2]
+from dynamodb_export_cache import DEFAULT_CACHE_DIR, ExportCache
+from dynamodb_import_engine import (
+    DEFAULT_TABLE_WRITERS,
+    ConcurrentImporter,
+    ImportJob,
+    ImportJournal,
+    find_export_files,
+)
+from dynamodb_retry import DeadLetterFile
+from dynamodb_s3_export import JSON_PARSER
 
 S3_BUCKET = 'bebco-dynamodb-migration-temp-303555290462'
-s3 = boto3.client('s3', region_name='us-east-2')
-dynamodb = boto3.resource('dynamodb', region_name='us-east-2')
-deserializer = TypeDeserializer()
-
-print("=" * 70)
-print(f"Importing: {source_table}")
-print(f"Target:    {target_table}")
-print(f"Region:    us-east-2 ONLY (us-east-1 READ ONLY)")
-print("=" * 70)
-print()
-
-# Find data files
-print("Finding export files in S3...", flush=True)
-s3_prefix = f"exports/{source_table}"
-paginator = s3.get_paginator('list_objects_v2')
-pages = paginator.paginate(Bucket=S3_BUCKET, Prefix=f"{s3_prefix}/AWSDynamoDB/")
-
-data_files = []
-for page in pages:
-    if 'Contents' in page:
-        for obj in page['Contents']:
-            if obj['Key'].endswith('.gz') and '/data/' in obj['Key']:
-                data_files.append(obj['Key'])
-
-if not data_files:
-    print("⚠️  No data files found (table is empty)")
-    sys.exit(0)
-
-print(f"✓ Found {len(data_files)} data files\n")
-
-# Get table resource
-table = dynamodb.Table(target_table)
-
-# Import data
-total_items = 0
-start_time = time.time()
-
-for i, data_file in enumerate(data_files, 1):
-    print(f"File {i}/{len(data_files)}: ", end="", flush=True)
-    
+
+def print_progress(progress):
+    failed = f" ({progress['files_failed']} failed)" if progress['files_failed'] else ''
+    print(f"Files {progress['files_done']}/{progress['files']}{failed}: "
+          f"{progress['items_imported']:,} items ({progress['items_per_second']:.0f} items/sec)", flush=True)
+
+def main():
+    parser = argparse.ArgumentParser(description='Import a single table from S3 to us-east-2')
+    parser.add_argument('source_table')
+    parser.add_argument('target_table')
+    parser.add_argument('--fresh', action='store_true', help='Discard the journal and import every file again')
+    parser.add_argument('--compact', action='store_true',
+                        help='Layer the incremental exports after the full one and write only the newest version of every key')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='Import files in this many worker processes, so parsing uses several cores (default: 1)')
+    args = parser.parse_args()
+
+    source_table = args.source_table
+    target_table = args.target_table
+    s3 = boto3.client('s3', region_name='us-east-2')
+
+    # Transient S3 and DynamoDB errors are retried; items that still fail are spilled for replay
+    dead_letter = DeadLetterFile(f"dead-letter-{target_table}.jsonl")
+
+    # Finished files and offsets into unfinished ones, for resuming
+    journal_path = Path(f"import-journal-{target_table}.jsonl")
+    if args.fresh:
+        journal_path.unlink(missing_ok=True)
+    journal = ImportJournal(journal_path)
+
+    # Exports already downloaded for another environment are read from disk
+    cache = ExportCache(os.environ.get('EXPORT_CACHE_DIR', DEFAULT_CACHE_DIR))
+
+    print("=" * 70)
+    print(f"Importing: {source_table}")
+    print(f"Target:    {target_table}")
+    print(f"Region:    us-east-2 ONLY (us-east-1 READ ONLY)")
+    print(f"Parsing:   {JSON_PARSER}, {args.processes} process(es)")
+    print("=" * 70)
+    print()
+
+    # Find data files
+    print("Finding export files in S3...", flush=True)
+    data_files, from_manifest = find_export_files(s3, S3_BUCKET, source_table, layered=args.compact)
+
+    if not data_files:
+        print("⚠️  No data files found (table is empty)")
+        sys.exit(0)
+
+    print(f"✓ Found {len(data_files)} data files")
+    layers = sum(1 for f in data_files if f.incremental)
+    if layers:
+        print(f"  {layers} of them from incremental exports layered on the full export")
+    if not from_manifest:
+        print("⚠️  No manifest-files.json; item counts will not be checked")
+    print()
+
+    # Several export parts stream into the table at once
+    job = ImportJob(source_table, target_table, data_files)
+    importer = ConcurrentImporter(
+        'us-east-2', S3_BUCKET, [job],
+        file_workers=DEFAULT_TABLE_WRITERS,
+        table_writers=DEFAULT_TABLE_WRITERS,
+        dead_letter=dead_letter,
+        on_progress=print_progress,
+        journal=journal,
+        cache=cache,
+        processes=args.processes,
+        compact=args.compact
+    )
+    if job.files_resumed:
+        print(f"Resuming: {job.files_resumed} of {job.total_files} files already imported\n")
+
+    start_time = time.time()
     try:
-        # Download and decompress
-        response = s3.get_object(Bucket=S3_BUCKET, Key=data_file)
-        json_data = gzip.decompress(response['Body'].read()).decode('utf-8')
-        
-        # Parse items
-        items = []
-        for line in json_data.strip().split('\n'):
-            if line:
-                item_data = json.loads(line)
-                if 'Item' in item_data:
-                    dynamodb_item = item_data['Item']
-                    python_item = {k: deserializer.deserialize(v) for k, v in dynamodb_item.items()}
-                    items.append(python_item)
-        
-        if items:
-            # Batch write
-            with table.batch_writer() as batch:
-                for item in items:
-                    batch.put_item(Item=item)
-            
-            total_items += len(items)
-            elapsed = time.time() - start_time
-            rate = total_items / elapsed if elapsed > 0 else 0
-            print(f"✓ {len(items)} items ({total_items:,} total, {rate:.0f} items/sec)")
-        else:
-            print("empty")
-    
-    except Exception as e:
-        print(f"✗ Error: {str(e)[:60]}")
-
-elapsed_time = time.time() - start_time
-print()
-print("=" * 70)
-print(f"✅ IMPORT COMPLETE!")
-print("=" * 70)
-print(f"Table:          {target_table}")
-print(f"Items imported: {total_items:,}")
-print(f"Time taken:     {elapsed_time:.1f} seconds")
-print(f"Average rate:   {total_items/elapsed_time:.0f} items/sec" if elapsed_time > 0 else "")
-print("=" * 70)
+        result = importer.run()['jobs'][0]
+    finally:
+        dead_letter.close()
+        journal.close()
+
+    for failed in result['failed_files']:
+        print(f"✗ {failed['key'].split('/')[-1]}: {failed['error'][:60]}")
+    if result['bad_lines']:
+        print(f"⚠️  {result['bad_lines']} unparseable lines skipped")
+    for mismatch in result['count_mismatches']:
+        print(f"✗ {mismatch['key'].split('/')[-1]}: read {mismatch['items_read']:,} items, "
+              f"manifest says {mismatch['manifest_items']:,}")
+
+    total_items = result['items_imported']
+    elapsed_time = time.time() - start_time
+    print()
+    print("=" * 70)
+    print(f"✅ IMPORT COMPLETE!")
+    print("=" * 70)
+    print(f"Table:          {target_table}")
+    print(f"Items imported: {total_items:,}")
+    if result['items_resumed']:
+        print(f"Already there:  {result['items_resumed']:,} (from {journal.path})")
+    if args.compact:
+        print(f"Duplicates:     {result['duplicates_removed']:,} older versions not written")
+    print(f"Time taken:     {elapsed_time:.1f} seconds")
+    print(f"Export cache:   {cache.hits} files from disk, {cache.misses} from S3")
+    print(f"Average rate:   {total_items/elapsed_time:.0f} items/sec" if elapsed_time > 0 else "")
+    if dead_letter.count:
+        print(f"Failed items:   {dead_letter.count:,} (re-drive with ./replay-dead-letters.py {dead_letter.path})")
+    if result['failed_files']:
+        print(f"Failed files:   {len(result['failed_files'])}")
+    print("=" * 70)
+
+    if result['failed_files'] or result['count_mismatches']:
+        sys.exit(1)
 
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Migrate DynamoDB tables from us-east-1 to every environment in us-east-2
+
+One command for what start-all-dynamodb-exports.sh, the status checks,
+start-all-dynamodb-imports.py, copy-dynamodb-tables.py and
+verify-dynamodb-tables.py do by hand: each table is exported, imported as
+its -dev table, copied to the developer tables and verified, and moves to
+its next stage as soon as its own previous stage is done. ARNs and
+progress are kept in the state file instead of text files, so rerunning
+the command resumes the migration.
+"""
+
+import argparse
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+from dynamodb_copy_engine import DEFAULT_MAX_SEGMENTS
+from dynamodb_count_history import TableCountHistory
+from dynamodb_migration import (
+    DEFAULT_MAX_ACTIVE,
+    DEFAULT_POLL_INTERVAL_SECONDS,
+    DEFAULT_STAGE_LIMITS,
+    DONE,
+    FAILED,
+    PENDING,
+    SKIPPED,
+    STAGE_NAMES,
+    START_STAGES,
+    MigrationOrchestrator,
+    MigrationStages,
+    MigrationState,
+)
+
+S3_BUCKET = 'bebco-dynamodb-migration-temp-303555290462'
+SCRIPTS_DIR = Path(__file__).resolve().parent
+TABLES_FILE = SCRIPTS_DIR.parent / 'config' / 'dynamodb-tables-to-migrate.txt'
+TABLE_CONFIG_DIR = SCRIPTS_DIR / 'table-import-configs'
+SCHEMA_DIR = SCRIPTS_DIR.parent / 'exports' / 'dynamodb-schemas'
+
+STATUS_SYMBOLS = {'pending': '·', 'running': '⏳', DONE: '✅', FAILED: '❌', SKIPPED: '-'}
+
+
+def print_event(table, stage, event, detail):
+    timestamp = datetime.now().strftime('%H:%M:%S')
+    if event == 'failed':
+        print(f"[{timestamp}] ❌ {table} {stage}: {detail['error'][:200]}", flush=True)
+    elif event == 'done':
+        summary = ', '.join(f"{k}={v}" for k, v in detail.items() if not isinstance(v, (dict, list)))
+        print(f"[{timestamp}] ✅ {table} {stage}" + (f" ({summary})" if summary else ""), flush=True)
+    else:
+        print(f"[{timestamp}] ▶ {table} {stage}", flush=True)
+
+
+def print_status(state, tables):
+    width = max([len(t) for t in tables] + [10])
+    print(f"{'TABLE':<{width}}  " + ' '.join(f"{name:<11}" for name in STAGE_NAMES))
+    for table in tables:
+        cells = []
+        for name in STAGE_NAMES:
+            status = state.get(table, name)['status']
+            cells.append(f"{STATUS_SYMBOLS.get(status, '?')} {status:<9}")
+        print(f"{table:<{width}}  " + ' '.join(cells))
+    print()
+    for table in tables:
+        for name in STAGE_NAMES:
+            entry = state.get(table, name)
+            if entry['status'] == FAILED:
+                print(f"❌ {table} {name}: {entry.get('error', '')}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Export, import, copy and verify DynamoDB tables as one resumable pipeline',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Migrate every table in config/dynamodb-tables-to-migrate.txt
+  ./migrate-dynamodb-tables.py
+
+  # Tables already imported: copy to the developer tables and verify only
+  ./migrate-dynamodb-tables.py --start-at copy
+
+  # Where every table is
+  ./migrate-dynamodb-tables.py --status
+        """
+    )
+    parser.add_argument('--table', action='append', help='Source table in us-east-1, repeatable (default: all in the tables file)')
+    parser.add_argument('--tables-file', default=str(TABLES_FILE), help='File listing the source tables, one per line')
+    parser.add_argument('--target-env', action='append',
+                        help='Environment suffix copied to from -dev, repeatable (default: jpl and din)')
+    parser.add_argument('--state-file', default='migration-state.json', help='Where progress is kept (default: migration-state.json)')
+    parser.add_argument('--start-at', choices=START_STAGES, default='export',
+                        help='First stage for tables new to the state file (default: export)')
+    parser.add_argument('--retry-failed', action='store_true', help='Run failed stages again')
+    parser.add_argument('--status', action='store_true', help='Print the state of every table and exit')
+    parser.add_argument('--max-active', type=int, default=DEFAULT_MAX_ACTIVE,
+                        help=f'Stages doing work at once across all tables; waits do not count (default: {DEFAULT_MAX_ACTIVE})')
+    for group, limit in DEFAULT_STAGE_LIMITS.items():
+        parser.add_argument(f'--max-{group}s', type=int, default=limit, dest=f'max_{group}s',
+                            help=f'Tables in the {group} stage at once (default: {limit})')
+    parser.add_argument('--poll-interval', type=float, default=DEFAULT_POLL_INTERVAL_SECONDS,
+                        help=f'Seconds between export/import status checks (default: {DEFAULT_POLL_INTERVAL_SECONDS:g})')
+    parser.add_argument('--max-segments', type=int, default=DEFAULT_MAX_SEGMENTS,
+                        help=f'Upper bound on scan segments per table (default: {DEFAULT_MAX_SEGMENTS})')
+    parser.add_argument('--max-rcu', type=float, help='Ceiling on read capacity units per second per table (default: adaptive)')
+    parser.add_argument('--max-wcu', type=float, help='Ceiling on write capacity units per second per table (default: adaptive)')
+    parser.add_argument('--size-history',
+                        help='Table size history written by get-all-table-counts.py, used instead of describe_table for segment counts')
+    args = parser.parse_args()
+
+    if args.table:
+        tables = args.table
+    else:
+        with open(args.tables_file) as f:
+            tables = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+    state = MigrationState(Path(args.state_file))
+    for table in tables:
+        state.add_table(table, args.start_at)
+
+    if args.status:
+        print_status(state, tables)
+        return
+
+    # Stages that were running when the last run stopped start again
+    state.reset((FAILED, 'running') if args.retry_failed else ('running',))
+
+    stages = MigrationStages(
+        S3_BUCKET, TABLE_CONFIG_DIR, args.target_env or ['jpl', 'din'],
+        poll_interval=args.poll_interval,
+        max_segments=args.max_segments,
+        max_read_units=args.max_rcu,
+        max_write_units=args.max_wcu,
+        dead_letter_dir=Path(args.state_file).resolve().parent,
+        size_history=TableCountHistory(args.size_history) if args.size_history else None,
+        schema_dir=SCHEMA_DIR
+    )
+
+    # A table import cannot create fails now, before its export is paid for
+    for table in tables:
+        first = next((name for name in ('export', 'import') if state.get(table, name)['status'] == PENDING), None)
+        if first is None:
+            continue
+        try:
+            stages.table_creation_parameters(table)
+        except Exception as e:
+            state.update(table, first, status=FAILED, error=f'cannot create {table}: {e}')
+            print(f"❌ {table}: cannot create it in us-east-2 ({str(e)[:200]}); skipped")
+    orchestrator = MigrationOrchestrator(
+        tables, state, stages.run,
+        max_active=args.max_active,
+        stage_limits={group: getattr(args, f'max_{group}s') for group in DEFAULT_STAGE_LIMITS},
+        on_event=print_event
+    )
+
+    print("=" * 70)
+    print(f"DynamoDB migration: {len(tables)} tables, us-east-1 (READ ONLY) → us-east-2")
+    print(f"State: {args.state_file}")
+    print("=" * 70)
+    print()
+
+    start_time = time.time()
+    try:
+        statuses = orchestrator.run()
+    except KeyboardInterrupt:
+        stages.stop_event.set()
+        print(f"\nInterrupted; rerun to resume from {args.state_file}")
+        sys.exit(130)
+
+    print()
+    print("=" * 70)
+    print(f"Finished in {time.time() - start_time:.0f}s")
+    print("=" * 70)
+    print_status(state, tables)
+
+    complete = sum(1 for by_stage in statuses.values() if all(s in (DONE, SKIPPED) for s in by_stage.values()))
+    print(f"{complete}/{len(tables)} tables fully migrated")
+    if complete < len(tables):
+        print(f"Fix the errors above and rerun with --retry-failed")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Refresh existing us-east-2 tables with only what changed in us-east-1
+
+Starts incremental point-in-time exports of each us-east-1 table from the
+time the previous refresh reached (or, the first time, from its newest
+full export), waits for them, and streams the changes into the us-east-2
+tables: changed items are put and deleted items deleted. Nothing else is
+read or written, so a refresh takes time in proportion to the change.
+
+Progress is kept in incremental-export-state.json and, per data file, in
+the journal; rerunning resumes. A window with writes that failed after
+retries, or with records that could not be parsed, is not marked applied,
+so the next run applies it again. --no-wait only starts the exports.
+"""
+
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import boto3
+
+from dynamodb_export_cache import DEFAULT_CACHE_DIR, DEFAULT_CACHE_MAX_BYTES, ExportCache
+from dynamodb_import_engine import DEFAULT_TABLE_WRITERS, ImportJournal, export_files_in
+from dynamodb_incremental_export import (
+    DEFAULT_STATE_FILE,
+    EXPORT_TO_LAG,
+    INCREMENTAL_PREFIX,
+    IncrementalExportState,
+    apply_export,
+    export_dir_of,
+    export_windows,
+    newest_full_export_time,
+    start_incremental_export,
+    utc_now,
+)
+from dynamodb_migration import env_table_name
+from dynamodb_retry import RetryPolicy
+from dynamodb_throttle import DEFAULT_INITIAL_WRITE_RATE, AdaptiveRateController
+
+S3_BUCKET = 'bebco-dynamodb-migration-temp-303555290462'
+SOURCE_REGION = 'us-east-1'
+TARGET_REGION = 'us-east-2'
+TABLES_FILE = Path(__file__).resolve().parent.parent / 'config' / 'dynamodb-tables-to-migrate.txt'
+
+DEFAULT_JOURNAL = 'incremental-journal.jsonl'
+DEFAULT_POLL_INTERVAL_SECONDS = 30
+DEFAULT_PARALLEL_TABLES = 4
+
+
+def start_exports(source, state, table, since, retry_policy):
+    """Start exports for the changes after the table's watermark; returns how many were started"""
+    pending = state.pending(table)
+    table_arn = retry_policy.call(source.describe_table, TableName=table)['Table']['TableArn']
+    start = datetime.fromisoformat(pending[-1]['to']) if pending else state.watermark(table)
+    if start is None:
+        start = since or newest_full_export_time(source, table_arn)
+        if start is None:
+            print(f"  ✗ {table}: no full export to start from; pass --since")
+            return 0
+        state.set_watermark(table, start)
+
+    windows = export_windows(start, utc_now() - EXPORT_TO_LAG)
+    for export_from, export_to in windows:
+        arn = retry_policy.call(start_incremental_export, source, table_arn, S3_BUCKET,
+                                f"{INCREMENTAL_PREFIX}/{table}", export_from, export_to)
+        state.add_export(table, arn, export_from, export_to)
+    if windows:
+        print(f"  ▶ {table}: {len(windows)} export(s) of {windows[0][0]:%Y-%m-%d %H:%M} → {windows[-1][1]:%Y-%m-%d %H:%M} UTC")
+    elif not pending:
+        print(f"  · {table}: less than 15 minutes since {start:%Y-%m-%d %H:%M} UTC, nothing to export yet")
+    return len(windows)
+
+
+def wait_for_export(source, arn, poll_interval, retry_policy):
+    while True:
+        export = retry_policy.call(source.describe_export, ExportArn=arn)['ExportDescription']
+        if export['ExportStatus'] != 'IN_PROGRESS':
+            return export
+        time.sleep(poll_interval)
+
+
+def refresh_table(table, args, source, s3, target_client, state, journal, cache, retry_policy):
+    """Apply the table's exports in window order; returns an error message or None"""
+    targets = [env_table_name(table, env) for env in args.target_env]
+    controllers = {t: AdaptiveRateController(t, DEFAULT_INITIAL_WRITE_RATE, max_rate=args.max_wcu) for t in targets}
+
+    for export in state.pending(table):
+        description = wait_for_export(source, export['arn'], args.poll_interval, retry_policy)
+        if description['ExportStatus'] != 'COMPLETED':
+            state.drop_pending(table)
+            return (f"export {export['from']} → {export['to']} {description['ExportStatus']}: "
+                    f"{description.get('FailureCode')} {description.get('FailureMessage', '')}")
+
+        files = export_files_in(s3, S3_BUCKET, export_dir_of(description))
+        started = time.monotonic()
+        counts = apply_export(s3, target_client, S3_BUCKET, targets, files, controllers, retry_policy,
+                              journal=journal, cache=cache, file_workers=args.table_writers)
+        print(f"  ✓ {table} {export['from'][:16]} → {export['to'][:16]}: "
+              f"{counts['inserted']:,} new, {counts['updated']:,} changed, {counts['deleted']:,} deleted "
+              f"in {time.monotonic() - started:.1f}s → {', '.join(targets)}", flush=True)
+        if counts['bad_lines']:
+            return (f"{counts['bad_lines']} unparseable change records in {export['from'][:16]} → {export['to'][:16]}; "
+                    f"window not marked applied")
+        if counts['incomplete_files']:
+            return (f"{counts['failed']:,} writes failed in {counts['incomplete_files']} file(s); "
+                    f"rerun to apply the window again")
+        state.mark_applied(table, export)
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Apply the changes since the last refresh from us-east-1 to us-east-2 tables',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Bring every -dev table up to date
+  ./refresh-from-incremental-export.py
+
+  # Banks only, into the dev and jpl tables, starting from a known time
+  ./refresh-from-incremental-export.py --table bebco-borrower-staging-banks --target-env dev --target-env jpl --since 2025-11-01T00:00:00+00:00
+        """
+    )
+    parser.add_argument('--table', action='append', help='Source table in us-east-1, repeatable (default: all in the tables file)')
+    parser.add_argument('--tables-file', default=str(TABLES_FILE), help='File listing the source tables, one per line')
+    parser.add_argument('--target-env', action='append',
+                        help='Environment suffix of the tables to update, repeatable (default: dev)')
+    parser.add_argument('--since', type=datetime.fromisoformat,
+                        help='Changes after this time (ISO 8601 with offset) for tables not yet in the state file '
+                             '(default: the newest full export)')
+    parser.add_argument('--state-file', default=DEFAULT_STATE_FILE, help=f'Watermarks and pending exports (default: {DEFAULT_STATE_FILE})')
+    parser.add_argument('--journal', default=DEFAULT_JOURNAL, help=f'Per-file apply journal (default: {DEFAULT_JOURNAL})')
+    parser.add_argument('--no-wait', action='store_true', help='Start the exports and exit; rerun later to apply them')
+    parser.add_argument('--poll-interval', type=float, default=DEFAULT_POLL_INTERVAL_SECONDS,
+                        help=f'Seconds between export status checks (default: {DEFAULT_POLL_INTERVAL_SECONDS})')
+    parser.add_argument('--parallel-tables', type=int, default=DEFAULT_PARALLEL_TABLES,
+                        help=f'Tables refreshed at once (default: {DEFAULT_PARALLEL_TABLES})')
+    parser.add_argument('--table-writers', type=int, default=DEFAULT_TABLE_WRITERS,
+                        help=f'Data files applied to one table at once (default: {DEFAULT_TABLE_WRITERS})')
+    parser.add_argument('--max-wcu', type=float, help='Ceiling on write capacity units per second per table (default: adaptive)')
+    parser.add_argument('--no-cache', action='store_true', help='Always read export files from S3')
+    args = parser.parse_args()
+    args.target_env = args.target_env or ['dev']
+    if args.since and args.since.tzinfo is None:
+        parser.error('--since needs a UTC offset, e.g. 2025-11-01T00:00:00+00:00')
+
+    if args.table:
+        tables = args.table
+    else:
+        with open(args.tables_file) as f:
+            tables = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+    # us-east-1 is only exported from, never written
+    source = boto3.client('dynamodb', region_name=SOURCE_REGION)
+    target_client = boto3.client('dynamodb', region_name=TARGET_REGION)
+    s3 = boto3.client('s3', region_name=TARGET_REGION)
+    retry_policy = RetryPolicy()
+    state = IncrementalExportState(Path(args.state_file))
+
+    print("=" * 70)
+    print(f"Incremental refresh: {len(tables)} tables, us-east-1 (READ ONLY) → "
+          f"{', '.join(args.target_env)} tables in us-east-2")
+    print("=" * 70)
+    print()
+    print("Starting exports...")
+    for table in tables:
+        try:
+            start_exports(source, state, table, args.since, retry_policy)
+        except Exception as e:
+            print(f"  ✗ {table}: {str(e)[:120]}")
+    print()
+
+    if args.no_wait:
+        print(f"Exports started; rerun without --no-wait to apply them (state in {args.state_file})")
+        return
+
+    journal = ImportJournal(Path(args.journal))
+    cache = None if args.no_cache else ExportCache(DEFAULT_CACHE_DIR, DEFAULT_CACHE_MAX_BYTES)
+    errors = {}
+
+    print("Applying changes as exports complete...")
+    start_time = time.time()
+
+    def refresh(table):
+        try:
+            error = refresh_table(table, args, source, s3, target_client, state, journal, cache, retry_policy)
+        except Exception as e:
+            error = str(e)
+        if error:
+            errors[table] = error
+            print(f"  ✗ {table}: {error[:200]}", flush=True)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(args.parallel_tables, len(tables)))) as pool:
+            for future in [pool.submit(refresh, table) for table in tables]:
+                future.result()
+    finally:
+        journal.close()
+
+    print()
+    print("=" * 70)
+    print(f"Refresh finished in {time.time() - start_time:.0f}s: {len(tables) - len(errors)}/{len(tables)} tables up to date")
+    print("=" * 70)
+    for table in tables:
+        watermark = state.watermark(table)
+        if watermark:
+            print(f"  {table}: changes applied up to {watermark:%Y-%m-%d %H:%M} UTC")
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
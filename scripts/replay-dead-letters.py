@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Re-drive items from dead-letter files written by the copy and import scripts
+
+Streams the files through a pool of batch writers, paced per target table
+by the adaptive rate controller. Items that fail again are written to a
+new dead-letter file next to the input, so replay can be repeated until
+nothing is left. Records of failed deletes are deleted again.
+"""
+
+import argparse
+import queue
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+import boto3
+
+from dynamodb_copy_engine import ThrottledBatchWriter
+from dynamodb_retry import DEFAULT_MAX_ATTEMPTS, DeadLetterFile, RetryPolicy, read_dead_letters
+from dynamodb_throttle import DEFAULT_INITIAL_WRITE_RATE, AdaptiveRateController
+
+DEFAULT_WORKERS = 8
+
+# Items read ahead of the writers
+QUEUE_DEPTH = 10000
+
+_END = object()
+
+
+def replay(paths, region, workers=DEFAULT_WORKERS, max_wcu=None, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """Write every dead-lettered item back to its table; returns (written, failed, failed file)"""
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    failed_file = DeadLetterFile(Path(paths[0]).with_name(f"{Path(paths[0]).stem}.replay_{timestamp}.jsonl"))
+    retry_policy = RetryPolicy(max_attempts=max_attempts)
+    controllers = {}
+    controllers_lock = threading.Lock()
+    written = Counter()
+    written_lock = threading.Lock()
+    items = queue.Queue(maxsize=QUEUE_DEPTH)
+
+    def controller_for(table_name):
+        with controllers_lock:
+            if table_name not in controllers:
+                controllers[table_name] = AdaptiveRateController(
+                    table_name, DEFAULT_INITIAL_WRITE_RATE, max_rate=max_wcu)
+            return controllers[table_name]
+
+    def worker():
+        # Each worker has its own session and one batch writer per table
+        client = boto3.session.Session().client('dynamodb', region_name=region)
+        writers = {}
+        queued = Counter()
+
+        def writer_for(table_name):
+            if table_name not in writers:
+                def on_failed(requests, error):
+                    for request in requests:
+                        if 'PutRequest' in request:
+                            failed_file.add(table_name, request['PutRequest']['Item'], error, raw=True)
+                        else:
+                            failed_file.add(table_name, request['DeleteRequest']['Key'], error, raw=True, delete=True)
+                writers[table_name] = ThrottledBatchWriter(
+                    client, table_name, controller_for(table_name),
+                    retry_policy=retry_policy, on_failed=on_failed)
+            return writers[table_name]
+
+        while True:
+            entry = items.get()
+            if entry is _END:
+                break
+            table_name, item, delete = entry
+            if delete:
+                writer_for(table_name).delete_item(Key=item)
+            else:
+                writer_for(table_name).put_item(Item=item)
+            queued[table_name] += 1
+
+        for writer in writers.values():
+            writer.flush()
+        with written_lock:
+            written.update(queued)
+
+    threads = [threading.Thread(target=worker, name=f'replay-{n}', daemon=True) for n in range(workers)]
+    for thread in threads:
+        thread.start()
+
+    read = 0
+    try:
+        for path in paths:
+            for entry in read_dead_letters(path):
+                items.put(entry)
+                read += 1
+                if read % 10000 == 0:
+                    print(f"  {read:,} items queued")
+    finally:
+        for _ in threads:
+            items.put(_END)
+        for thread in threads:
+            thread.join()
+        failed_file.close()
+
+    # Written counts include requests later dead-lettered again
+    failed = failed_file.count
+    return written, failed, failed_file.path
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Re-drive items from dead-letter files into their DynamoDB tables',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Replay a copier run's failures
+  ./replay-dead-letters.py dynamodb-copy-logs/dead_letter_20251020_101500.jsonl
+
+  # Replay several files with 16 writers, at most 300 WCU/s per table
+  ./replay-dead-letters.py copy-job-logs/*.dead-letter.jsonl --workers 16 --max-wcu 300
+
+  # Show what would be replayed
+  ./replay-dead-letters.py dead-letter-bebco-borrower-banks-jpl.jsonl --dry-run
+        """
+    )
+    parser.add_argument('files', nargs='+', help='Dead-letter JSONL files')
+    parser.add_argument('--region', default='us-east-2', help='AWS region (default: us-east-2)')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f'Batch writer threads (default: {DEFAULT_WORKERS})')
+    parser.add_argument('--max-wcu', type=float,
+                        help='Ceiling on write capacity units per second per table (default: adaptive)')
+    parser.add_argument('--max-attempts', type=int, default=DEFAULT_MAX_ATTEMPTS,
+                        help=f'Write attempts per batch before items are dead-lettered again (default: {DEFAULT_MAX_ATTEMPTS})')
+    parser.add_argument('--dry-run', action='store_true', help='Count items per table without writing')
+    args = parser.parse_args()
+
+    missing = [f for f in args.files if not Path(f).exists()]
+    if missing:
+        parser.error(f"not found: {', '.join(missing)}")
+
+    if args.dry_run:
+        counts = Counter(table for path in args.files for table, _, _ in read_dead_letters(path))
+        for table_name, count in sorted(counts.items()):
+            print(f"  {table_name}: {count:,} items")
+        print(f"Total: {sum(counts.values()):,} items")
+        return
+
+    print(f"Replaying {len(args.files)} dead-letter files with {args.workers} writers")
+    start_time = time.time()
+    written, failed, failed_path = replay(
+        args.files, args.region,
+        workers=max(1, args.workers),
+        max_wcu=args.max_wcu,
+        max_attempts=args.max_attempts
+    )
+    elapsed = time.time() - start_time
+    total = sum(written.values())
+
+    print("")
+    for table_name, count in sorted(written.items()):
+        print(f"  {table_name}: {count:,} items")
+    rate = total / elapsed if elapsed > 0 else 0
+    print(f"Replayed {total - failed:,} items in {elapsed:.1f}s ({rate:.0f} items/sec)")
+
+    if failed:
+        print(f"✗ {failed:,} items failed again: {failed_path}")
+        sys.exit(1)
+    print("✅ All dead-lettered items written")
+
+
+if __name__ == '__main__':
+    main()
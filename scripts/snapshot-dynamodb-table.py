@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Dump a DynamoDB table to a compact local snapshot, or restore one
+
+Seeding an environment from a snapshot skips S3 exports and DynamoDB JSON
+parsing: chunks are restored by a pool of processes, each with its own
+adaptive write throttle, so the restore runs as fast as the target
+table's write capacity allows.
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+import boto3
+from boto3.dynamodb.types import TypeSerializer
+
+from dynamodb_copy_engine import DEFAULT_MAX_SEGMENTS, resolve_segment_count
+from dynamodb_retry import DEFAULT_MAX_ATTEMPTS
+from dynamodb_snapshot import (
+    DEFAULT_BLOCK_ITEMS,
+    DEFAULT_CHUNK_ITEMS,
+    DEFAULT_RESTORE_PROCESSES,
+    Snapshot,
+    SnapshotError,
+    create_table_request,
+    dump_table,
+    restore_snapshot,
+)
+
+# Snapshots may be taken anywhere; only this region is ever written
+RESTORE_REGION = 'us-east-2'
+
+
+def dump(args):
+    dynamodb = boto3.client('dynamodb', region_name=args.region)
+    segments = resolve_segment_count(dynamodb, args.table, args.segments, args.auto_segments, args.max_segments)
+    print(f"Dumping {args.table} ({args.region}) with {segments} segments to {args.output}")
+
+    manifest = dump_table(
+        args.region, args.table, Path(args.output),
+        total_segments=segments,
+        max_read_units=args.max_rcu,
+        chunk_items=args.chunk_items,
+        block_items=args.block_items
+    )
+    rate = manifest['items'] / manifest['elapsed_seconds'] if manifest['elapsed_seconds'] else 0
+    print(f"✅ {manifest['items']:,} items in {len(manifest['chunks'])} chunks, "
+          f"{manifest['bytes'] / 1024 / 1024:.1f} MB, {manifest['elapsed_seconds']}s ({rate:.0f} items/sec)")
+    print(f"   Schema: {manifest['schema_source']}")
+
+
+def restore(args):
+    snapshot = Snapshot(Path(args.snapshot))
+    manifest = snapshot.manifest
+    dynamodb = boto3.client('dynamodb', region_name=RESTORE_REGION)
+
+    if args.verify:
+        damaged = snapshot.verify()
+        if damaged:
+            print(f"✗ Damaged chunks: {', '.join(damaged)}")
+            sys.exit(1)
+
+    try:
+        dynamodb.describe_table(TableName=args.target)
+    except dynamodb.exceptions.ResourceNotFoundException:
+        if not args.create_table:
+            print(f"✗ {args.target} does not exist in {RESTORE_REGION}; pass --create-table to create it from the snapshot schema")
+            sys.exit(1)
+        print(f"Creating {args.target} from the snapshot schema...")
+        dynamodb.create_table(**create_table_request(manifest['schema'], args.target))
+        dynamodb.get_waiter('table_exists').wait(TableName=args.target)
+
+    print(f"Restoring {manifest['table']} snapshot ({manifest['items']:,} items, {len(snapshot.chunks)} chunks) "
+          f"into {args.target} with {args.processes} processes")
+    done = [0]
+
+    def on_chunk(result):
+        done[0] += 1
+        print(f"  [{done[0]}/{len(snapshot.chunks)}] {result['file']}: {result['items']:,} items "
+              f"in {result['elapsed_seconds']}s", flush=True)
+
+    result = restore_snapshot(
+        snapshot, RESTORE_REGION, args.target,
+        processes=args.processes,
+        max_write_units=args.max_wcu,
+        max_attempts=args.max_attempts,
+        dead_letter_dir=Path(args.dead_letter_dir) if args.dead_letter_dir else None,
+        on_chunk=on_chunk
+    )
+
+    print()
+    print(f"✅ Restored {result['items_restored']:,} items in {result['elapsed_seconds']}s "
+          f"({result['items_per_second']:.0f} items/sec)")
+    if result['items_failed']:
+        print(f"✗ {result['items_failed']:,} items failed; re-drive with "
+              f"./replay-dead-letters.py {' '.join(result['dead_letter_files'])}")
+        sys.exit(1)
+
+
+def get(args):
+    snapshot = Snapshot(Path(args.snapshot))
+    serializer = TypeSerializer()
+    key = {name: serializer.serialize(value) for name, value in json.loads(args.key).items()}
+    missing = [name for name in snapshot.key_names if name not in key]
+    if missing:
+        print(f"✗ Key is missing {', '.join(missing)}")
+        sys.exit(1)
+    item = snapshot.get(key)
+    if item is None:
+        print("✗ Not in snapshot")
+        sys.exit(1)
+    print(json.dumps(item, indent=2, default=str))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compact binary snapshots of DynamoDB tables with parallel restore',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Snapshot the dev banks table
+  ./snapshot-dynamodb-table.py dump --table bebco-borrower-banks-dev --output snapshots/banks --auto-segments
+
+  # Seed a developer environment from it, 8 processes, at most 2000 WCU/s overall
+  ./snapshot-dynamodb-table.py restore --snapshot snapshots/banks --target bebco-borrower-banks-jpl --processes 8 --max-wcu 2000
+
+  # Look up one item through the key index
+  ./snapshot-dynamodb-table.py get --snapshot snapshots/banks --key '{"id": "bank-123"}'
+        """
+    )
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    dump_parser = commands.add_parser('dump', help='Snapshot a table to a local directory')
+    dump_parser.add_argument('--table', required=True, help='Table to snapshot')
+    dump_parser.add_argument('--output', required=True, help='Snapshot directory')
+    dump_parser.add_argument('--region', default='us-east-2', help='Region of the table (default: us-east-2)')
+    dump_parser.add_argument('--segments', type=int, default=1, help='Parallel scan segments (default: 1)')
+    dump_parser.add_argument('--auto-segments', action='store_true', help='Pick the segment count from TableSizeBytes')
+    dump_parser.add_argument('--max-segments', type=int, default=DEFAULT_MAX_SEGMENTS,
+                             help=f'Upper bound on scan segments (default: {DEFAULT_MAX_SEGMENTS})')
+    dump_parser.add_argument('--max-rcu', type=float,
+                             help='Ceiling on read capacity units per second (default: adaptive)')
+    dump_parser.add_argument('--chunk-items', type=int, default=DEFAULT_CHUNK_ITEMS,
+                             help=f'Items per chunk file, the unit of parallel restore (default: {DEFAULT_CHUNK_ITEMS})')
+    dump_parser.add_argument('--block-items', type=int, default=DEFAULT_BLOCK_ITEMS,
+                             help=f'Items per compressed block (default: {DEFAULT_BLOCK_ITEMS})')
+    dump_parser.set_defaults(func=dump)
+
+    restore_parser = commands.add_parser('restore', help=f'Restore a snapshot into a table in {RESTORE_REGION}')
+    restore_parser.add_argument('--snapshot', required=True, help='Snapshot directory')
+    restore_parser.add_argument('--target', required=True, help='Table to write')
+    restore_parser.add_argument('--processes', type=int, default=DEFAULT_RESTORE_PROCESSES,
+                                help=f'Restore worker processes (default: {DEFAULT_RESTORE_PROCESSES})')
+    restore_parser.add_argument('--max-wcu', type=float,
+                                help='Ceiling on write capacity units per second for the whole restore (default: adaptive)')
+    restore_parser.add_argument('--max-attempts', type=int, default=DEFAULT_MAX_ATTEMPTS,
+                                help=f'Write attempts per batch before items are dead-lettered (default: {DEFAULT_MAX_ATTEMPTS})')
+    restore_parser.add_argument('--create-table', action='store_true',
+                                help='Create the target from the snapshot schema if it does not exist')
+    restore_parser.add_argument('--verify', action='store_true', help='Check chunk checksums before restoring')
+    restore_parser.add_argument('--dead-letter-dir', help='Where failed items are written (default: the snapshot directory)')
+    restore_parser.set_defaults(func=restore)
+
+    get_parser = commands.add_parser('get', help='Print one item, found through the key index')
+    get_parser.add_argument('--snapshot', required=True, help='Snapshot directory')
+    get_parser.add_argument('--key', required=True, help='Primary key as JSON, e.g. \'{"id": "abc"}\'')
+    get_parser.set_defaults(func=get)
+
+    args = parser.parse_args()
+    try:
+        args.func(args)
+    except SnapshotError as e:
+        print(f"✗ {e}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,45 @@
 #!/usr/bin/env python3
-"""Start DynamoDB imports for all 19 exported tables"""
+"""Start DynamoDB imports for all 19 exported tables
 
+Imports are submitted largest export first and at most --max-in-flight
+run at once, counting imports already running in the account; the moment
+one finishes, the next table takes its slot. LimitExceededException is
+retried with backoff. The script exits once every table is submitted;
+the last imports keep running in AWS.
+"""
+
+import argparse
 import boto3
 import json
 import os
 import sys
+import time
+
+from botocore.exceptions import ClientError
+
+from dynamodb_import_engine import list_export_files
+from dynamodb_retry import RetryPolicy
 
 # Target region
 TARGET_REGION = 'us-east-2'
 S3_BUCKET = 'bebco-dynamodb-migration-temp-303555290462'
 
+# Concurrent import jobs allowed in flight
+DEFAULT_MAX_IN_FLIGHT = 10
+DEFAULT_POLL_INTERVAL_SECONDS = 30
+
+# Backoff between attempts once the account's import limit is hit
+LIMIT_BACKOFF = RetryPolicy(max_attempts=20, base_delay=5.0, max_delay=300.0)
+
+parser = argparse.ArgumentParser(description='Start DynamoDB imports from S3 into us-east-2, largest export first')
+parser.add_argument('--max-in-flight', type=int, default=DEFAULT_MAX_IN_FLIGHT,
+                    help=f'Imports running at once, including ones already running (default: {DEFAULT_MAX_IN_FLIGHT})')
+parser.add_argument('--poll-interval', type=float, default=DEFAULT_POLL_INTERVAL_SECONDS,
+                    help=f'Seconds between checks for finished imports (default: {DEFAULT_POLL_INTERVAL_SECONDS})')
+args = parser.parse_args()
+
 dynamodb = boto3.client('dynamodb', region_name=TARGET_REGION)
+s3 = boto3.client('s3', region_name=TARGET_REGION)
 
 tables_to_import = [
     "bebco-borrower-staging-accounts",
@@ -34,12 +63,56 @@ tables_to_import = [
     "bebco-borrower-staging-users",
 ]
 
+def running_imports():
+    """ARNs of imports already in progress in the account"""
+    arns = []
+    kwargs = {}
+    while True:
+        response = dynamodb.list_imports(**kwargs)
+        arns.extend(s['ImportArn'] for s in response.get('ImportSummaryList', [])
+                    if s.get('ImportStatus') == 'IN_PROGRESS')
+        if not response.get('NextToken'):
+            return arns
+        kwargs['NextToken'] = response['NextToken']
+
+def still_running(import_arns):
+    """The imports among import_arns that have not finished yet"""
+    running = []
+    for import_arn in import_arns:
+        try:
+            status = dynamodb.describe_import(ImportArn=import_arn)['ImportTableDescription']['ImportStatus']
+        except Exception as e:
+            print(f"  ⚠️  Could not check {import_arn.split('/')[-1]}: {str(e)[:60]}")
+            running.append(import_arn)
+            continue
+        if status == 'IN_PROGRESS':
+            running.append(import_arn)
+    return running
+
+def save_import_arns(import_arns):
+    with open('import-arns.txt', 'w') as f:
+        f.write('\n'.join(import_arns))
+
 print("=" * 70)
 print("DynamoDB Import: S3 → us-east-2")
 print("=" * 70)
 print()
 print(f"Target Region: {TARGET_REGION}")
 print(f"Source S3: s3://{S3_BUCKET}/exports/")
+print(f"In flight: up to {args.max_in_flight} imports")
+print()
+
+# Largest exports start first so they overlap with the many small ones
+print("Sizing exports...")
+export_sizes = {
+    source_table: sum(f.size for f in list_export_files(s3, S3_BUCKET, source_table))
+    for source_table in tables_to_import
+}
+queue = sorted(tables_to_import, key=lambda t: export_sizes[t], reverse=True)
+
+in_flight = running_imports()
+if in_flight:
+    print(f"{len(in_flight)} imports already running in the account count against the limit")
 print()
 print(f"Starting imports for {len(tables_to_import)} tables...")
 print()
@@ -47,24 +120,37 @@ print()
 import_arns = []
 success_count = 0
 failed_count = 0
+limit_attempts = 0
+
+while queue:
+    if len(in_flight) >= args.max_in_flight:
+        time.sleep(args.poll_interval)
+        finished = len(in_flight)
+        in_flight = still_running(in_flight)
+        finished -= len(in_flight)
+        if finished:
+            print(f"  {finished} import(s) finished; {len(in_flight)} still running\n")
+        continue
+
+    source_table = queue[0]
+    i = len(tables_to_import) - len(queue) + 1
 
-for i, source_table in enumerate(tables_to_import, 1):
     # New table name (staging → dev)
     new_table_name = source_table.replace('bebco-borrower-staging-', 'bebco-borrower-') + '-dev'
-    
+
     # S3 prefix for this table's export
     s3_prefix = f"exports/{source_table}"
-    
+
     # Load table configuration
     config_file = f"table-import-configs/{source_table}.json"
-    
+
     try:
         with open(config_file, 'r') as f:
             table_config = json.load(f)
-        
-        print(f"[{i}/{len(tables_to_import)}] Importing {source_table}")
+
+        print(f"[{i}/{len(tables_to_import)}] Importing {source_table} ({export_sizes[source_table] / 1024 / 1024:.1f} MB)")
         print(f"  → Creating as: {new_table_name}")
-        
+
         # Start import
         response = dynamodb.import_table(
             S3BucketSource={
@@ -74,34 +160,49 @@ for i, source_table in enumerate(tables_to_import, 1):
             InputFormat='DYNAMODB_JSON',
             TableCreationParameters=table_config
         )
-        
+
         import_arn = response['ImportTableDescription']['ImportArn']
         import_arns.append(f"{import_arn}|{new_table_name}")
-        
-        print(f"  ✓ Import started")
+        in_flight.append(import_arn)
+        # Saved as we go so check-import-status.py can follow along
+        save_import_arns(import_arns)
+
+        print(f"  ✓ Import started ({len(in_flight)}/{args.max_in_flight} in flight)")
         print(f"  ARN: {import_arn.split('/')[-1]}")
         success_count += 1
-        
-    except dynamodb.exceptions.ResourceInUseException:
-        print(f"  ⚠️  Table {new_table_name} already exists - skipping")
-        success_count += 1
+
+    except ClientError as e:
+        code = e.response.get('Error', {}).get('Code')
+        if code == 'LimitExceededException':
+            # Someone else's imports hold the slots; wait and try the same table again
+            limit_attempts += 1
+            if limit_attempts >= LIMIT_BACKOFF.max_attempts:
+                print(f"  ✗ Import limit still exceeded after {limit_attempts} attempts, giving up")
+                break
+            delay = LIMIT_BACKOFF.delay(limit_attempts)
+            print(f"  ⏳ Account import limit reached; retrying in {delay:.0f}s\n")
+            time.sleep(delay)
+            in_flight = still_running(in_flight)
+            continue
+        if code == 'ResourceInUseException':
+            print(f"  ⚠️  Table {new_table_name} already exists - skipping")
+            success_count += 1
+        else:
+            print(f"  ✗ Failed: {str(e)[:80]}")
+            failed_count += 1
     except FileNotFoundError:
         print(f"  ✗ Config file not found: {config_file}")
         failed_count += 1
     except Exception as e:
-        error_msg = str(e)
-        if 'ResourceInUseException' in error_msg:
-            print(f"  ⚠️  Table already exists or import in progress")
-            success_count += 1
-        else:
-            print(f"  ✗ Failed: {error_msg[:80]}")
-            failed_count += 1
-    
+        print(f"  ✗ Failed: {str(e)[:80]}")
+        failed_count += 1
+
+    limit_attempts = 0
+    queue.pop(0)
     print()
 
 # Save import ARNs
-with open('import-arns.txt', 'w') as f:
-    f.write('\n'.join(import_arns))
+save_import_arns(import_arns)
 
 print("=" * 70)
 print(f"✅ Import submission complete!")
@@ -109,13 +210,14 @@ print("=" * 70)
 print()
 print(f"Success: {success_count}/{len(tables_to_import)}")
 print(f"Failed:  {failed_count}/{len(tables_to_import)}")
+if queue:
+    print(f"Not submitted: {len(queue)} (rerun once the account's imports finish)")
 print()
 print(f"Total imports started: {len(import_arns)}")
 print()
 print("Imports are running in AWS. You can:")
 print("  - Close your laptop")
-print("  - Check status with: python3 check-import-status.py")
+print("  - Check status with: python3 check-import-status.py --watch")
 print()
 print("Import ARNs saved to: import-arns.txt")
 print()
-
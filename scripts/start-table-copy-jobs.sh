@@ -27,6 +27,8 @@ start_copy_job() {
     local LOG_FILE="${LOG_DIR}/${JOB_NAME}.log"
     local PID_FILE="${LOG_DIR}/${JOB_NAME}.pid"
     local STATUS_FILE="${LOG_DIR}/${JOB_NAME}.status.json"
+    local CHECKPOINT_FILE="${LOG_DIR}/${JOB_NAME}.checkpoint.json"
+    local DEAD_LETTER_FILE="${LOG_DIR}/${JOB_NAME}.dead-letter.jsonl"
     
     echo "Starting: ${SOURCE_TABLE} → ${TARGET_TABLE}"
     
@@ -49,6 +51,8 @@ EOF
         --target ${TARGET_TABLE} \
         --region ${REGION} \
         --status-file ${STATUS_FILE} \
+        --checkpoint-file ${CHECKPOINT_FILE} \
+        --dead-letter-file ${DEAD_LETTER_FILE} \
         > ${LOG_FILE} 2>&1 &
     
     local PID=$!
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Query the table count history recorded by get-all-table-counts.py
+
+  growth   items and bytes per day of every table over a window
+  drift    how far each environment's tables are from -dev, and the trend
+  project  count and size of every table some days from now
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+from dynamodb_count_history import DEFAULT_GROWTH_WINDOW_DAYS, DEFAULT_HISTORY_FILE, TableCountHistory
+from dynamodb_job_watch import format_bytes
+
+
+def selected_tables(history, args):
+    tables = history.tables(args.region)
+    if args.env:
+        tables = [t for t in tables if t['env'] in args.env]
+    if args.table:
+        tables = [t for t in tables if t['table'] in args.table or t['base_name'] in args.table]
+    return tables
+
+
+def print_growth(history, args):
+    rows = [g for g in (history.growth_rate(t['table'], args.region, args.window)
+                        for t in selected_tables(history, args)) if g]
+    rows.sort(key=lambda g: g['items_per_day'], reverse=True)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    print(f"{'TABLE':<60}{'ITEMS':>14}{'ITEMS/DAY':>14}{'SIZE':>12}{'SIZE/DAY':>12}{'SAMPLES':>9}")
+    for g in rows:
+        print(f"{g['table']:<60}{g['item_count']:>14,}{g['items_per_day']:>+14,.0f}"
+              f"{format_bytes(g['size_bytes']):>12}{('-' if g['bytes_per_day'] < 0 else '+') + format_bytes(abs(g['bytes_per_day'])):>12}{g['samples']:>9}")
+    if not rows:
+        print("No table has two samples in the window yet; run ./get-all-table-counts.py again later")
+
+
+def print_drift(history, args):
+    rows = history.drift(args.region, args.window)
+    if args.env:
+        rows = [d for d in rows if d['env'] in args.env]
+    if args.table:
+        rows = [d for d in rows if d['base_name'] in args.table]
+    if not args.all:
+        rows = [d for d in rows if d['difference'] or d['difference_per_day']]
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    print(f"{'TABLE':<50}{'ENV':<8}{'COUNT':>14}{'DEV':>14}{'DIFFERENCE':>14}{'PER DAY':>12}")
+    for d in rows:
+        per_day = f"{d['difference_per_day']:+,.0f}" if d['difference_per_day'] is not None else '-'
+        print(f"{d['base_name']:<50}{d['env']:<8}{d['count']:>14,}{d['dev_count']:>14,}"
+              f"{d['difference']:>+14,}{per_day:>12}")
+    if not rows:
+        print("✅ Every environment matches dev")
+
+
+def print_projection(history, args):
+    rows = [p for p in (history.projection(t['table'], args.days, args.region, args.window)
+                        for t in selected_tables(history, args)) if p]
+    rows.sort(key=lambda p: p['projected_bytes'], reverse=True)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    print(f"In {args.days:g} days, at the growth rate of the last {args.window:g} days:")
+    print(f"{'TABLE':<60}{'ITEMS NOW':>14}{'PROJECTED':>14}{'SIZE NOW':>12}{'PROJECTED':>12}")
+    for p in rows:
+        print(f"{p['table']:<60}{p['item_count']:>14,}{p['projected_items']:>14,}"
+              f"{format_bytes(p['size_bytes']):>12}{format_bytes(p['projected_bytes']):>12}")
+    print(f"{'TOTAL':<60}{sum(p['item_count'] for p in rows):>14,}{sum(p['projected_items'] for p in rows):>14,}"
+          f"{format_bytes(sum(p['size_bytes'] for p in rows)):>12}{format_bytes(sum(p['projected_bytes'] for p in rows)):>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Growth, drift and projected size from the table count history')
+    parser.add_argument('query', choices=['growth', 'drift', 'project'])
+    parser.add_argument('--history-file', default=DEFAULT_HISTORY_FILE,
+                        help=f'SQLite file written by get-all-table-counts.py (default: {DEFAULT_HISTORY_FILE})')
+    parser.add_argument('--region', default='us-east-2', help='AWS region (default: us-east-2)')
+    parser.add_argument('--env', action='append', metavar='SUFFIX', help='Only these environment suffixes, repeatable')
+    parser.add_argument('--table', action='append', help='Only this table or base name, repeatable')
+    parser.add_argument('--window', type=float, default=DEFAULT_GROWTH_WINDOW_DAYS,
+                        help=f'Days of samples a growth rate is fitted to (default: {DEFAULT_GROWTH_WINDOW_DAYS})')
+    parser.add_argument('--days', type=float, default=30, help='Days ahead to project (default: 30)')
+    parser.add_argument('--all', action='store_true', help='With drift, also list tables that match dev')
+    parser.add_argument('--json', action='store_true', help='Print JSON instead of a table')
+    args = parser.parse_args()
+
+    if not Path(args.history_file).exists():
+        print(f"No history at {args.history_file}; run ./get-all-table-counts.py first")
+        sys.exit(1)
+
+    history = TableCountHistory(Path(args.history_file))
+    try:
+        {'growth': print_growth, 'drift': print_drift, 'project': print_projection}[args.query](history, args)
+    finally:
+        history.close()
+
+
+if __name__ == '__main__':
+    main()
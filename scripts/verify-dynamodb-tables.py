@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Verify DynamoDB table copies by content checksum
+
+Scans each -dev table and its -jpl/-din copies in parallel, hashes items
+into key-hash buckets of a Merkle tree and compares the trees. Unlike the
+ItemCount figures in get-all-table-counts.py this is exact and catches
+changed items, and it lists the key ranges and items that differ.
+"""
+
+import argparse
+import json
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import boto3
+
+from dynamodb_copy_engine import DEFAULT_MAX_SEGMENTS, resolve_segment_count
+from dynamodb_verify import (
+    DEFAULT_MAX_DIFF_BUCKETS,
+    DEFAULT_MAX_ITEM_DIFFS,
+    DEFAULT_TREE_DEPTH,
+    verify_tables,
+)
+
+
+def list_tables(dynamodb):
+    response = dynamodb.list_tables()
+    all_tables = response['TableNames']
+
+    # Handle pagination
+    while 'LastEvaluatedTableName' in response:
+        response = dynamodb.list_tables(
+            ExclusiveStartTableName=response['LastEvaluatedTableName']
+        )
+        all_tables.extend(response['TableNames'])
+
+    return all_tables
+
+def get_table_pairs(dynamodb, source=None, targets=None):
+    """(source, [targets]) pairs to verify: the given tables, or every -dev table"""
+    if source:
+        return [(source, targets or [f"{source[:-4]}-jpl", f"{source[:-4]}-din"])]
+
+    all_tables = set(list_tables(dynamodb))
+    pairs = []
+    for table in sorted(t for t in all_tables if t.endswith('-dev')):
+        base_name = table[:-4]
+        existing = [t for t in (f"{base_name}-jpl", f"{base_name}-din") if t in all_tables]
+        if existing:
+            pairs.append((table, existing))
+    return pairs
+
+def get_key_names(dynamodb, table_name):
+    response = dynamodb.describe_table(TableName=table_name)
+    return [k['AttributeName'] for k in response['Table']['KeySchema']]
+
+def print_result(result):
+    print(f"  {result['source']}: {result['source_items']:,} items "
+          f"({result['duration_seconds']}s, {result['total_segments']} segments)")
+
+    for target in result['targets'].values():
+        if target['match']:
+            print(f"    ✅ {target['target']}: identical ({target['target_items']:,} items)")
+            continue
+
+        print(f"    ⚠️  {target['target']}: {target['target_items']:,} items, "
+              f"{target['differing_buckets']} differing buckets")
+        for key_range in target['differing_ranges'][:10]:
+            print(f"       key-hash range {key_range}")
+        if len(target['differing_ranges']) > 10:
+            print(f"       ... and {len(target['differing_ranges']) - 10} more ranges")
+
+        items = target.get('items')
+        if items:
+            print(f"       missing: {items['missing_count']}, extra: {items['extra_count']}, "
+                  f"changed: {items['changed_count']}")
+            for kind in ('missing', 'extra', 'changed'):
+                for key in items[kind][:5]:
+                    print(f"         {kind}: {json.dumps(key)}")
+        else:
+            print(f"       too many differing buckets to list items; re-run with a higher --max-diff-buckets")
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Verify -jpl/-din table copies against -dev with Merkle-tree checksums',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Verify every -dev table against its -jpl and -din copies
+  ./verify-dynamodb-tables.py --auto-segments
+
+  # Verify one table against one target, reading at most 200 RCU/s per table
+  ./verify-dynamodb-tables.py --source bebco-borrower-banks-dev --target bebco-borrower-banks-jpl --max-rcu 200
+
+  # Finer buckets for large tables (2^16 leaves)
+  ./verify-dynamodb-tables.py --depth 16 --segments 16
+        """
+    )
+    parser.add_argument('--region', default='us-east-2', help='AWS region (default: us-east-2)')
+    parser.add_argument('--source', help='Source table (default: every -dev table)')
+    parser.add_argument('--target', action='append', help='Target table, repeatable (default: <base>-jpl and <base>-din)')
+    parser.add_argument('--segments', type=int, default=1, help='Parallel scan segments per table (default: 1)')
+    parser.add_argument('--auto-segments', action='store_true', help='Pick the segment count from TableSizeBytes')
+    parser.add_argument('--max-segments', type=int, default=DEFAULT_MAX_SEGMENTS,
+                        help=f'Upper bound on scan segments per table (default: {DEFAULT_MAX_SEGMENTS})')
+    parser.add_argument('--max-rcu', type=float,
+                        help='Ceiling on read capacity units per second per table (default: adaptive, no ceiling)')
+    parser.add_argument('--depth', type=int, default=DEFAULT_TREE_DEPTH,
+                        help=f'Merkle tree depth; 2^depth buckets (default: {DEFAULT_TREE_DEPTH})')
+    parser.add_argument('--max-diff-buckets', type=int, default=DEFAULT_MAX_DIFF_BUCKETS,
+                        help=f'List items only when at most this many buckets differ; listing rescans the source and '
+                             f'the differing tables in full (default: {DEFAULT_MAX_DIFF_BUCKETS}, 0 never rescans)')
+    parser.add_argument('--max-item-diffs', type=int, default=DEFAULT_MAX_ITEM_DIFFS,
+                        help=f'Keys listed per kind and target in the report (default: {DEFAULT_MAX_ITEM_DIFFS})')
+    parser.add_argument('--output', help='JSON report file (default: verify-report-<timestamp>.json)')
+    args = parser.parse_args()
+
+    if args.target and not args.source:
+        parser.error('--target requires --source')
+    if not 1 <= args.depth <= 24:
+        parser.error('--depth must be between 1 and 24')
+
+    dynamodb = boto3.client('dynamodb', region_name=args.region)
+    pairs = get_table_pairs(dynamodb, args.source, args.target)
+
+    print(f"Verifying {len(pairs)} source tables")
+    print(f"Region: {args.region}")
+    print("")
+
+    results = []
+    for source, targets in pairs:
+        try:
+            segments = resolve_segment_count(dynamodb, source, args.segments,
+                                             args.auto_segments, args.max_segments)
+            result = verify_tables(
+                args.region, source, targets, get_key_names(dynamodb, source),
+                total_segments=segments,
+                depth=args.depth,
+                max_read_units=args.max_rcu,
+                max_diff_buckets=args.max_diff_buckets,
+                max_item_diffs=args.max_item_diffs
+            )
+        except Exception as e:
+            print(f"  ✗ {source}: {e}")
+            results.append({'source': source, 'error': str(e), 'targets': {}})
+            continue
+        print_result(result)
+        results.append(result)
+
+    mismatched = [
+        f"{r['source']} → {t['target']}"
+        for r in results for t in r['targets'].values() if not t['match']
+    ]
+    errors = [r['source'] for r in results if r.get('error')]
+
+    print("")
+    if mismatched:
+        print(f"⚠️  Copies that differ from their source: {len(mismatched)}")
+        for pair in mismatched:
+            print(f"  - {pair}")
+    if errors:
+        print(f"✗ Tables that could not be verified: {len(errors)}")
+    if not mismatched and not errors:
+        print("✅ All copies match their source!")
+
+    output = Path(args.output or f"verify-report-{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(output, 'w') as f:
+        json.dump({
+            'timestamp': datetime.now().isoformat(),
+            'region': args.region,
+            'mismatched': mismatched,
+            'errors': errors,
+            'results': results
+        }, f, indent=2)
+    print(f"\nDetailed JSON report saved to: {output}")
+
+    sys.exit(1 if mismatched or errors else 0)
+
+if __name__ == '__main__':
+    main()